@@ -3,16 +3,25 @@ import matplotlib.pyplot as plt
 import streamlit as st
 import pandas as pd
 import diatribe.audio_tools as audio_tools
+import diatribe.audio_ui as audio_ui
 import diatribe.saved_dialogues as saved_dialogues
 from dotenv import load_dotenv
 from streamlit_extras.stylable_container import stylable_container
-from diatribe.dialogues import Character, Dialogue, export_dialogue, get_lines
-from diatribe.sidebar import create_sidebar
+from diatribe.dialogues import Character, Dialogue, export_dialogue, get_lines, with_row_ids, row_id
+from diatribe.sidebar import SidebarData, create_sidebar
 from diatribe.saved_dialogues import create_saved_dialogues
 from diatribe.generate import create_dialogue_generation, create_continue_dialogue
-from diatribe.utils import log
+from diatribe.utils import log, remove_state
+from diatribe import session_files
+from diatribe.jobs import JOB_POLL_SECONDS, PRIORITY_REDO, get_job_queue, load_job, latest_job, active_job
+from diatribe.engine import DiatribeEngine, RenderContext
+from diatribe.worker_pool import get_worker_pool
+from diatribe.preview_server import preview_url
+from diatribe.session_store import get_session_store
+from diatribe.speculation import SPECULATE_AFTER_SECONDS, get_speculator
 from diatribe.audio_edit import create_edit_dialogue_line, create_edit_diatribe
 from diatribe.audio_providers.dialogue_provider import DialogueProvider
+from diatribe.workspace import session_path
 
 load_dotenv()
 plt.style.use('dark_background')
@@ -26,14 +35,113 @@ button_style = """
 
 def show_final_audio() -> bool:
   return "final_audio" in st.session_state and st.session_state.final_audio
+
+
+def restore_session_id() -> str:
+  """Reuse the session from the URL so a browser refresh keeps its audio and jobs."""
+  session_id = st.query_params.get("session")
+  try:
+    return str(uuid.UUID(session_id))
+  except (TypeError, ValueError):
+    return str(uuid.uuid4())
+
+
+def session_engine(sidebar: SidebarData) -> tuple[DiatribeEngine, RenderContext]:
+  """Return the engine of the selected provider and a render context for this session."""
+  engine = DiatribeEngine(sidebar.audio_provider, get_worker_pool(sidebar.audio_provider))
+  context = RenderContext.for_session(st.session_state.session_id, sidebar.audio_provider_options, preview=True)
+  return engine, context
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_generation_job(job_id: str) -> None:
+  """Poll the generation job and show lines as they finish."""
+  job = load_job(session_path(), job_id)
+  if job is None:
+    remove_state("generation_job")
+    return
+  
+  finished = job.finished_lines()
+  st.progress(job.progress(), text=f"Generating audio... ({len(finished)}/{len(job.lines)} lines)")
+  if job.active and st.button("Cancel", key=f"cancel_{job.id}"):
+    # the lines generated so far are kept and the job can be resumed
+    get_job_queue().cancel(job.id)
+  if job.join_lines and os.path.exists(session_path("preview/part00000.mp3")):
+    # the dialogue so far, which keeps growing while it plays
+    url = preview_url(st.session_state.session_id, job.id)
+    if url is not None:
+      st.audio(url, format="audio/mpeg")
+  for line in finished[-3:]:
+    st.markdown(f"`{line.line}.` **:green[{line.speaker}]**: \"{line.text}\"")
+    st.audio(line.audio_file)
+    
+  if not job.active:
+    remove_state("generation_job")
+    generated_audio = audio_tools.get_generated_audio()
+    if generated_audio:
+      # keep the lines that did finish, the rest can be retried
+      st.session_state["audio_files"] = generated_audio
+    if job.dialogue:
+      # the dialogue was joined while the lines were generated
+      st.session_state["final_audio"] = True
+      remove_state("background_added")
+    st.rerun()
+
+
+@st.fragment(run_every=SPECULATE_AFTER_SECONDS / 2)
+def show_speculation() -> None:
+  """Pre-generate the dialogue lines that stopped changing, also while nothing reruns the page."""
+  speculator = get_speculator()
+  speculator.speculate()
+  if speculator.generated:
+    spent = f", {speculator.spent_chars:,}/{speculator.budget_chars:,} characters" if speculator.budgeted else ""
+    st.caption(f"{speculator.generated} lines pre-generated{spent}")
+
+
+def show_resumable_job(sidebar: SidebarData) -> None:
+  """Offer to resume a job that failed part way or was interrupted by a restart."""
+  job = latest_job(session_path())
+  if job is None or not job.resumable:
+    return
+  
+  remaining = job.remaining_lines()
+  if job.status == "interrupted":
+    st.warning(f"Audio generation was interrupted with {len(remaining)} of {len(job.lines)} lines left.")
+    label = "Resume Generation"
+  elif job.status == "cancelled":
+    st.info(f"Audio generation was cancelled with {len(remaining)} of {len(job.lines)} lines left.")
+    label = "Resume Generation"
+  else:
+    failed = "\n".join(
+      f"- line {line.line}, {line.speaker} with the voice_id {line.voice_id}: {line.error}"
+      for line in job.failed_lines()
+    )
+    st.error(f"""An error occured while generating the audio of {len(remaining)} lines. Please check your API key.
+    
+{failed}
+    """)
+    label = "Retry Failed Lines"
+  
+  same_provider = sidebar.audio_provider.name == job.provider
+  resume_btn = st.button(
+    label,
+    disabled=not same_provider,
+    help=None if same_provider else f"Select the `{job.provider}` engine to continue this generation."
+  )
+  if resume_btn:
+    get_job_queue().resume(*session_engine(sidebar), job.id)
+    st.session_state["generation_job"] = job.id
+    st.rerun()
     
 
 if __name__ == "__main__":
   st.set_page_config(layout="wide", page_title="Diatribe", page_icon="🎧")
   
   if "session_id" not in st.session_state:
-    st.session_state["session_id"] = str(uuid.uuid4())  
+    st.session_state["session_id"] = restore_session_id()
     log("session id: " + st.session_state.session_id)
+  st.query_params["session"] = st.session_state.session_id
+  get_session_store().touch(st.session_state.session_id)
   
   st.title("🎧 Diatribe Dialogue")
   
@@ -134,13 +242,14 @@ if __name__ == "__main__":
         
     if generated_dialogue is not None: 
       st.session_state["generated_dialogue"] = generated_dialogue
-      dialogue_df = generated_dialogue
-    elif "generated_dialogue" in st.session_state:
-      dialogue_df = st.session_state["generated_dialogue"]
+    
+    # the hidden row ids are stored with the table so they stay the same between reruns
+    if "generated_dialogue" in st.session_state:
+      dialogue_df = st.session_state["generated_dialogue"] = with_row_ids(st.session_state["generated_dialogue"])
     elif "imported_dialogue" in st.session_state:
-      dialogue_df = st.session_state["imported_dialogue"]
+      dialogue_df = st.session_state["imported_dialogue"] = with_row_ids(st.session_state["imported_dialogue"])
     else:
-      dialogue_df = pd.DataFrame([], columns=["Speaker", "Text", "Description"])
+      dialogue_df = pd.DataFrame([], columns=["ID", "Speaker", "Text", "Description"])
     
     dialogue_table = st.data_editor(
       dialogue_df,
@@ -149,6 +258,7 @@ if __name__ == "__main__":
       hide_index=True,
       key="dialogue_table",
       column_config={
+        "ID": None,
         "Speaker": st.column_config.SelectboxColumn(
           "Speaker",
           options=character_names,
@@ -171,11 +281,12 @@ if __name__ == "__main__":
     # extract Dialogues from the dialogue table
     if not dialogue_table.empty:
       dialogue: list[Dialogue] = []
+      row_ids = set()
       for i, row in dialogue_table.iterrows():
         try:
           character_index = character_names.index(row["Speaker"])
           character = characters[character_index]
-          dialogue.append(Dialogue(character, i+1, row["Text"], row["Description"]))
+          dialogue.append(Dialogue(character, i+1, row["Text"], row["Description"], row_id=row_id(row, row_ids)))
         except:
           print(f"Error: {row['Speaker']} is not a valid character.")
           pass        
@@ -211,67 +322,71 @@ if __name__ == "__main__":
         key="generate_dialogue_button_with_existing",
         css_styles=button_style
       ):
-        generate_btn = st.button("Generate Audio Dialogue", width='stretch', type="primary") 
+        # the running job owns the audio folder until it is done
+        job_running = active_job(session_path()) is not None
+        generate_btn = st.button(
+          "Generate Audio Dialogue", 
+          width='stretch', 
+          type="primary",
+          disabled=job_running,
+          help="Wait for the audio being generated, or cancel it, to generate again." if job_running else None
+        ) 
 
-      if generate_btn:
-        st.session_state["final_audio"] = False
-        audio_tools.clear_audio_files()
-        audio_files: list[str] = []
-        progress_text = "Generating audio..."
-        if "audio_process_error" in st.session_state:
-          del st.session_state["audio_process_error"]
+      if sidebar.enable_speculation and not isinstance(sidebar.audio_provider, DialogueProvider) and "generation_job" not in st.session_state:
+        get_speculator().observe(*session_engine(sidebar), dialogue)
+        show_speculation()
 
+      if generate_btn and active_job(session_path()) is not None:
+        # clicked before the page knew a job had started
+        st.toast("The audio is still being generated, wait for it or cancel it first.", icon="👎")
+      elif generate_btn:
+        get_speculator().cancel()
+        st.session_state["final_audio"] = False
+        remove_state("audio_files")
 
         whole_dialogue = isinstance(sidebar.audio_provider, DialogueProvider)
         if whole_dialogue:
+          audio_tools.clear_audio_files()
           st.session_state["whole_dialogue"] = True
           with st.spinner("Generating dialogue..."):
             provider: DialogueProvider = sidebar.audio_provider
-            provider.generate_dialogue(dialogue, sidebar.audio_provider_options)
+            dialogue_audio = provider.generate_dialogue(dialogue, sidebar.audio_provider_options)
+            audio_tools.session_versions().commit(dialogue_audio)
           st.session_state["final_audio"] = True
         else:
           if "whole_dialogue" in st.session_state:
             del st.session_state["whole_dialogue"]
-          generate_audio_bar = st.progress(0, text=progress_text)
-          for i, line in enumerate(dialogue):
-            if line.character.voice_id is None:
-              st.toast(f"Error: voice ID not found for `{line.character.voice}`.", icon="👎")
-              break
-            try:
-              audio_file = sidebar.audio_provider.generate_and_save(
-                line.text, 
-                line.character.voice_id, 
-                line.line, 
-                sidebar.audio_provider_options,
-                guidance=line.get_guidance()
-              )
-
-              audio_files.append(audio_file)
-            except Exception as e:
-              print(e)
-              st.session_state["audio_process_error"] = f"{line.character.name} with the voice {line.character.voice} (voice_id: {line.character.voice_id})"
-              break
-            generate_audio_bar.progress(round((i+1) / len(dialogue), 2), text=progress_text)          
-          generate_audio_bar.empty()
-        
-        if "audio_process_error" in st.session_state:
-          st.error(f"""An error occured while generating the audio. Please check your API key.
-          Error occurred while processing: {st.session_state.audio_process_error}
-          """)
-          if "audio_files" in st.session_state:
-            del st.session_state["audio_files"]
-        elif not whole_dialogue:
-          st.session_state["audio_files"] = audio_files
-        else:
-          if "audio_files" in st.session_state:
-            del st.session_state["audio_files"]          
+          missing_voice = next((line for line in dialogue if line.character.voice_id is None), None)
+          if missing_voice:
+            st.toast(f"Error: voice ID not found for `{missing_voice.character.voice}`.", icon="👎")
+          else:
+            # only the lines that changed since they were generated go to the engine
+            engine, context = session_engine(sidebar)
+            changed = engine.changed_lines(context, dialogue)
+            if changed:
+              job = get_job_queue().submit(engine, context, changed, join_lines=get_lines(dialogue))
+              st.session_state["generation_job"] = job.id
+            else:
+              st.session_state["audio_files"] = audio_tools.get_generated_audio()
+              st.toast("No lines changed since the audio was generated.", icon="👍")
+      
+      if "generation_job" not in st.session_state and "audio_files" not in st.session_state and not show_final_audio():
+        # pick the job back up after a browser refresh
+        running_job = latest_job(session_path())
+        if running_job and running_job.active:
+          st.session_state["generation_job"] = running_job.id
+      
+      if "generation_job" in st.session_state:
+        show_generation_job(st.session_state.generation_job)
+      elif not isinstance(sidebar.audio_provider, DialogueProvider):
+        show_resumable_job(sidebar)
       
       if saves.prepare_project:
         export_dialogue(character_table, dialogue_table, sidebar.audio_provider)
         export_path = audio_tools.export_audio(get_lines(dialogue))
-        project_path = f"./session/{st.session_state.session_id}/project"
+        project_path = session_path("project")
         os.makedirs(project_path, exist_ok=True)
-        shutil.make_archive(f"{project_path}/project", "zip", export_path)
+        session_files.track(shutil.make_archive(f"{project_path}/project", "zip", export_path))
         st.rerun()
       
       if "audio_files" in st.session_state:   
@@ -279,15 +394,16 @@ if __name__ == "__main__":
         st.header("Audio Dialogue")
         if sidebar.enable_instructions:
           st.markdown("The dialogue text has now been coverted into audio. You can listen to the audio by clicking the play button. If you want to regenerate the audio, you can click the `Generate Audio Dialogue` button above. If you are happy with the audio, you can join the audio files together by clicking the `Join Dialogue` button below. You can also click the `Redo` button to regenerate the audio for a specific line.")
-          with st.expander("**WARNING**: deleting dialogue lines requires audio regeneration"):
-            st.info("If you delete dialogue lines, you will have to regenerate the audio by clicking the `Generate Audio Dialogue` button above. Adding or modifying dialogue lines will not require regeneration of all lines, but you will likely need to click the `Redo` button for the affected lines.")                 
+          with st.expander("**NOTE**: only changed dialogue lines are regenerated"):
+            st.info("After adding, deleting, or modifying dialogue lines, click the `Generate Audio Dialogue` button above. Only the lines whose speaker, voice, text, or description changed are generated again, the audio of the other lines is kept.")                 
         
+        versions = audio_tools.session_versions()
         for i, line in enumerate(dialogue):
           st.markdown(f"`{i + 1}.` **:green[{line.character.name}]**: \"{line.text}\"")
           
-          col1, col2 = st.columns([9, 1])
+          col1, col2, col3, col4 = st.columns([7, 1, 1, 1])
           with col1:     
-            audio_file = f"./session/{st.session_state.session_id}/audio/line{line.line}.wav"
+            audio_file = session_path(f"audio/line{line.line}.wav")
             if os.path.exists(audio_file):     
               with open(audio_file, "rb") as audio:  
                 st.audio(audio)
@@ -297,17 +413,28 @@ if __name__ == "__main__":
               st.markdown("Audio file not found. Please click the `Redo` button.")  
               audio_file_found = False
           with col2:
+            previous_btn = st.button("◀", key=f"previous_{line.line}", help="Restore the previous version of this line.", disabled=not versions.can_undo(audio_file))
+          with col3:
+            next_btn = st.button("▶", key=f"next_{line.line}", help="Restore the next version of this line.", disabled=not versions.can_redo(audio_file))
+          with col4:
             redo_key = f"redo_{line.line}"
             redo_btn = st.button("Redo", key=redo_key)
+          if previous_btn or next_btn:
+            if previous_btn:
+              versions.undo(audio_file)
+            else:
+              versions.redo(audio_file)
+            st.rerun()
           if redo_btn:
             with st.spinner("Generating audio..."):
-              sidebar.audio_provider.generate_and_save(
-                line.text, 
-                line.character.voice_id, 
-                line.line, 
-                sidebar.audio_provider_options,
-                line.get_guidance()
-              )
+              versions.commit(audio_file)
+              engine, context = session_engine(sidebar)
+              # goes ahead of any dialogue being generated, between two of its lines
+              get_job_queue().call(
+                lambda: engine.synthesize_line(context, line, reuse=False),
+                context.workspace,
+                PRIORITY_REDO
+              ).result()
             st.rerun()
             
           # dialogue audio editing
@@ -324,7 +451,7 @@ if __name__ == "__main__":
           join_dialogue = st.button("Join Dialogue", width='stretch', type="primary")
         line_indices = [d.line for d in dialogue]
         if join_dialogue:          
-          audio_tools.join_audio(
+          audio_ui.join_audio(
             line_indices
           )
           st.session_state["final_audio"] = True
@@ -338,9 +465,25 @@ if __name__ == "__main__":
         if sidebar.enable_audio_editing:
           create_edit_diatribe(sidebar, characters, dialogue)
         
-        dialogue_path = f"./session/{st.session_state.session_id}/final/audio/dialogue.mp3"
+        dialogue_path = session_path("final/audio/dialogue.mp3")
+        versions = audio_tools.session_versions()
+        current_version, total_versions = versions.position(dialogue_path)
+        if total_versions > 1:
+          col1, col2, col3 = st.columns([8, 1, 1])
+          with col1:
+            st.caption(f"Version {current_version} of {total_versions}")
+          with col2:
+            previous_dialogue_btn = st.button("◀", key="previous_dialogue", help="Restore the previous version of the dialogue.", disabled=not versions.can_undo(dialogue_path))
+          with col3:
+            next_dialogue_btn = st.button("▶", key="next_dialogue", help="Restore the next version of the dialogue.", disabled=not versions.can_redo(dialogue_path))
+          if previous_dialogue_btn or next_dialogue_btn:
+            if previous_dialogue_btn:
+              versions.undo(dialogue_path)
+            else:
+              versions.redo(dialogue_path)
+            st.rerun()
         st.audio(dialogue_path)
-        _, fig = audio_tools.generate_waveform_from_file(dialogue_path)       
+        _, fig = audio_ui.generate_waveform_from_file(dialogue_path)       
         st.pyplot(fig)
           
         with open(dialogue_path, "rb") as mp3_audio:
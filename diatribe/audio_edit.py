@@ -1,8 +1,11 @@
 import streamlit as st
 import diatribe.audio_tools as audio_tools
+import diatribe.audio_ui as audio_ui
 from diatribe.dialogues import Dialogue, Character
 from diatribe.sidebar import SidebarData
 from diatribe.utils import log
+from diatribe.session_files import break_link
+from diatribe.cancellation import run_cancellable
 from diatribe.edits import *
 
 def create_compressor(key: str) -> CompressorEdit:
@@ -489,12 +492,12 @@ def create_edit_dialogue_line(line: Dialogue, audio_file: str) -> None:
                         with org_audio_waveform:
                             st.markdown("<p style='font-size:14px'>Original</p>", unsafe_allow_html=True)
                             st.audio(audio_file)
-                            y_max, plot = audio_tools.generate_waveform_from_file(audio_file)
+                            y_max, plot = audio_ui.generate_waveform_from_file(audio_file)
                             st.pyplot(plot)                  
                         with new_audio_waveform:
                             st.markdown("<p style='font-size:14px'>Updated</p>", unsafe_allow_html=True)
                             st.audio(preview_audio)
-                            _, plot = audio_tools.generate_waveform_from_bytes(preview_audio, y_max)
+                            _, plot = audio_ui.generate_waveform_from_bytes(preview_audio, y_max)
                             st.pyplot(plot) 
                     else:
                         st.toast("There are no audio edits selected.", icon="ℹ️")
@@ -505,11 +508,14 @@ def create_edit_dialogue_line(line: Dialogue, audio_file: str) -> None:
                     width='stretch'
                 )
                 if apply_edits:
+                    versions = audio_tools.session_versions()
+                    versions.commit(audio_file)
                     new_line_audio = audio_tools.edit_audio(
                         audio_file,
                         soundboard                
                     )
-                    new_line_audio.export(audio_file, format="mp3")
+                    new_line_audio.export(break_link(audio_file), format="mp3")
+                    versions.commit(audio_file)
                     log(f"saving audio {audio_file}")
                     st.rerun()
 
@@ -633,12 +639,15 @@ def create_edit_diatribe(sidebar: SidebarData, characters: list[Character], dial
             preview_background_bnt = st.button("Preview", width='stretch')
             if preview_background_bnt:
                 with st.spinner("Mastering audio..."):
-                    original_audio, updated_audio = audio_tools.preview_mastered_audio(
-                        lines_affected, 
-                        line_indices, 
-                        soundboard, 
-                        join_gap,
-                        whole=whole_dialogue
+                    original_audio, updated_audio = run_cancellable(
+                        lambda: audio_tools.preview_mastered_audio(
+                            lines_affected, 
+                            line_indices, 
+                            soundboard, 
+                            join_gap,
+                            whole=whole_dialogue
+                        ),
+                        "Mastering audio"
                     )
                 adjustments = soundboard.adjustments()
                 if len(adjustments) > 0:
@@ -647,23 +656,26 @@ def create_edit_diatribe(sidebar: SidebarData, characters: list[Character], dial
                 with org_audio_waveform:
                     st.markdown("<p style='font-size:14px'>Original</p>", unsafe_allow_html=True)
                     st.audio(original_audio)
-                    y_max, plot = audio_tools.generate_waveform_from_file(original_audio)
+                    y_max, plot = audio_ui.generate_waveform_from_file(original_audio)
                     st.pyplot(plot)                  
                 with new_audio_waveform:
                     st.markdown("<p style='font-size:14px'>Updated</p>", unsafe_allow_html=True)
                     st.audio(updated_audio)
-                    _, plot = audio_tools.generate_waveform_from_file(updated_audio, y_max)
+                    _, plot = audio_ui.generate_waveform_from_file(updated_audio, y_max)
                     st.pyplot(plot)              
                     
             add_background_btn = st.button("Apply", width='stretch')
             if add_background_btn:
                 with st.spinner("Mastering audio..."):
-                    audio_tools.apply_mastered_audio(
-                        lines_affected, 
-                        line_indices, 
-                        soundboard, 
-                        join_gap,
-                        whole=whole_dialogue
+                    run_cancellable(
+                        lambda: audio_tools.apply_mastered_audio(
+                            lines_affected, 
+                            line_indices, 
+                            soundboard, 
+                            join_gap,
+                            whole=whole_dialogue
+                        ),
+                        "Mastering audio"
                     )
                     st.toast("Mastering has been applied.", icon="👍")
                         
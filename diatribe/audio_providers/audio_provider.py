@@ -1,8 +1,12 @@
-import torch, os, streamlit as st
+import torch, os, functools
+from pathlib import Path
 from abc import ABC, abstractmethod
 from typing import List, Dict
 from diatribe.data import AIVoice
+from diatribe.session_files import break_link
 from enum import Enum
+from diatribe.workspace import session_path
+from diatribe.lazy_streamlit import st
 
 class Location(Enum):
     LOCAL = "local"
@@ -30,6 +34,20 @@ class LocalProvider:
         return cls._DEVICE
 
 
+@functools.cache
+def load_voice_tensors(path: str, device: torch.device) -> Dict[str, torch.Tensor]:
+    """Load voice latents memory mapped, preferring a converted .safetensors file next to the .pt."""
+    safetensors_path = Path(path).with_suffix(".safetensors")
+    if safetensors_path.exists():
+        from safetensors.torch import load_file
+        return load_file(str(safetensors_path), device=str(device))
+    try:
+        return torch.load(path, map_location=device, weights_only=True, mmap=True)
+    except RuntimeError:
+        # files saved with the legacy serialization can not be memory mapped
+        return torch.load(path, map_location=device, weights_only=True)
+
+
 class AudioProvider(ABC):
     @property
     @abstractmethod
@@ -70,6 +88,24 @@ class AudioProvider(ABC):
     def define_creds(self) -> None:
         pass
 
+    @property
+    def parallel_safe(self) -> bool:
+        """Whether the provider is CPU bound and can run one model per worker process."""
+        return False
+
+    @property
+    def chunk_chars(self) -> int | None:
+        """Longer lines are synthesized in sentence chunks of at most this many characters."""
+        return None
+
+    def load_model(self) -> None:
+        """Load the model ahead of the first line so it stays resident in a worker."""
+        pass
+
+    def default_options(self) -> Dict:
+        """The options used when no Streamlit controls define them, e.g. when rendering headless."""
+        return {}
+
     @abstractmethod
     def define_options(self) -> Dict:
         pass
@@ -78,6 +114,11 @@ class AudioProvider(ABC):
     def define_voice_explorer(self) -> Dict:
         pass
 
+    @property
+    def api_key_env(self) -> str | None:
+        """The environment variable holding the API key of a hosted provider."""
+        return None
+
     @property
     def has_usage(self) -> bool:
         return False
@@ -97,13 +138,13 @@ class AudioProvider(ABC):
     ) -> str:
         pass                
 
-    def _output_file(self, line: int, options: Dict, session_id) -> str:
+    def _output_file(self, line: int, options: Dict) -> str:
         if "test" in options:
-            audio_file = f"./session/{st.session_state.session_id}/temp/test.wav"
+            audio_file = session_path("temp/test.wav")
         else:
-            audio_file = f"./session/{st.session_state.session_id}/audio/line{line}.wav"        
+            audio_file = session_path(f"audio/line{line}.wav")        
         os.makedirs(os.path.dirname(audio_file), exist_ok=True)
-        return audio_file
+        return break_link(audio_file)
 
     def _get_voice_by_name(self, name: str) -> AIVoice | None:
         for voice in self.voices:
@@ -1,11 +1,14 @@
-import streamlit as st, torchaudio as ta
+import functools, torchaudio as ta
 from typing import List, Dict
 from diatribe.audio_providers.audio_provider import AudioProvider, LocalProvider, Location
 from diatribe.data import AIVoice, Gender
 from pathlib import Path
 from chatterbox.tts_turbo import ChatterboxTurboTTS
+from diatribe.text_chunks import CHUNK_CHARS
+from diatribe.model_manifest import model_path
+from diatribe.lazy_streamlit import st, cache_data
 
-@st.cache_data
+@cache_data
 def get_chatterbox_voices():
     return [
         AIVoice("Alloy", "alloy", path=Path("samples/openai/alloy.wav"), gender=Gender.FEMALE),
@@ -24,6 +27,15 @@ def get_chatterbox_voices():
         AIVoice("Talia", "talia", path=Path("samples/parler/talia.wav"), gender=Gender.FEMALE)   
     ]
 
+@functools.cache
+def load_chatterbox(device: str) -> ChatterboxTurboTTS:
+    """Load the Chatterbox model once per process, from the manifest folder when there is one."""
+    path = model_path("chatterbox")
+    if path is not None:
+        return ChatterboxTurboTTS.from_local(path, device)
+    return ChatterboxTurboTTS.from_pretrained(device=device)
+
+
 class ChatterboxProvider(AudioProvider):
     def __init__(self):
         # self.device = LocalProvider.device()
@@ -46,7 +58,14 @@ class ChatterboxProvider(AudioProvider):
     @property
     def location(self) -> Location:
         return Location.LOCAL
+
+    @property
+    def chunk_chars(self) -> int | None:
+        return CHUNK_CHARS
     
+    def load_model(self) -> None:
+        load_chatterbox(self.device)
+
     def get_voice_names(self) -> List[str]:
         return self.voice_names
     
@@ -56,8 +75,14 @@ class ChatterboxProvider(AudioProvider):
     def define_creds(self) -> None:
         pass
 
+    def default_options(self) -> Dict:
+        return {
+            "temperature": 0.8
+        }
+
     def define_options(self) -> Dict:
-        temperature = st.slider("Temperature", 0.05, 1.0, 0.8, 0.05, help="Controls the randomness of the model's predictions. Lower values make the output more deterministic and focused, while higher values increase creativity but may reduce stability and coherence.")
+        defaults = self.default_options()
+        temperature = st.slider("Temperature", 0.05, 1.0, defaults["temperature"], 0.05, help="Controls the randomness of the model's predictions. Lower values make the output more deterministic and focused, while higher values increase creativity but may reduce stability and coherence.")
 
         return {
             "temperature": temperature
@@ -77,9 +102,9 @@ class ChatterboxProvider(AudioProvider):
         options: Dict,
         guidance: str | None = None
     ) -> str:
-        output_file = self._output_file(line, options, st.session_state.session_id) 
+        output_file = self._output_file(line, options) 
         voice = self._get_voice_by_id(voice_id)
-        model = ChatterboxTurboTTS.from_pretrained(device=self.device)
+        model = load_chatterbox(self.device)
 
         model.prepare_conditionals(
             wav_fpath=voice.path,
@@ -1,4 +1,4 @@
-import elevenlabs as el, streamlit as st, re, os, traceback, datetime
+import elevenlabs as el, re, traceback, datetime
 from elevenlabs.client import ElevenLabs
 from typing import List, Dict
 from diatribe.audio_providers.audio_provider import AudioProvider, Location
@@ -6,8 +6,10 @@ from diatribe.utils import get_env_key
 from elevenlabs import VoiceSettings
 from elevenlabs.types import Voice, Model
 from diatribe.data import AIVoice, Gender
+from diatribe.cancellation import check_cancelled
+from diatribe.lazy_streamlit import st, cache_data
 
-@st.cache_data
+@cache_data
 def get_voices(api_key) -> List[AIVoice]:
   voices: list[Voice] = ElevenLabs(api_key=api_key).voices.get_all().voices  
   genders = {m.value for m in Gender}
@@ -38,7 +40,7 @@ def get_voices(api_key) -> List[AIVoice]:
   ]
   return ai_voices
 
-@st.cache_data
+@cache_data
 def get_models(api_key) -> List[Model]:
   models = ElevenLabs(api_key=api_key).models.list()
   return models   
@@ -66,9 +68,13 @@ def generate(
   except:
     traceback.print_exc()
     raise Exception("Failed to generate ElevenLabs audio.")
-  return b''.join(audio)    
+  chunks = []
+  for chunk in audio:
+    check_cancelled()
+    chunks.append(chunk)
+  return b''.join(chunks)
     
-@st.cache_data(ttl=900)
+@cache_data(ttl=900)
 def get_usage_percent(api_key) -> dict:
   """Get the character usage percent from the Eleven Labs API."""
   user_info = ElevenLabs(api_key=api_key).user.get()
@@ -105,6 +111,10 @@ class ElevenLabsProvider(AudioProvider):
     def location(self) -> Location:
         return Location.HOSTED
 
+    @property
+    def api_key_env(self) -> str | None:
+        return "ELEVENLABS_API_KEY"
+
     def get_voice_names(self) -> List[str]:
         if self.voice_names:
             return self.voice_names
@@ -122,12 +132,22 @@ class ElevenLabsProvider(AudioProvider):
         st.session_state["el_key_value"] = el_key    
       self.api_key = get_env_key("ELEVENLABS_API_KEY", "el_key_value")  
 
+    def default_options(self) -> Dict:
+        return {
+          "output_format": "mp3_44100_128",
+          "model_id": "eleven_turbo_v2_5",
+          "stability": 0.35,
+          "similarity_boost": 0.80,
+          "style": 0.0
+        }
+
     def define_options(self) -> Dict:
+        defaults = self.default_options()
         models = get_models(self.api_key)
         model_ids = [m.model_id for m in models]
         model_names = [m.name for m in models]
         try:
-          turbo_model_index = model_names.index("Eleven Turbo v2.5")
+          turbo_model_index = model_ids.index(defaults["model_id"])
         except:
           turbo_model_index = 0
         model_name = st.selectbox("Speech Model", model_names, index=turbo_model_index)
@@ -150,21 +170,21 @@ class ElevenLabsProvider(AudioProvider):
           "Stability", 
           0.0, 
           1.0, 
-          value=0.35, 
+          value=defaults["stability"], 
           help="Increasing stability will make the voice more consistent between re-generations, but it can also make it sounds a bit monotone. On longer text fragments we recommend lowering this value."
         )
         simarlity_boost = st.slider(
           "Clarity + Simalarity Enhancement",
           0.0,
           1.0,
-          value=0.80,
+          value=defaults["similarity_boost"],
           help="High enhancement boosts overall voice clarity and target speaker similarity. Very high values can cause artifacts, so adjusting this setting to find the optimal value is encouraged."
         )
         style = st.slider(
           "Style Exaggeration",
           0.0,
           1.0,
-          value=0.0,
+          value=defaults["style"],
           help="High values are recommended if the style of the speech should be exaggerated compared to the uploaded audio. Higher values can lead to more instability in the generated speech. Setting this to 0.0 will greatly increase generation speed and is the default setting."
         )         
         
@@ -196,11 +216,7 @@ class ElevenLabsProvider(AudioProvider):
     ) -> str:
       """Generate audio from a dialogue and save it to a file."""
       audio = generate(text, voice_id, options, self.api_key)
-      if "test" in options:
-          audio_file = f"./session/{st.session_state.session_id}/temp/test.wav" 
-      else:
-        audio_file = f"./session/{st.session_state.session_id}/audio/line{line}.wav"
-      os.makedirs(os.path.dirname(audio_file), exist_ok=True)
+      audio_file = self._output_file(line, options)
       with open(audio_file, "wb") as f:
         f.write(audio)  
       return audio_file
\ No newline at end of file
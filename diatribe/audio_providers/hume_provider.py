@@ -1,5 +1,4 @@
 import os, base64, json
-import streamlit as st
 from hume import HumeClient
 from hume.core.api_error import ApiError
 from hume.tts import PostedUtterance, PostedUtteranceVoiceWithName, ReturnGeneration
@@ -8,8 +7,9 @@ from typing import List, Dict
 from diatribe.audio_providers.audio_provider import AudioProvider, Location
 from diatribe.utils import get_env_key
 from diatribe.data import AIVoice, Gender, Source
+from diatribe.lazy_streamlit import st, cache_data
 
-@st.cache_data
+@cache_data
 def get_voices() -> List[AIVoice]:
     try:
         client = HumeClient(api_key=os.getenv("HUME_API_KEY"))
@@ -94,6 +94,10 @@ class HumeProvider(AudioProvider):
     def location(self) -> Location:
         return Location.HOSTED
 
+    @property
+    def api_key_env(self) -> str | None:
+        return "HUME_API_KEY"
+
     def get_voice_id(self, name: str) -> str:
         return super().get_voice_id(name)
     
@@ -108,6 +112,11 @@ class HumeProvider(AudioProvider):
         if hume_key:
           st.session_state["hume_key_value"] = hume_key 
 
+    def default_options(self) -> Dict:
+        return {
+            "version": "1"
+        }
+
     def define_options(self) -> Dict:
         model_name = st.selectbox("Speech Model", ["Octave 1", "Octave 2"], index=0)
         if model_name == "Octave 1":
@@ -144,12 +153,7 @@ class HumeProvider(AudioProvider):
         )        
         audio_data = base64.b64decode(speech.audio)
 
-        if "test" in options:
-            audio_file = f"./session/{st.session_state.session_id}/temp/test.wav"
-        else:
-            audio_file = f"./session/{st.session_state.session_id}/audio/line{line}.wav"
-
-        os.makedirs(os.path.dirname(audio_file), exist_ok=True)
+        audio_file = self._output_file(line, options)
         with open(audio_file, "wb") as f:
             f.write(audio_data)  
         return audio_file    
\ No newline at end of file
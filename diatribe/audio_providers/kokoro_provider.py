@@ -1,9 +1,12 @@
-import soundfile as sf, streamlit as st
-from diatribe.audio_providers.audio_provider import AudioProvider, Location
+import soundfile as sf, numpy as np
+from diatribe.audio_providers.audio_provider import AudioProvider, LocalProvider, Location
 from typing import List, Dict
 from kokoro import KPipeline
 from huggingface_hub import HfApi
 from diatribe.data import AIVoice, Gender
+from diatribe.cancellation import check_cancelled
+from diatribe.model_manifest import voice_ids
+from diatribe.lazy_streamlit import st, cache_data
 
 pipeline = KPipeline(lang_code="a")
 
@@ -31,12 +34,14 @@ def get_accent(voice_id: str):
         return ""                            
 
 
-@st.cache_data
+@cache_data
 def get_kokoro_voices() -> List[AIVoice]:
-    api = HfApi()
-    files = api.list_repo_files(repo_id="hexgrad/Kokoro-82M", repo_type="model")
-    voice_files = [f for f in files if f.startswith('voices/') and f.endswith('.pt')]
-    voice_names = [f.split('/')[-1].replace('.pt', '') for f in voice_files]
+    voice_names = voice_ids("kokoro")
+    if voice_names is None:
+        api = HfApi()
+        files = api.list_repo_files(repo_id="hexgrad/Kokoro-82M", repo_type="model")
+        voice_files = [f for f in files if f.startswith('voices/') and f.endswith('.pt')]
+        voice_names = [f.split('/')[-1].replace('.pt', '') for f in voice_files]
     voices = [
         AIVoice(
             name.split("_")[-1].capitalize(), 
@@ -69,6 +74,11 @@ class KokoroProvider(AudioProvider):
     def location(self) -> Location:
         return Location.LOCAL
 
+    @property
+    def parallel_safe(self) -> bool:
+        # one model per process only pays off on the CPU
+        return LocalProvider.device().type == "cpu"
+
     def get_voice_names(self) -> List[str]:
         return self.voice_names
     
@@ -78,8 +88,14 @@ class KokoroProvider(AudioProvider):
     def define_creds(self) -> None:
         pass
 
+    def default_options(self) -> Dict:
+        return {
+            "speed": 1.0
+        }
+
     def define_options(self) -> Dict:
-        voice_speed = st.slider("Voice Speed", 0.5, 2.0, 1.0, 0.1)
+        defaults = self.default_options()
+        voice_speed = st.slider("Voice Speed", 0.5, 2.0, defaults["speed"], 0.1)
 
         return {
             "speed": voice_speed
@@ -97,9 +113,16 @@ class KokoroProvider(AudioProvider):
             voice=voice_id,
             speed=speed,
             split_pattern=r'\n+'
-        )                   
+        )
+        # the pipeline yields a segment per paragraph, together they are the line
+        segments = []
         for _, (_, _, audio) in enumerate(generator):
-            sf.write(output_path, audio, 24000)        
+            check_cancelled()
+            segments.append(audio)
+        if not segments:
+            # e.g. a line of only punctuation, which leaves nothing to speak
+            raise Exception(f"Kokoro produced no audio for: {text}")
+        sf.write(output_path, np.concatenate(segments), 24000)
 
     def generate_and_save(
         self,
@@ -109,7 +132,7 @@ class KokoroProvider(AudioProvider):
         options: Dict,
         guidance: str | None = None
     ) -> str:
-        audio_file = self._output_file(line, options, st.session_state.session_id)
+        audio_file = self._output_file(line, options)
         speed = options["speed"] if "speed" in options else 1.0
         self.generate(text, voice_id, audio_file, speed)
         return audio_file
\ No newline at end of file
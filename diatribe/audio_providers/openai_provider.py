@@ -1,4 +1,4 @@
-import os, streamlit as st
+import os
 from diatribe.audio_providers.audio_provider import AudioProvider, Location
 from diatribe.data import AIVoice, Gender
 from typing import List, Dict
@@ -6,6 +6,8 @@ from enum import Enum
 from openai import OpenAI
 from dataclasses import dataclass
 from diatribe.utils import get_env_key
+from diatribe.cancellation import check_cancelled
+from diatribe.lazy_streamlit import st
 
 all_models = ["tts-1", "tts-1-hd", "gpt-4o-mini-tts"]
 latest_models = ["gpt-4o-mini-tts"]
@@ -49,6 +51,10 @@ class OpenAIProvider(AudioProvider):
     def location(self) -> Location:
         return Location.HOSTED
 
+    @property
+    def api_key_env(self) -> str | None:
+        return "OPENAI_API_KEY"
+
     def get_voice_names(self) -> List[str]:
         return self.voice_names
     
@@ -61,12 +67,19 @@ class OpenAIProvider(AudioProvider):
         if openai_key:
           st.session_state["openai_key_value"] = openai_key
     
+    def default_options(self) -> Dict:
+        return {
+            "model_id": "gpt-4o-mini-tts",
+            "speed": 1.0
+        }
+
     def define_options(self) -> Dict:
+        defaults = self.default_options()
         models = all_models
-        model_seleced = st.selectbox("Speech Model", models, index=2)
+        model_seleced = st.selectbox("Speech Model", models, index=models.index(defaults["model_id"]))
         self.model = model_seleced
 
-        voice_speed = st.slider("Voice Speed", 0.25, 4.0, 1.0, 0.25)
+        voice_speed = st.slider("Voice Speed", 0.25, 4.0, defaults["speed"], 0.25)
 
         return {
             "model_id": model_seleced,
@@ -82,15 +95,18 @@ class OpenAIProvider(AudioProvider):
     
     def generate(self, text, voice_id, instructions, api_key, model_id, speed, output_path):
         client = OpenAI(api_key=api_key)
-        response = client.audio.speech.create(
+        # streamed so a cancelled line closes the connection instead of waiting for the whole file
+        with client.audio.speech.with_streaming_response.create(
             model=model_id,
             voice=voice_id,
             input=text,
             response_format="wav",
             speed=speed,
             instructions=instructions
-        )
-        response.write_to_file(output_path)        
+        ) as response, open(output_path, "wb") as f:
+            for chunk in response.iter_bytes():
+                check_cancelled()
+                f.write(chunk)
 
     def generate_and_save(
         self,
@@ -104,12 +120,7 @@ class OpenAIProvider(AudioProvider):
         model_id = options["model_id"]
         speed = options["speed"]
         print(guidance)
-        if "test" in options:
-            audio_file = f"./session/{st.session_state.session_id}/temp/test.wav"
-        else:
-            audio_file = f"./session/{st.session_state.session_id}/audio/line{line}.wav"
-
-        os.makedirs(os.path.dirname(audio_file), exist_ok=True)
+        audio_file = self._output_file(line, options)
         self.generate(text, voice_id, guidance, api_key, model_id, speed, audio_file)
         return audio_file
     
\ No newline at end of file
@@ -1,14 +1,18 @@
-import streamlit as st, torch, numpy as np, soundfile as sf
+import functools, torch, numpy as np, soundfile as sf
 from typing import Dict, List
 from pathlib import Path
 from diatribe.data import AIVoice, Gender
-from diatribe.audio_providers.audio_provider import AudioProvider, LocalProvider, Location
+from diatribe.audio_providers.audio_provider import AudioProvider, LocalProvider, Location, load_voice_tensors
 from parler_tts import ParlerTTSForConditionalGeneration
-from transformers import AutoTokenizer
+from transformers import AutoTokenizer, StoppingCriteria, StoppingCriteriaList
 from pydub import AudioSegment
 from pydub.silence import detect_leading_silence
+from diatribe.text_chunks import CHUNK_CHARS, chunk_text
+from diatribe.model_manifest import model_path
+from diatribe.cancellation import check_cancelled, is_cancelled
+from diatribe.lazy_streamlit import st, cache_data
 
-@st.cache_data
+@cache_data
 def parler_voices() -> list[AIVoice]:
     return [
         AIVoice("Elisabeth", "elisabeth", path=Path("models/parler/elisabeth.pt"), gender=Gender.FEMALE),
@@ -17,6 +21,17 @@ def parler_voices() -> list[AIVoice]:
         AIVoice("Thomas", "thomas", path=Path("models/parler/thomas.pt"), gender=Gender.MALE),
     ]
 
+@functools.cache
+def load_parler(device: torch.device) -> tuple[ParlerTTSForConditionalGeneration, AutoTokenizer]:
+    """Load the Parler model once per process, its safetensors weights are memory mapped."""
+    model_id = model_path("parler") or "parler-tts/parler-tts-mini-expresso"
+    model = ParlerTTSForConditionalGeneration.from_pretrained(model_id).to(device)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return model, tokenizer
+
+
 def calculate_max_tokens(text: str) -> int:
     chars_per_second = 5
     estimated_seconds = len(text) / chars_per_second
@@ -51,6 +66,12 @@ def trim_trailing_silence(input: Path, output: Path, silence_thresh=-50.0, chunk
     trimmed.export(output, format="wav")
 
 
+class CancelledCriteria(StoppingCriteria):
+    """Stops decoding between steps once the line has been cancelled."""
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), is_cancelled(), dtype=torch.bool, device=input_ids.device)
+
+
 class ParlerProvider(AudioProvider):
     def __init__(self) -> None:
         self.device = LocalProvider.device()
@@ -73,6 +94,9 @@ class ParlerProvider(AudioProvider):
     def location(self) -> Location:
         return Location.LOCAL
 
+    def load_model(self) -> None:
+        load_parler(self.device)
+
     def get_voice_names(self) -> List[str]:
         return self.voice_names
     
@@ -82,9 +106,16 @@ class ParlerProvider(AudioProvider):
     def define_creds(self) -> None:
         pass
 
+    def default_options(self) -> Dict:
+        return {
+            "temp": 0.7,
+            "repetition_penalty": 1.2
+        }
+
     def define_options(self) -> Dict:
-        temp = st.slider("Temperature", 0.1, 1.0, 0.7, 0.1)
-        repetition_penalty = st.slider("Repetition Penalty", 0.1, 2.0, 1.2, 0.1)
+        defaults = self.default_options()
+        temp = st.slider("Temperature", 0.1, 1.0, defaults["temp"], 0.1)
+        repetition_penalty = st.slider("Repetition Penalty", 0.1, 2.0, defaults["repetition_penalty"], 0.1)
 
         return {
             "temp": temp,
@@ -105,43 +136,50 @@ class ParlerProvider(AudioProvider):
             options: Dict, 
             guidance: str | None = None
     ) -> str:
-        output_file = self._output_file(line, options, st.session_state.session_id)
-        model_id = "parler-tts/parler-tts-mini-expresso"
+        output_file = self._output_file(line, options)
         device = self.device
         voice = self._get_voice_by_id(voice_id)
-        model = ParlerTTSForConditionalGeneration.from_pretrained(model_id).to(device)
-        tokenizer = AutoTokenizer.from_pretrained(model_id)
-        if tokenizer.pad_token is None:
-            tokenizer.pad_token = tokenizer.eos_token
+        model, tokenizer = load_parler(device)
 
-        voice_dict = torch.load(voice.path, map_location=device)
+        voice_dict = load_voice_tensors(str(voice.path), device)
         description_ids = voice_dict["input_ids"]
         description_attention_mask = voice_dict["attention_mask"]
 
-        sentences = [text]
-        waveforms = []
-        for sentence in sentences:
-            prompt_input_ids = tokenizer(sentence, return_tensors="pt").input_ids.to(device) 
-            max_tokens = calculate_max_tokens(sentence)
-            set_seed(42)     
-            with torch.inference_mode():
-                generation = model.generate(
-                    input_ids=description_ids,
-                    attention_mask=description_attention_mask,
-                    prompt_input_ids=prompt_input_ids,
-                    pad_token_id=tokenizer.pad_token_id,
-                    eos_token_id=tokenizer.eos_token_id,
-                    do_sample=True,       
-                    temperature=options["temp"],      
-                    max_new_tokens=max_tokens,  
-                    repetition_penalty=options["repetition_penalty"], 
-                )
-            waveforms.append(generation.squeeze().cpu().numpy())
+        # long lines are split in sentence chunks here rather than by the caller, so
+        # the chunks are generated as one batch instead of one after another
+        sentences = chunk_text(text, CHUNK_CHARS)
+        prompt = tokenizer(sentences, return_tensors="pt", padding=True).to(device)
+        max_tokens = max(calculate_max_tokens(sentence) for sentence in sentences)
+        set_seed(42)
+        with torch.inference_mode():
+            generation = model.generate(
+                input_ids=description_ids.repeat(len(sentences), 1),
+                attention_mask=description_attention_mask.repeat(len(sentences), 1),
+                prompt_input_ids=prompt.input_ids,
+                prompt_attention_mask=prompt.attention_mask,
+                pad_token_id=tokenizer.pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+                do_sample=True,
+                temperature=options["temp"],
+                max_new_tokens=max_tokens,
+                repetition_penalty=options["repetition_penalty"],
+                stopping_criteria=StoppingCriteriaList([CancelledCriteria()]),
+                return_dict_in_generate=True,
+            )
+        check_cancelled()
+        waveforms = [
+            generation.sequences[i, :generation.audios_length[i]].cpu().numpy()
+            for i in range(len(sentences))
+        ]
 
         waveform = np.concatenate(waveforms)
         sample_rate = model.config.sampling_rate 
-        temp_path = Path(f"./session/{st.session_state.session_id}/temp/parler.wav")
+        # next to the output, whose folder exists in every workspace, including scratch ones
+        temp_path = Path(f"{output_file}.untrimmed.wav")
         sf.write(temp_path, waveform, sample_rate)
-        trim_trailing_silence(temp_path, Path(output_file), silence_thresh=-25.0)
+        try:
+            trim_trailing_silence(temp_path, Path(output_file), silence_thresh=-25.0)
+        finally:
+            temp_path.unlink(missing_ok=True)
 
         return output_file
@@ -1,12 +1,13 @@
-import streamlit as st, wave
+import os, functools, wave, onnxruntime
 from diatribe.audio_providers.audio_provider import AudioProvider, Location
 from piper.voice import PiperVoice
 from piper.config import SynthesisConfig
 from diatribe.data import AIVoice
 from pathlib import Path
 from typing import Dict
+from diatribe.lazy_streamlit import st, cache_data
 
-@st.cache_data
+@cache_data
 def get_piper_voices() -> list[AIVoice]:
     model_dir = Path("models/piper/en")
     model_paths = list(model_dir.rglob("*.onnx"))
@@ -27,6 +28,23 @@ def get_piper_voices() -> list[AIVoice]:
     return voices
 
 
+@functools.cache
+def load_piper_voice(model_path: str) -> PiperVoice:
+    """Load a voice once per process, limiting the ONNX threads when a worker sets them."""
+    voice = PiperVoice.load(model_path)
+    threads = int(os.getenv("DIATRIBE_ONNX_THREADS", "0"))
+    if threads > 0:
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        session_options.inter_op_num_threads = 1
+        voice.session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=session_options,
+            providers=["CPUExecutionProvider"]
+        )
+    return voice
+
+
 class PiperProvider(AudioProvider):
     def __init__(self):
         self.piper_voices = get_piper_voices()
@@ -48,6 +66,10 @@ class PiperProvider(AudioProvider):
     def location(self) -> Location:
         return Location.LOCAL
 
+    @property
+    def parallel_safe(self) -> bool:
+        return True
+
     def get_voice_names(self) -> list[str]:
         return self.voice_names
     
@@ -57,11 +79,20 @@ class PiperProvider(AudioProvider):
     def define_creds(self) -> None:
         pass
 
+    def default_options(self) -> Dict:
+        return {
+            "length_scale": 1.2,
+            "noise_scale": 0.8,
+            "noise_w_scale": 0.2,
+            "volume": 1.0
+        }
+
     def define_options(self) -> Dict:
-        length_scale = st.slider("Length Scale", 0.5, 1.5, 1.2, 0.1, help="Controls the speed of the speech, with lower values being faster and higher being slower")
-        noise_scale = st.slider("Noise Scale", 0.1, 2.0, 0.8, 0.1, help="Controls the expressiveness of the speech, with higher values being more expressive/breathy")
-        noise_w_scale = st.slider("Noise Width Scale", 0.0, 0.5, 0.2, 0.05, help="Controls the timing variation of the speech, with higher values varying the timing more")
-        volume = st.slider("Volume", 0.5, 2.0, 1.0, 0.1, help="Controls the volume of the speech")
+        defaults = self.default_options()
+        length_scale = st.slider("Length Scale", 0.5, 1.5, defaults["length_scale"], 0.1, help="Controls the speed of the speech, with lower values being faster and higher being slower")
+        noise_scale = st.slider("Noise Scale", 0.1, 2.0, defaults["noise_scale"], 0.1, help="Controls the expressiveness of the speech, with higher values being more expressive/breathy")
+        noise_w_scale = st.slider("Noise Width Scale", 0.0, 0.5, defaults["noise_w_scale"], 0.05, help="Controls the timing variation of the speech, with higher values varying the timing more")
+        volume = st.slider("Volume", 0.5, 2.0, defaults["volume"], 0.1, help="Controls the volume of the speech")
 
         return {
             "length_scale": length_scale,
@@ -84,9 +115,9 @@ class PiperProvider(AudioProvider):
         options: Dict,
         guidance: str | None = None
     ) -> str:
-        output_file = self._output_file(line, options, st.session_state.session_id)           
+        output_file = self._output_file(line, options)           
         model_path = self._get_voice_by_id(voice_id).path
-        voice = PiperVoice.load(model_path)
+        voice = load_piper_voice(str(model_path))
 
         config = SynthesisConfig(
             length_scale=options["length_scale"],
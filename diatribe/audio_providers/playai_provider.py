@@ -1,4 +1,4 @@
-import os, requests, streamlit as st
+import os, requests
 from diatribe.audio_providers.audio_provider import AudioProvider
 from diatribe.audio_providers.dialogue_provider import DialogueProvider
 from typing import List, Dict
@@ -8,6 +8,9 @@ from pathlib import Path
 from dataclasses import dataclass
 from diatribe.utils import get_env_key
 from diatribe.data import AIVoice, Gender
+from diatribe.session_files import break_link
+from diatribe.workspace import session_path
+from diatribe.lazy_streamlit import st
 
 class PlayAIVoice(Enum):
     ANGELO = AIVoice("Angelo", "s3://voice-cloning-zero-shot/baf1ef41-36b6-428c-9bdf-50ba54682bd8/original/manifest.json", Gender.MALE)
@@ -92,12 +95,12 @@ class PlayAIProvider(AudioProvider, DialogueProvider):
             "language": "english"    
         }         
 
-        output_path = f"./session/{st.session_state.session_id}/final/audio/dialogue.mp3"
+        output_path = session_path("final/audio/dialogue.mp3")
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
         response = requests.post("https://api.play.ai/api/v1/tts/stream", headers=headers, json=data)
         if response.ok:
-            with open(output_path, "wb") as f:
+            with open(break_link(output_path), "wb") as f:
                 f.write(response.content)
             return output_path
         else:
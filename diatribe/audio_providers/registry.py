@@ -0,0 +1,64 @@
+import importlib
+from diatribe.utils import log
+from diatribe.audio_providers.audio_provider import AudioProvider
+from diatribe.model_manifest import enable_offline
+
+enable_offline()
+
+# name, module and class of every line by line provider, in the order they are offered,
+# imported on demand so an engine whose packages are missing does not break the others
+PROVIDERS = [
+  ("Kokoro", "diatribe.audio_providers.kokoro_provider", "KokoroProvider"),
+  ("XTTS", "diatribe.audio_providers.xtts_provider", "XttsProvider"),
+  ("Piper", "diatribe.audio_providers.piper_provider", "PiperProvider"),
+  ("Parler", "diatribe.audio_providers.parler_provider", "ParlerProvider"),
+  ("Open AI", "diatribe.audio_providers.openai_provider", "OpenAIProvider"),
+  ("ElevenLabs", "diatribe.audio_providers.el_provider", "ElevenLabsProvider"),
+  ("Hume AI", "diatribe.audio_providers.hume_provider", "HumeProvider"),
+  ("Chatterbox", "diatribe.audio_providers.chatterbox_provider", "ChatterboxProvider"),
+]
+
+
+def _key(name: str) -> str:
+  return name.replace(" ", "").lower()
+
+
+def load_audio_provider(name: str, remote: bool = True) -> AudioProvider | None:
+  """Create the named provider, as a proxy when it is served by a model server."""
+  entry = next((p for p in PROVIDERS if _key(p[0]) == _key(name)), None)
+  if entry is None:
+    return None
+  provider_name, module_name, class_name = entry
+  if remote:
+    from multiprocessing import AuthenticationError
+    from diatribe.model_server import model_server_address, describe
+    try:
+      address = model_server_address(provider_name)
+    except ValueError as e:
+      log(f"{provider_name} model server is not used: {e}")
+      return None
+    if address is not None:
+      from diatribe.audio_providers.remote_provider import RemoteProvider
+      try:
+        # the proxy answers from the server's description, which fails while the server is down
+        describe(address)
+      except (OSError, EOFError, RuntimeError, AuthenticationError) as e:
+        log(f"{provider_name} model server at {address} is not available: {e}")
+        return None
+      return RemoteProvider(provider_name, address)
+  try:
+    return getattr(importlib.import_module(module_name), class_name)()
+  except ImportError as e:
+    log(f"{provider_name} is not available: {e}")
+    return None
+
+
+def get_audio_providers() -> list[AudioProvider]:
+  """Return the line by line audio providers that can be used in this environment."""
+  providers = [load_audio_provider(name) for name, _, _ in PROVIDERS]
+  return [provider for provider in providers if provider is not None]
+
+
+def find_audio_provider(name: str) -> AudioProvider | None:
+  """Return the provider with the given name, ignoring case and spaces."""
+  return load_audio_provider(name)
@@ -0,0 +1,84 @@
+from diatribe.audio_providers.audio_provider import AudioProvider, Location
+from diatribe.data import AIVoice
+from diatribe import model_server
+from typing import Dict
+from diatribe.lazy_streamlit import st
+
+
+class RemoteProvider(AudioProvider):
+    """A local provider running in a model server, e.g. from a virtualenv with conflicting packages."""
+    def __init__(self, name: str, address: str | tuple[str, int]):
+        self._name = name
+        self.address = address
+
+    @property
+    def _info(self) -> Dict:
+        return model_server.describe(self.address)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def description(self) -> str:
+        return f"{self._info['description']} It is served from {self.address}."
+
+    @property
+    def supports_instructions(self) -> bool:
+        return self._info["supports_instructions"]
+
+    @property
+    def voices(self) -> list[AIVoice]:
+        return self._info["voices"]
+
+    @property
+    def location(self) -> Location:
+        return Location.LOCAL
+
+    @property
+    def chunk_chars(self) -> int | None:
+        return self._info.get("chunk_chars")
+
+    def get_voice_names(self) -> list[str]:
+        return sorted([v.name for v in self.voices])
+
+    def get_voice_id(self, name: str) -> str:
+        return super().get_voice_id(name)
+
+    def define_creds(self) -> None:
+        pass
+
+    def default_options(self) -> Dict:
+        return dict(self._info["default_options"])
+
+    def define_options(self) -> Dict:
+        options = {}
+        for key, value in self.default_options().items():
+            label = key.replace("_", " ").title()
+            if isinstance(value, bool):
+                options[key] = st.checkbox(label, value=value)
+            elif isinstance(value, (int, float)):
+                options[key] = st.number_input(label, value=value)
+            else:
+                options[key] = st.text_input(label, value=value)
+        return options
+
+    def define_usage(self) -> None:
+        pass
+
+    def define_voice_explorer(self) -> Dict:
+        return self._show_voices(["gender", "accent"], sample_path=self._name.lower())
+
+    def generate_and_save(
+        self,
+        text: str,
+        voice_id: str,
+        line: int,
+        options: Dict,
+        guidance: str | None = None
+    ) -> str:
+        output_file = self._output_file(line, options)
+        audio = model_server.synthesize(self.address, text, voice_id, line, options, guidance)
+        with open(output_file, "wb") as f:
+            f.write(audio)
+        return output_file
@@ -1,11 +1,15 @@
-import streamlit as st, torch, soundfile as sf
+import os, pickle, functools, torch, soundfile as sf
 from typing import List, Dict
-from diatribe.audio_providers.audio_provider import AudioProvider, LocalProvider, Location
+from diatribe.audio_providers.audio_provider import AudioProvider, LocalProvider, Location, load_voice_tensors
 from diatribe.data import AIVoice, Gender
-from TTS.api import TTS
+from TTS.tts.configs.xtts_config import XttsConfig
 from TTS.tts.models.xtts import Xtts
+from TTS.utils.manage import ModelManager
+from diatribe.text_chunks import CHUNK_CHARS
+from diatribe.model_manifest import model_path, XTTS_MODEL
+from diatribe.lazy_streamlit import st, cache_data
 
-@st.cache_data
+@cache_data
 def get_xtts_voices():
     return [
         AIVoice("Alloy", "alloy", gender=Gender.FEMALE),
@@ -23,6 +27,36 @@ def get_xtts_voices():
         AIVoice("Cedar", "cedar", gender=Gender.MALE)        
     ]
 
+class MappedXtts(Xtts):
+    """XTTS whose checkpoint is memory mapped rather than read into memory before it is loaded."""
+    def get_compatible_checkpoint_state_dict(self, model_path: str) -> dict:
+        try:
+            checkpoint = torch.load(model_path, map_location="cpu", weights_only=True, mmap=True)["model"]
+        except (RuntimeError, pickle.UnpicklingError):
+            # a checkpoint in the legacy format or with more than weights in it
+            return super().get_compatible_checkpoint_state_dict(model_path)
+        # the same clean up as Xtts does, for checkpoints saved by the trainer
+        for key in list(checkpoint.keys()):
+            tensor = checkpoint.pop(key)
+            key = key.removeprefix("xtts.")
+            if key.split(".")[0] not in ("torch_mel_spectrogram_style_encoder", "torch_mel_spectrogram_dvae", "dvae"):
+                checkpoint[key] = tensor
+        return checkpoint
+
+
+@functools.cache
+def load_xtts(device: torch.device) -> Xtts:
+    """Load the XTTS model once per process, from the manifest folder when there is one."""
+    path = model_path("xtts")
+    if path is None:
+        path = str(ModelManager().download_model(XTTS_MODEL)[0])
+    config = XttsConfig()
+    config.load_json(os.path.join(path, "config.json"))
+    model = MappedXtts.init_from_config(config)
+    model.load_checkpoint(config, checkpoint_dir=path, eval=True)
+    return model.to(device)
+
+
 class XttsProvider(AudioProvider):
     def __init__(self):
         self.device = LocalProvider.device()
@@ -45,6 +79,18 @@ class XttsProvider(AudioProvider):
     def location(self) -> Location:
         return Location.LOCAL
 
+    @property
+    def chunk_chars(self) -> int | None:
+        return CHUNK_CHARS
+
+    @property
+    def parallel_safe(self) -> bool:
+        # one model per process only pays off on the CPU
+        return self.device.type == "cpu"
+
+    def load_model(self) -> None:
+        load_xtts(self.device)
+
     def get_voice_names(self) -> List[str]:
         return self.voice_names
     
@@ -54,13 +100,24 @@ class XttsProvider(AudioProvider):
     def define_creds(self) -> None:
         pass
 
+    def default_options(self) -> Dict:
+        return {
+            "temperature": 0.65,
+            "length_penalty": 1.0,
+            "repetition_penalty": 9.0,
+            "top_k": 30,
+            "top_p": 0.8,
+            "speed": 1.0
+        }
+
     def define_options(self) -> Dict:
-        temperature = st.slider("Temperature", 0.05, 1.0, 0.65, 0.05, help="Controls the randomness of the model's predictions. Lower values make the output more deterministic and focused, while higher values increase creativity but may reduce stability and coherence.")
-        length_penalty = st.slider("Length Penalty", 0.05, 1.5, 1.0, 0.05, help="Applies an exponential penalty to the length of generated sequences in the autoregressive decoder. Higher values encourage shorter, more concise outputs (terse speech), while lower values allow for longer generations.")
-        repetition_penalty = st.slider("Repetition Penalty", 2.0, 12.0, 9.0, 0.5, help="Penalizes the model for repeating tokens or phrases during decoding, helping to avoid issues like long silences, filler sounds, or looping content.")
-        top_k = st.slider("Top-K Sampling", 20, 100, 30, 1, help="Limits sampling to the top K most likely tokens at each step. Lower values make outputs more predictable, while higher values allow more diversity.")
-        top_p = st.slider("Top-P (Nucleus)", 0.7, 0.9, 0.8, 0.1, help="Lower values focus on more probable outputs (less diverse), while values closer to 1.0 increase variety.")
-        voice_speed = st.slider("Voice Speed", 0.5, 2.0, 1.0, 0.1)
+        defaults = self.default_options()
+        temperature = st.slider("Temperature", 0.05, 1.0, defaults["temperature"], 0.05, help="Controls the randomness of the model's predictions. Lower values make the output more deterministic and focused, while higher values increase creativity but may reduce stability and coherence.")
+        length_penalty = st.slider("Length Penalty", 0.05, 1.5, defaults["length_penalty"], 0.05, help="Applies an exponential penalty to the length of generated sequences in the autoregressive decoder. Higher values encourage shorter, more concise outputs (terse speech), while lower values allow for longer generations.")
+        repetition_penalty = st.slider("Repetition Penalty", 2.0, 12.0, defaults["repetition_penalty"], 0.5, help="Penalizes the model for repeating tokens or phrases during decoding, helping to avoid issues like long silences, filler sounds, or looping content.")
+        top_k = st.slider("Top-K Sampling", 20, 100, defaults["top_k"], 1, help="Limits sampling to the top K most likely tokens at each step. Lower values make outputs more predictable, while higher values allow more diversity.")
+        top_p = st.slider("Top-P (Nucleus)", 0.7, 0.9, defaults["top_p"], 0.1, help="Lower values focus on more probable outputs (less diverse), while values closer to 1.0 increase variety.")
+        voice_speed = st.slider("Voice Speed", 0.5, 2.0, defaults["speed"], 0.1)
 
         return {
             "temperature": temperature,
@@ -85,15 +142,14 @@ class XttsProvider(AudioProvider):
         options: Dict,
         guidance: str | None = None
     ) -> str:
-        output_file = self._output_file(line, options, st.session_state.session_id)   
+        output_file = self._output_file(line, options)   
 
-        tts = TTS(model_name="tts_models/multilingual/multi-dataset/xtts_v2").to(self.device)
+        model = load_xtts(self.device)
         voice_model = f"./models/xtts/{voice_id}.pt"
-        voice = torch.load(voice_model, map_location=self.device, weights_only=True)
+        voice = load_voice_tensors(voice_model, self.device)
         voice_latent = voice["gpt_cond_latent"]
         voice_embedding = voice["speaker_embedding"]   
 
-        model: Xtts = tts.synthesizer.tts_model
         wav = model.inference(
             text=text,
             language="en",
@@ -106,6 +162,6 @@ class XttsProvider(AudioProvider):
             top_p=options["top_p"],
             speed=options["speed"]
         )["wav"]             
-        sf.write(output_file, wav, samplerate=tts.synthesizer.output_sample_rate)
+        sf.write(output_file, wav, samplerate=model.config.audio.output_sample_rate)
         
         return output_file
\ No newline at end of file
@@ -1,14 +1,25 @@
-import os, glob, shutil, io
-import streamlit as st
+import os, glob, shutil, io, json, hashlib, uuid, queue, threading, functools
 import numpy as np
-import matplotlib.pyplot as plt
 from pydub import AudioSegment as seg
 from pedalboard import Pedalboard, Plugin
 from pedalboard.io import AudioFile
 from math import ceil
+from collections import OrderedDict
 from diatribe.utils import log
 from diatribe.edits import *
-from typing import Tuple
+from diatribe.session_files import link_file, link_tree, break_link, track
+from diatribe.audio_versions import AudioVersions
+from diatribe.blob_store import get_blob_store
+from diatribe.audio_providers.audio_provider import AudioProvider
+from typing import Callable, Tuple
+from diatribe.workspace import session_path, current_workspace, use_workspace
+from diatribe.text_chunks import chunk_text, CHUNK_CROSSFADE_MS
+from diatribe.cancellation import Cancelled, check_cancelled
+
+MEGABYTE = 1024 * 1024
+DECODE_CACHE_BYTES = int(os.getenv("DIATRIBE_DECODE_CACHE_MB", "256")) * MEGABYTE
+# a waveform is drawn from the lowest and highest sample of this many stretches of audio
+WAVEFORM_POINTS = 2000
 
 class Soundboard:
   def __init__(self, edits: list[AudioEdit] = []) -> None:
@@ -96,33 +107,33 @@ def export_source_audio(
   
   for line in lines_to_copy:
     try:
-      shutil.copy(f"{src_dir}/line{line}.wav", f"{dst_dir}/line{line}.wav")
+      link_file(f"{src_dir}/line{line}.wav", f"{dst_dir}/line{line}.wav")
     except:
       log(f"line{line}.wav does not exist")
       
   if include_dialogue and os.path.exists(f"{src_dir}/dialogue.mp3"):
-    shutil.copy(f"{src_dir}/dialogue.mp3", f"{dst_dir}/dialogue.mp3")
+    link_file(f"{src_dir}/dialogue.mp3", f"{dst_dir}/dialogue.mp3")
 
 
 def export_audio(lines_to_copy: list[int], include_dialogue: bool = True) -> str:
   """Export the audio files from the audio folder to the export folder."""
-  line_src_dir = f"./session/{st.session_state.session_id}/audio"
-  final_src_dir = f"./session/{st.session_state.session_id}/final/audio"
-  line_dst_dir = f"./session/{st.session_state.session_id}/export/audio"
-  final_dst_dir = f"./session/{st.session_state.session_id}/export/final/audio"
+  line_src_dir = session_path("audio")
+  final_src_dir = session_path("final/audio")
+  line_dst_dir = session_path("export/audio")
+  final_dst_dir = session_path("export/final/audio")
 
   export_source_audio(lines_to_copy, line_src_dir, line_dst_dir, include_dialogue)
   export_source_audio(lines_to_copy, final_src_dir, final_dst_dir, include_dialogue)
-  return f"./session/{st.session_state.session_id}/export"  
+  return session_path("export")  
 
 
 def import_source_audio(src_dir: str, dst_dir: str) -> None:
-  shutil.copytree(src_dir, dst_dir, dirs_exist_ok=True) 
+  link_tree(src_dir, dst_dir)
 
 
 def import_audio(src_dir: str) -> list[str]:
-  dest_audio = f"./session/{st.session_state.session_id}/audio"
-  dest_final_audio = f"./session/{st.session_state.session_id}/final/audio"
+  dest_audio = session_path("audio")
+  dest_final_audio = session_path("final/audio")
   if os.path.exists(dest_audio):
     shutil.rmtree(dest_audio)
   if os.path.exists(dest_final_audio):
@@ -138,47 +149,222 @@ def import_audio(src_dir: str) -> list[str]:
     import_source_audio(final_dir, dest_final_audio)
   else:
     if os.path.exists(f"{final_dir}/dialogue.mp3"):
-      shutil.copy(f"{final_dir}/dialogue.mp3", f"{dest_final_audio}/dialogue.mp3")
+      link_file(f"{final_dir}/dialogue.mp3", f"{dest_final_audio}/dialogue.mp3")
     import_source_audio(line_dir, dest_final_audio)
   return glob.glob(f"{dest_audio}/line*.wav")
 
 
+def session_versions() -> AudioVersions:
+  """Return the audio version history of the current session."""
+  return AudioVersions(session_path(), get_blob_store())
+
+
+def synthesis_key(
+  provider: AudioProvider,
+  text: str,
+  voice_id: str,
+  options: dict,
+  guidance: str | None = None
+) -> str:
+  """Return a key identifying the audio an engine would produce for a line."""
+  settings = {k: v for k, v in options.items() if k not in ("api_key", "test")}
+  request = json.dumps([provider.name, voice_id, text, guidance, settings], sort_keys=True, default=str)
+  return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+def reuse_line_audio(
+  provider: AudioProvider,
+  text: str,
+  voice_id: str,
+  line: int,
+  options: dict,
+  guidance: str | None = None
+) -> str | None:
+  """Check out the stored audio of an identical earlier request and return its path if there is one."""
+  store = get_blob_store()
+  digest = store.lookup(synthesis_key(provider, text, voice_id, options, guidance))
+  if digest is None:
+    return None
+  log(f"reusing stored audio for line {line}")
+  return store.checkout(digest, session_path(f"audio/line{line}.wav"))
+
+
+def store_line_audio(
+  provider: AudioProvider,
+  text: str,
+  voice_id: str,
+  options: dict,
+  audio_file: str,
+  guidance: str | None = None
+) -> str:
+  """Commit the line audio as a new version and remember it for identical requests."""
+  key = synthesis_key(provider, text, voice_id, options, guidance)
+  digest = session_versions().commit(audio_file)
+  get_blob_store().remember(key, digest)
+  if os.path.basename(os.path.dirname(audio_file)) == "audio":
+    with _line_index_lock:
+      index = load_line_index()
+      index["lines"][os.path.basename(audio_file)] = key
+      save_line_index(index)
+  return audio_file
+
+
+def cache_line_audio(key: str, audio_file: str) -> str:
+  """Remember audio under its synthesis key without making it part of the session."""
+  store = get_blob_store()
+  digest = store.put(audio_file)
+  store.remember(key, digest)
+  return digest
+
+
+_line_index_lock = threading.Lock()
+
+
+def load_line_index() -> dict:
+  """Return which request each line file was generated from and the line each dialogue row was on."""
+  path = session_path("audio/lines.json")
+  if not os.path.exists(path):
+    return {"lines": {}, "rows": {}}
+  with open(path, "r") as f:
+    return json.load(f)
+
+
+def save_line_index(index: dict) -> None:
+  path = session_path("audio/lines.json")
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  temp_path = f"{path}.tmp"
+  with open(temp_path, "w") as f:
+    json.dump(index, f)
+  os.replace(temp_path, path)
+
+
+def keep_unchanged_lines(rows: list[tuple[str | None, int, str]]) -> list[int]:
+  """Keep the audio of the rows whose request is unchanged and return the lines to generate.
+
+  Each row is its id, its current line and the synthesis key of its request. Unchanged
+  audio follows its row to the current line, and the audio of changed or deleted rows
+  is removed.
+  """
+  with _line_index_lock:
+    index = load_line_index()
+    kept = []
+    moved = {}
+    for row_id, line, key in rows:
+      previous = index["rows"].get(row_id) if row_id else None
+      if previous is not None:
+        moved[session_path(f"audio/line{previous}.wav")] = session_path(f"audio/line{line}.wav")
+      previous_file = session_path(f"audio/line{previous}.wav")
+      if previous is not None and index["lines"].get(f"line{previous}.wav") == key and os.path.exists(previous_file):
+        # moved aside first so a row taking the number of another does not overwrite it
+        moving_file = session_path(f"audio/{row_id}.moving")
+        os.replace(previous_file, moving_file)
+        kept.append((line, key, moving_file))
+
+    for path in glob.glob(session_path("audio/line*.wav")):
+      os.remove(path)
+    for line, _, moving_file in kept:
+      os.replace(moving_file, session_path(f"audio/line{line}.wav"))
+
+    save_line_index({
+      "lines": {f"line{line}.wav": key for line, key, _ in kept},
+      "rows": {row_id: line for row_id, line, _ in rows if row_id}
+    })
+    # the undo history of a line follows its row, changed rows keep theirs below the new audio
+    session_versions().move_histories(moved, session_path("audio/line"))
+  kept_lines = {line for line, _, _ in kept}
+  log(f"keeping the audio of {len(kept_lines)} unchanged lines")
+  return [line for _, line, _ in rows if line not in kept_lines]
+
+
+def line_chunks(provider: AudioProvider, text: str, line: int) -> list[tuple[str, str]]:
+  """Return the text and scratch workspace of every chunk a long line is synthesized in."""
+  if provider.chunk_chars is None:
+    return []
+  chunks = chunk_text(text, provider.chunk_chars)
+  if len(chunks) == 1:
+    return []
+  return [(chunk, session_path(f"chunks/line{line}-{i}")) for i, chunk in enumerate(chunks)]
+
+
+def stitch_line_chunks(chunk_files: list[str], line: int, options: dict) -> str:
+  """Join the chunk audio of a line with short crossfades into its line file."""
+  audio = None
+  for chunk_file in chunk_files:
+    chunk = seg.from_file(chunk_file)
+    if audio is None:
+      audio = chunk
+    else:
+      audio = audio.append(chunk, crossfade=min(CHUNK_CROSSFADE_MS, len(audio), len(chunk)))
+  output_file = session_path("temp/test.wav") if "test" in options else session_path(f"audio/line{line}.wav")
+  os.makedirs(os.path.dirname(output_file), exist_ok=True)
+  audio.export(break_link(output_file), format="wav")
+  for chunk_file in chunk_files:
+    # the chunk workspace is two folders up from its audio
+    shutil.rmtree(os.path.dirname(os.path.dirname(chunk_file)), ignore_errors=True)
+  return output_file
+
+
+def synthesize_line_file(
+  provider: AudioProvider,
+  text: str,
+  voice_id: str,
+  line: int,
+  options: dict,
+  guidance: str | None = None
+) -> str:
+  """Synthesize a line with the provider, in sentence chunks stitched together when it is long."""
+  chunks = line_chunks(provider, text, line)
+  if len(chunks) == 0:
+    return provider.generate_and_save(text, voice_id, line, options, guidance=guidance)
+  log(f"synthesizing line {line} in {len(chunks)} chunks")
+  chunk_files = []
+  for chunk, workspace in chunks:
+    check_cancelled()
+    with use_workspace(workspace):
+      chunk_files.append(provider.generate_and_save(chunk, voice_id, 0, options, guidance=guidance))
+  return stitch_line_chunks(chunk_files, line, options)
+
+
+def generate_line_audio(
+  provider: AudioProvider,
+  text: str,
+  voice_id: str,
+  line: int,
+  options: dict,
+  guidance: str | None = None,
+  reuse: bool = True
+) -> str:
+  """Generate the audio for a line, reusing stored audio from an identical earlier request."""
+  audio_file = reuse_line_audio(provider, text, voice_id, line, options, guidance) if reuse else None
+  if audio_file is None:
+    audio_file = synthesize_line_file(provider, text, voice_id, line, options, guidance)
+  return store_line_audio(provider, text, voice_id, options, audio_file, guidance)
+
+
 def get_generated_audio() -> list[str]:
   """Return whether the audio files have been generated."""
-  return glob.glob(f"./session/{st.session_state.session_id}/audio/line*.wav")
+  return glob.glob(session_path("audio/line*.wav"))
 
 
-def generate_waveform(audio: seg, y_max: float = None) -> (int, plt.Figure):
-  """Generate a waveform plot figure from the mp3 file."""  
+def waveform_peaks(audio: seg) -> tuple[float, np.ndarray]:
+  """Return the length in seconds and the alternating lowest and highest samples that draw the waveform."""
   audio_array = np.frombuffer(audio.raw_data, dtype=np.int16)
-  frame_rate = audio.frame_rate        
-  num_samples = len(audio_array)
-  length = num_samples / float(frame_rate)
-  time_axis = np.linspace(0, length, num_samples) 
-  fig, ax = plt.subplots()
-  plt.gca().axis("off")       
-  ax.plot(time_axis, audio_array)
-  
-  if y_max:
-    ax.set_ylim(-y_max, y_max)
-  _, max_y = ax.get_ylim()
-  fig.set_figheight(2)
-  
-  return max_y, fig
+  length = len(audio_array) / float(audio.frame_rate)
+  if len(audio_array) <= 2 * WAVEFORM_POINTS:
+    return length, audio_array.copy()
+  stretches = audio_array[:len(audio_array) // WAVEFORM_POINTS * WAVEFORM_POINTS].reshape(WAVEFORM_POINTS, -1)
+  return length, np.stack([stretches.min(axis=1), stretches.max(axis=1)], axis=1).ravel()
 
 
-def generate_waveform_from_file(audio_file: str, y_max: float = None) -> (int, plt.Figure):
-  status = st.spinner("Generating waveform...")
-  with status:
-    audio: seg = seg.from_mp3(audio_file)
-    result = generate_waveform(audio, y_max)
-  return result
-
-
-def generate_waveform_from_bytes(audio_bytes: bytes, y_max: float) -> (int, plt.Figure):
-  with st.spinner("Generating waveform..."):
-    audio: seg = seg.from_wav(io.BytesIO(audio_bytes))
-    return generate_waveform(audio, y_max)
+def file_waveform_peaks(audio_file: str) -> tuple[float, np.ndarray]:
+  """Return the waveform peaks of an audio file, reusing them for as long as the file is unchanged."""
+  # the peaks of a joined dialogue are kept when it is exported, so it is not decoded again
+  key = _file_key(audio_file)
+  peaks = _waveform_cache.get(key)
+  if peaks is None:
+    peaks = waveform_peaks(seg.from_mp3(audio_file))
+    _waveform_cache.put(key, peaks, peaks[1].nbytes)
+  return peaks
 
 
 def normalize_final_audio(dialogue_path: str) -> None:
@@ -190,7 +376,7 @@ def normalize_final_audio(dialogue_path: str) -> None:
     LimiterEdit(threshold=-1, release=250)
   ])
   audio = apply_soundboard(audio, soundboard)
-  audio.export(f"{dialogue_path}/dialogue.mp3", format="mp3")   
+  audio.export(break_link(f"{dialogue_path}/dialogue.mp3"), format="mp3")   
 
 
 def overlap_and_extend(one: seg, two: seg, overlap: int) -> seg:
@@ -218,7 +404,7 @@ def join_files(
       log(f"audio file does not exist: {audio_file}")
 
   format = os.path.splitext(os.path.basename(destination_filename))[1].replace(".", "")
-  final_audio.export(destination_filename, format=format)  
+  final_audio.export(break_link(destination_filename), format=format)  
 
 
 def join_lines(
@@ -258,59 +444,212 @@ def join_parts(
   )
   
 
-def join_audio(
-  line_indices: list[int], 
-  join_gap: int = 200, 
-  source_path: str = None,
-  destination_path: str = None,
+class _AudioCache:
+  """Least recently used values that are dropped once together they take more than `max_bytes`."""
+  def __init__(self, max_bytes: int) -> None:
+    self.max_bytes = max_bytes
+    self._bytes = 0
+    self._entries: OrderedDict[tuple, tuple[object, int]] = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key: tuple) -> object | None:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      self._entries.move_to_end(key)
+      return entry[0]
+
+  def put(self, key: tuple, value: object, size: int) -> None:
+    with self._lock:
+      if key in self._entries:
+        self._bytes -= self._entries.pop(key)[1]
+      if size > self.max_bytes:
+        return
+      self._entries[key] = (value, size)
+      self._bytes += size
+      while self._bytes > self.max_bytes:
+        _, (_, evicted) = self._entries.popitem(last=False)
+        self._bytes -= evicted
+
+
+_decode_cache = _AudioCache(DECODE_CACHE_BYTES)
+_waveform_cache = _AudioCache(16 * MEGABYTE)
+
+
+def _file_key(path: str) -> tuple:
+  """Identify a file by its content, which is taken to be unchanged while its inode, time and size are."""
+  stat = os.stat(path)
+  return (os.path.abspath(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def decode_line_audio(path: str) -> seg:
+  """Decode a line file, reusing the decoded audio for as long as the file is unchanged."""
+  key = _file_key(path)
+  audio = _decode_cache.get(key)
+  if audio is None:
+    audio = seg.from_mp3(path)
+    _decode_cache.put(key, audio, len(audio.raw_data))
+  return audio
+
+
+def _export_joined_audio(
+  final_audio: seg,
+  source_path: str,
+  destination_path: str,
   copy_lines: bool = True
-) -> None:
-  """Join audio files found in the audio folder together with a gap in between with optional normalization."""
-  if source_path is None or destination_path is None:
-    source_path = f"./session/{st.session_state.session_id}/audio"
-    destination_path = f"./session/{st.session_state.session_id}/final/audio"
-    parts_path = f"./session/{st.session_state.session_id}/final/parts"
-    
+) -> str:
+  parts_path = session_path("final/parts")
   if os.path.exists(destination_path):
     shutil.rmtree(destination_path)
   os.makedirs(destination_path, exist_ok=True)
   if os.path.exists(parts_path):
     shutil.rmtree(parts_path)
   os.makedirs(parts_path, exist_ok=True)
+  if copy_lines:
+    link_tree(source_path, destination_path)
+  
+  dialogue_path = f"{destination_path}/dialogue.mp3"
+  final_audio.export(break_link(dialogue_path), format="mp3") 
+  session_versions().commit(dialogue_path)
+  peaks = waveform_peaks(final_audio)
+  _waveform_cache.put(_file_key(dialogue_path), peaks, peaks[1].nbytes)
+  return dialogue_path
+
+
+def join_dialogue_audio(
+  line_indices: list[int], 
+  join_gap: int = 200, 
+  source_path: str = None,
+  destination_path: str = None,
+  copy_lines: bool = True,
+  progress: Callable[[float, str], None] | None = None
+) -> str:
+  """Join the line audio into the final dialogue without any Streamlit UI and return its path."""
+  if source_path is None or destination_path is None:
+    source_path = session_path("audio")
+    destination_path = session_path("final/audio")
+  if progress is None:
+    progress = lambda value, text: None
   
   audio_files = [f"{source_path}/line{i}.wav" for i in line_indices]
-  if copy_lines:
-    shutil.copytree(source_path, destination_path, dirs_exist_ok=True)
   log(f"joining {len(audio_files)} audio files: {line_indices}")
   
   gap = seg.silent(join_gap)
   segments: list[seg] = []
-  progress_text = "Preparing audio..."
-  joining_audio_bar = st.progress(0, text=progress_text)          
   for i, file in enumerate(audio_files):
     if os.path.exists(file):
-      segments.append(seg.from_mp3(file))
-    joining_audio_bar.progress(round((i+1) / len(audio_files), 2), text=progress_text)
-  joining_audio_bar.empty()
+      segments.append(decode_line_audio(file))
+    progress(round((i+1) / len(audio_files), 2), "Preparing audio...")
+  if len(segments) == 0:
+    raise FileNotFoundError(f"no line audio found in {source_path}")
     
-  progress_text = "Joining audio..."
-  joining_audio_bar = st.progress(0, text=progress_text) 
   final_audio = segments[0]
   for i, s in enumerate(segments[1:]):
     final_audio += gap + s.fade_out(300)
-    joining_audio_bar.progress(round((i+1) / len(segments[1:]), 2), text=progress_text)  
-  
-  final_audio.export(f"{destination_path}/dialogue.mp3", format="mp3") 
-  joining_audio_bar.empty()
-  
-  if "background_added" in st.session_state:
-    del st.session_state["background_added"]
-  
+    progress(round((i+1) / len(segments[1:]), 2), "Joining audio...")
   
+  return _export_joined_audio(final_audio, source_path, destination_path, copy_lines)
+
+
+class RunningJoin:
+  """Joins the dialogue while its lines are still being synthesized.
+
+  Every line handed to `add` is decoded on a worker thread and appended to the joined
+  audio as soon as the lines before it are in, so when the last line is synthesized
+  only the export is left. Lines that are not pending are read from the audio folder.
+  With `preview` every joined piece is also written to the preview folder as an mp3
+  part, which together play as the dialogue so far. The folder is removed once the
+  join is finished or closed.
+  """
+  def __init__(
+    self,
+    line_indices: list[int],
+    join_gap: int = 200,
+    pending: list[int] = [],
+    preview: bool = False
+  ) -> None:
+    self.workspace = current_workspace()
+    self.lines = list(line_indices)
+    self.join_gap = join_gap
+    self.preview_path = session_path("preview") if preview else None
+    if self.preview_path is not None:
+      shutil.rmtree(self.preview_path, ignore_errors=True)
+      os.makedirs(self.preview_path, exist_ok=True)
+    self._parts = 0
+    self._added: set[int] = set()
+    self._decoded: dict[int, seg | None] = {}
+    self._joined: seg | None = None
+    self._next = 0
+    self._queue: queue.Queue = queue.Queue()
+    self._worker = threading.Thread(target=self._run, daemon=True, name="running-join")
+    self._worker.start()
+    for line in self.lines:
+      if line not in pending:
+        self.add(line, session_path(f"audio/line{line}.wav"))
+
+  def add(self, line: int, audio_file: str) -> None:
+    """Queue a finished line for decoding and joining."""
+    self._added.add(line)
+    self._queue.put((line, audio_file))
+
+  def _run(self) -> None:
+    while True:
+      item = self._queue.get()
+      if item is None:
+        return
+      line, audio_file = item
+      try:
+        self._decoded[line] = decode_line_audio(audio_file) if os.path.exists(audio_file) else None
+      except Exception as e:
+        log(f"could not decode line {line}: {e}")
+        self._decoded[line] = None
+      self._advance()
+
+  def _advance(self) -> None:
+    gap = seg.silent(self.join_gap)
+    while self._next < len(self.lines) and self.lines[self._next] in self._decoded:
+      segment = self._decoded.pop(self.lines[self._next])
+      if segment is not None:
+        piece = segment if self._joined is None else gap + segment.fade_out(300)
+        self._joined = piece if self._joined is None else self._joined + piece
+        if self.preview_path is not None:
+          self._write_preview(piece)
+      self._next += 1
+
+  def _write_preview(self, piece: seg) -> None:
+    part_path = f"{self.preview_path}/part{self._parts:05d}.mp3"
+    # without tags the parts are plain mp3 frames that play back to back as one stream
+    piece.export(f"{part_path}.tmp", format="mp3", parameters=["-id3v2_version", "0", "-write_xing", "0"])
+    os.replace(f"{part_path}.tmp", part_path)
+    track(part_path)
+    self._parts += 1
+
+  def close(self) -> None:
+    """Stop joining without writing the dialogue."""
+    self._queue.put(None)
+    self._worker.join()
+    if self.preview_path is not None:
+      # the preview stream ends once its folder is gone, the joined dialogue replaces it
+      shutil.rmtree(self.preview_path, ignore_errors=True)
+
+  def finish(self) -> str:
+    """Join the lines still outstanding, export the dialogue and return its path."""
+    with use_workspace(self.workspace):
+      for line in self.lines:
+        if line not in self._added:
+          self.add(line, session_path(f"audio/line{line}.wav"))
+      self.close()
+      if self._joined is None:
+        raise FileNotFoundError(f"no line audio found in {session_path('audio')}")
+      log(f"joined {len(self.lines)} lines while they were generated")
+      return _export_joined_audio(self._joined, session_path("audio"), session_path("final/audio"))
+
+
 def clear_audio_files() -> None:
   """Clear all audio files from the audio directory."""
-  shutil.rmtree(f"./session/{st.session_state.session_id}/audio", ignore_errors=True)
-  os.makedirs(f"./session/{st.session_state.session_id}/audio", exist_ok=True)
+  shutil.rmtree(session_path("audio"), ignore_errors=True)
+  os.makedirs(session_path("audio"), exist_ok=True)
 
  
 def segment_to_bytes(segment: seg) -> bytes:
@@ -330,12 +669,14 @@ def apply_soundboard(audio: seg, soundboard: Soundboard) -> seg:
     return audio
   
   log(f"applying soundboard {', '.join(soundboard.pedal_adjustments())}")
-  temp_input_filepath = f"./session/{st.session_state.session_id}/temp/in.wav"
-  temp_output_filepath = f"./session/{st.session_state.session_id}/temp/out.wav"
+  # unique names so renders sharing a workspace from several threads do not collide
+  temp_name = uuid.uuid4().hex
+  temp_input_filepath = session_path(f"temp/{temp_name}_in.wav")
+  temp_output_filepath = session_path(f"temp/{temp_name}_out.wav")
   os.makedirs(os.path.dirname(temp_input_filepath), exist_ok=True)
   os.makedirs(os.path.dirname(temp_output_filepath), exist_ok=True)
   
-  audio.export(temp_input_filepath, format="wav")
+  audio.export(track(temp_input_filepath), format="wav")
   samplerate = 44100.0
   with AudioFile(temp_input_filepath).resampled_to(samplerate) as f:
     temp_in = f.read(f.frames)
@@ -343,7 +684,7 @@ def apply_soundboard(audio: seg, soundboard: Soundboard) -> seg:
   pedalboard = Pedalboard(pedals)  
   samples = pedalboard(temp_in, samplerate)
   with AudioFile(
-    temp_output_filepath, 
+    track(temp_output_filepath), 
     "w", 
     samplerate, 
     samples.shape[0]
@@ -472,7 +813,7 @@ def get_default_effects() -> list[str]:
 
 def get_session_effects() -> list[str]:
   """Get the effects from the effects folder."""
-  return glob.glob(f"./session/{st.session_state.session_id}/effects/*")
+  return glob.glob(session_path("effects/*"))
 
 
 def process_audio_file_name(file: str) -> str:
@@ -482,7 +823,7 @@ def process_audio_file_name(file: str) -> str:
   return name
 
 
-@st.cache_data
+@functools.cache
 def get_default_effect_names() -> list[str]:
   """Get the effect names from the effects folder."""
   names = [process_audio_file_name(f) for f in get_default_effects()]
@@ -504,9 +845,9 @@ def get_effect_names() -> list[str]:
 def save_sound_effect(audio: bytes, name: str) -> None:
   audio: seg = seg.from_file(io.BytesIO(audio))
   name = os.path.splitext(name)[0]
-  output_path = f"./session/{st.session_state.session_id}/effects/{name}.wav"
+  output_path = session_path(f"effects/{name}.wav")
   os.makedirs(os.path.dirname(output_path), exist_ok=True)
-  audio.export(output_path, format="wav") 
+  audio.export(break_link(output_path), format="wav") 
 
 
 def get_default_backgrounds() -> list[str]:
@@ -516,7 +857,7 @@ def get_default_backgrounds() -> list[str]:
 
 def get_session_backgrounds() -> list[str]:
   """Get the backgrounds from the backgrounds folder."""
-  return glob.glob(f"./session/{st.session_state.session_id}/backgrounds/*")
+  return glob.glob(session_path("backgrounds/*"))
 
 
 def get_default_background_names() -> list[str]:
@@ -544,9 +885,9 @@ def get_background_names() -> list[str]:
 def save_background_audio(audio: bytes, name: str) -> None:
   audio: seg = seg.from_file(io.BytesIO(audio))
   name = os.path.splitext(name)[0]
-  output_path = f"./session/{st.session_state.session_id}/backgrounds/{name}.mp3"
+  output_path = session_path(f"backgrounds/{name}.mp3")
   os.makedirs(os.path.dirname(output_path), exist_ok=True)
-  audio.export(output_path, format="mp3")
+  audio.export(break_link(output_path), format="mp3")
 
 
 def get_audio_duration(filename: str) -> float:
@@ -557,7 +898,7 @@ def get_audio_duration(filename: str) -> float:
 
 def get_line_duration(line: int) -> float:
   """Get the duration of the speech in seconds."""
-  filename = f"./session/{st.session_state.session_id}/audio/line{line}.wav"
+  filename = session_path(f"audio/line{line}.wav")
   return len(seg.from_mp3(filename))
 
 
@@ -573,7 +914,7 @@ def get_asset_path_from_name(name: str, folder: str) -> str:
   if files:
     return files[0]
   else:
-    files = glob.glob(f"./session/{st.session_state.session_id}/{folder}/{name}.*")
+    files = glob.glob(session_path(f"{folder}/{name}.*"))
     if files:
       return files[0]
     else:
@@ -596,7 +937,7 @@ def apply_background_audio(background_edit: BackgroundEdit, destination_path: st
   background_file = background_files[background_index]  
   dialogue, background = prepare_background(destination_path, background_file, background_edit)
   final_dialogue: seg = dialogue.overlay(background)
-  final_dialogue.export(destination_path, format="wav")  
+  final_dialogue.export(break_link(destination_path), format="wav")  
 
 
 def get_contiguous_lines(affected_lines: list[int], all_lines: list[int]) -> list[AudioPart]:
@@ -628,6 +969,7 @@ def master_audio_parts(
 ) -> None:
   audio_parts: list[AudioPart] = get_contiguous_lines(affected_lines, lines)
   for i, part in enumerate(audio_parts):
+    check_cancelled()
     part_path = f"{parts_audio_path}/part{i+1}.wav"
     if not os.path.exists(part_path):
       join_lines(
@@ -638,7 +980,7 @@ def master_audio_parts(
       )
     if part.edited:
       part_audio = apply_edits(part_path, soundboard)
-      part_audio.export(part_path, format="wav")
+      part_audio.export(break_link(part_path), format="wav")
       background_edit = soundboard.background()
       if background_edit is not None and background_edit.is_enabled():
         apply_background_audio(background_edit, part_path)      
@@ -655,13 +997,18 @@ def master_dialogue(
 ) -> None:
   wav_path = f"{dialogue_path.replace('.mp3', '.wav')}"
   seg.from_mp3(dialogue_path).export(wav_path, format="wav")
-  part_audio = apply_edits(wav_path, soundboard)
-  part_audio.export(wav_path, format="wav")
-  background_edit = soundboard.background()
-  if background_edit is not None and background_edit.is_enabled():
-    apply_background_audio(background_edit, wav_path)    
-  seg.from_wav(wav_path).export(dialogue_path, format="mp3")
-  os.remove(wav_path)
+  try:
+    check_cancelled()
+    part_audio = apply_edits(wav_path, soundboard)
+    part_audio.export(wav_path, format="wav")
+    check_cancelled()
+    background_edit = soundboard.background()
+    if background_edit is not None and background_edit.is_enabled():
+      apply_background_audio(background_edit, wav_path)
+    check_cancelled()
+    seg.from_wav(wav_path).export(break_link(dialogue_path), format="mp3")
+  finally:
+    os.remove(wav_path)
 
 def preview_mastered_audio(
   affected_lines: list[int], 
@@ -670,10 +1017,10 @@ def preview_mastered_audio(
   gap: int,
   whole: bool = False
 ) -> Tuple[str, str]:  
-  src_audio_path = f"./session/{st.session_state.session_id}/final/audio"
-  src_parts_path = f"./session/{st.session_state.session_id}/final/parts"
-  destination_audio_path = f"./session/{st.session_state.session_id}/temp/audio"
-  parts_audio_path = f"./session/{st.session_state.session_id}/temp/parts"
+  src_audio_path = session_path("final/audio")
+  src_parts_path = session_path("final/parts")
+  destination_audio_path = session_path("temp/audio")
+  parts_audio_path = session_path("temp/parts")
     
   dialogue_path = f"{destination_audio_path}/dialogue.mp3"
   os.makedirs(parts_audio_path, exist_ok=True)
@@ -686,12 +1033,12 @@ def preview_mastered_audio(
     shutil.rmtree(parts_audio_path)
   os.makedirs(parts_audio_path, exist_ok=True)
   if os.path.exists(src_parts_path):
-    shutil.copytree(src_parts_path, parts_audio_path, dirs_exist_ok=True)
+    link_tree(src_parts_path, parts_audio_path)
   
 
   original_audio = f"{src_audio_path}/dialogue.mp3"
   if whole:
-    shutil.copy(original_audio, dialogue_path)
+    link_file(original_audio, dialogue_path)
     master_dialogue(soundboard, dialogue_path)
   else:
     master_audio_parts(
@@ -717,31 +1064,48 @@ def apply_mastered_audio(
   gap: int,
   whole: bool = False
 ) -> None:
-  src_audio_path = f"./session/{st.session_state.session_id}/final/audio"
-  src_parts_path = f"./session/{st.session_state.session_id}/final/parts"
-  destination_audio_path = f"./session/{st.session_state.session_id}/final/audio"
+  src_audio_path = session_path("final/audio")
+  src_parts_path = session_path("final/parts")
+  destination_audio_path = session_path("final/audio")
   parts_audio_path = src_parts_path
   dialogue_path = f"{destination_audio_path}/dialogue.mp3"
   
   os.makedirs(src_parts_path, exist_ok=True)
   
-  shutil.copy(
+  versions = session_versions()
+  versions.commit(dialogue_path)
+  link_file(
     f"{src_audio_path}/dialogue.mp3", 
     f"{src_audio_path}/dialogue_org.mp3"
   )    
+  # the parts are mastered in place, so keep them as they were in case the apply is cancelled
+  parts_snapshot_path = session_path("temp/parts_org")
+  shutil.rmtree(parts_snapshot_path, ignore_errors=True)
+  link_tree(src_parts_path, parts_snapshot_path)
   
-  if whole:
-    master_dialogue(soundboard, dialogue_path)
-  else:
-    master_audio_parts(
-      affected_lines,
-      lines,
-      soundboard,
-      gap,
-      parts_audio_path,
-      destination_audio_path,
-      dialogue_path
-    )
-  
+  try:
+    if whole:
+      master_dialogue(soundboard, dialogue_path)
+    else:
+      master_audio_parts(
+        affected_lines,
+        lines,
+        soundboard,
+        gap,
+        parts_audio_path,
+        destination_audio_path,
+        dialogue_path
+      )
+    check_cancelled()
+  except Cancelled:
+    # a cancelled apply leaves the dialogue and its parts as they were
+    link_file(f"{src_audio_path}/dialogue_org.mp3", dialogue_path)
+    shutil.rmtree(src_parts_path, ignore_errors=True)
+    link_tree(parts_snapshot_path, src_parts_path)
+    raise
+  finally:
+    shutil.rmtree(parts_snapshot_path, ignore_errors=True)
+
   if soundboard.normalization().is_enabled():
-    normalize_final_audio(destination_audio_path) 
\ No newline at end of file
+    normalize_final_audio(destination_audio_path)
+  versions.commit(dialogue_path)
@@ -0,0 +1,59 @@
+import io
+import streamlit as st
+import numpy as np
+import matplotlib.pyplot as plt
+from pydub import AudioSegment as seg
+from diatribe.audio_tools import join_dialogue_audio, waveform_peaks, file_waveform_peaks
+
+
+def generate_waveform(audio: seg, y_max: float = None) -> (int, plt.Figure):
+  """Generate a waveform plot figure from the audio."""
+  return plot_waveform(*waveform_peaks(audio), y_max)
+
+
+def plot_waveform(length: float, peaks: np.ndarray, y_max: float = None) -> (int, plt.Figure):
+  time_axis = np.linspace(0, length, len(peaks))
+  fig, ax = plt.subplots()
+  plt.gca().axis("off")
+  ax.plot(time_axis, peaks)
+
+  if y_max:
+    ax.set_ylim(-y_max, y_max)
+  _, max_y = ax.get_ylim()
+  fig.set_figheight(2)
+
+  return max_y, fig
+
+
+def generate_waveform_from_file(audio_file: str, y_max: float = None) -> (int, plt.Figure):
+  with st.spinner("Generating waveform..."):
+    return plot_waveform(*file_waveform_peaks(audio_file), y_max)
+
+
+def generate_waveform_from_bytes(audio_bytes: bytes, y_max: float) -> (int, plt.Figure):
+  with st.spinner("Generating waveform..."):
+    audio: seg = seg.from_wav(io.BytesIO(audio_bytes))
+    return generate_waveform(audio, y_max)
+
+
+def join_audio(
+  line_indices: list[int],
+  join_gap: int = 200,
+  source_path: str = None,
+  destination_path: str = None,
+  copy_lines: bool = True
+) -> None:
+  """Join audio files found in the audio folder together with a gap in between with optional normalization."""
+  joining_audio_bar = st.progress(0, text="Preparing audio...")
+  join_dialogue_audio(
+    line_indices,
+    join_gap,
+    source_path,
+    destination_path,
+    copy_lines,
+    progress=lambda value, text: joining_audio_bar.progress(value, text=text)
+  )
+  joining_audio_bar.empty()
+
+  if "background_added" in st.session_state:
+    del st.session_state["background_added"]
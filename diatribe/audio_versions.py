@@ -0,0 +1,148 @@
+import os, json, copy, uuid, threading
+from diatribe.utils import log
+from diatribe.blob_store import BlobStore
+
+VERSION_LIMIT = int(os.getenv("DIATRIBE_VERSION_LIMIT", "10"))
+
+_locks: dict[str, threading.RLock] = {}
+_locks_lock = threading.Lock()
+
+
+def _history_lock(session_path: str) -> threading.RLock:
+  """Return the lock of a session's history, shared by every AudioVersions of that session."""
+  with _locks_lock:
+    return _locks.setdefault(os.path.abspath(session_path), threading.RLock())
+
+
+class AudioVersions:
+  """Content-addressed version history for the audio artifacts of a session.
+
+  Every committed file is stored once in the shared blob store and each artifact
+  keeps an ordered list of blob hashes with a pointer to the current one, so undo
+  and redo only move the pointer and relink the blob into place. The session holds
+  a blob store reference for every version it keeps.
+  """
+  def __init__(self, session_path: str, store: BlobStore, limit: int = VERSION_LIMIT) -> None:
+    self.session_path = session_path
+    self.owner = os.path.basename(os.path.normpath(session_path))
+    self.store = store
+    self.root = f"{session_path}/versions"
+    self.history_file = f"{self.root}/history.json"
+    self.limit = max(1, limit)
+    self._cached: tuple[int, dict] | None = None
+    # the worker, the script and mastering threads all update the history
+    self._lock = _history_lock(session_path)
+
+  def _key(self, path: str) -> str:
+    return os.path.relpath(path, self.session_path)
+
+  def _ref_name(self, key: str, digest: str) -> str:
+    return f"versions/{key}/{digest}"
+
+  def _load(self) -> dict:
+    if not os.path.exists(self.history_file):
+      return {}
+    modified = os.stat(self.history_file).st_mtime_ns
+    if self._cached is None or self._cached[0] != modified:
+      with open(self.history_file, "r") as f:
+        self._cached = (modified, json.load(f))
+    return copy.deepcopy(self._cached[1])
+
+  def _save(self, history: dict) -> None:
+    os.makedirs(self.root, exist_ok=True)
+    temp_file = f"{self.history_file}.{uuid.uuid4()}.tmp"
+    with open(temp_file, "w") as f:
+      json.dump(history, f)
+    os.replace(temp_file, self.history_file)
+    self._cached = (os.stat(self.history_file).st_mtime_ns, copy.deepcopy(history))
+
+  def commit(self, path: str) -> str | None:
+    """Record the current contents of the file as its newest version."""
+    if not os.path.exists(path):
+      return None
+    digest = self.store.put(path)
+
+    with self._lock:
+      history = self._load()
+      key = self._key(path)
+      entry = history.get(key, {"versions": [], "index": -1})
+      if entry["index"] >= 0 and entry["versions"][entry["index"]] == digest:
+        return digest
+
+      versions = entry["versions"][:entry["index"] + 1] + [digest]
+      dropped = max(0, len(versions) - self.limit)
+      history[key] = {
+        "versions": versions[dropped:],
+        "index": len(versions) - dropped - 1
+      }
+      self._save(history)
+      self.store.ref(self.owner, self._ref_name(key, digest), digest)
+      released = set(entry["versions"]) - set(history[key]["versions"])
+      self.store.unref(self.owner, [self._ref_name(key, d) for d in released])
+    log(f"committed version {history[key]['index'] + 1} of {key}")
+    return digest
+
+  def _move(self, path: str, step: int) -> bool:
+    with self._lock:
+      history = self._load()
+      key = self._key(path)
+      entry = history.get(key)
+      if entry is None:
+        return False
+      index = entry["index"] + step
+      if index < 0 or index >= len(entry["versions"]):
+        return False
+      self.store.checkout(entry["versions"][index], path)
+      entry["index"] = index
+      self._save(history)
+    log(f"restored version {index + 1} of {key}")
+    return True
+
+  def move_histories(self, moves: dict[str, str], prefix: str) -> None:
+    """Move the histories of files renamed from one path to another.
+
+    The histories of the other files whose paths start with the prefix are dropped, as
+    those files were deleted or replaced by files without a history.
+    """
+    prefix = self._key(prefix)
+    moves = {self._key(src): self._key(dst) for src, dst in moves.items()}
+    with self._lock:
+      history = self._load()
+      old = {key: entry for key, entry in history.items() if key.startswith(prefix)}
+      for key in old:
+        del history[key]
+      for src, dst in moves.items():
+        if src in old:
+          history[dst] = old[src]
+      self._save(history)
+      old_names = {self._ref_name(key, digest) for key, entry in old.items() for digest in entry["versions"]}
+      new_names = set()
+      for key, entry in history.items():
+        if key.startswith(prefix):
+          for digest in entry["versions"]:
+            new_names.add(self._ref_name(key, digest))
+            self.store.ref(self.owner, self._ref_name(key, digest), digest)
+      self.store.unref(self.owner, list(old_names - new_names))
+
+  def undo(self, path: str) -> bool:
+    """Restore the previous version of the file."""
+    return self._move(path, -1)
+
+  def redo(self, path: str) -> bool:
+    """Restore the next version of the file after an undo."""
+    return self._move(path, 1)
+
+  def position(self, path: str) -> tuple[int, int]:
+    """Return the current version number and the number of versions kept."""
+    entry = self._load().get(self._key(path))
+    if entry is None:
+      return 0, 0
+    return entry["index"] + 1, len(entry["versions"])
+
+  def can_undo(self, path: str) -> bool:
+    current, _ = self.position(path)
+    return current > 1
+
+  def can_redo(self, path: str) -> bool:
+    current, total = self.position(path)
+    return current < total
@@ -0,0 +1,139 @@
+import os, sqlite3, hashlib, time, uuid, threading
+from contextlib import contextmanager
+from diatribe.utils import log
+from diatribe.session_files import link_file
+from diatribe.lazy_streamlit import cache_resource
+
+BLOB_STORE_PATH = "./cache/blobs"
+BLOB_STORE_QUOTA = int(os.getenv("DIATRIBE_BLOB_STORE_QUOTA_MB", "5120")) * 1024 * 1024
+
+
+def content_hash(path: str) -> str:
+  """Return the sha256 hex digest of a file."""
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(1024 * 1024), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+class BlobStore:
+  """Audio blobs shared by every session, stored once by content hash.
+
+  Sessions link the blobs into their own directories and hold named references
+  to them, so a blob is only evicted once nothing refers to it. Blobs can also be
+  remembered under a synthesis key, which lets an identical request reuse them.
+  """
+  def __init__(self, root: str = BLOB_STORE_PATH, quota: int = BLOB_STORE_QUOTA) -> None:
+    self.root = root
+    self.objects_path = f"{root}/objects"
+    self.quota = quota
+    self._lock = threading.Lock()
+    os.makedirs(self.objects_path, exist_ok=True)
+    with self._connect() as db:
+      db.executescript("""
+        CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER, last_used REAL);
+        CREATE TABLE IF NOT EXISTS refs (owner TEXT, name TEXT, digest TEXT, PRIMARY KEY (owner, name));
+        CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, digest TEXT);
+        CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest);
+      """)
+
+  @contextmanager
+  def _connect(self):
+    db = sqlite3.connect(f"{self.root}/index.db", timeout=30)
+    try:
+      with db:
+        yield db
+    finally:
+      db.close()
+
+  def object_path(self, digest: str) -> str:
+    return f"{self.objects_path}/{digest[:2]}/{digest}"
+
+  def put(self, path: str) -> str:
+    """Add the file to the store and share the stored blob back into place, returning its digest."""
+    digest = content_hash(path)
+    target = self.object_path(digest)
+    if not os.path.exists(target):
+      temp = f"{target}.{uuid.uuid4()}.tmp"
+      link_file(path, temp)
+      os.replace(temp, target)
+    elif not os.path.samefile(path, target):
+      link_file(target, path)
+    with self._connect() as db:
+      db.execute(
+        "INSERT INTO blobs VALUES (?, ?, ?) ON CONFLICT (digest) DO UPDATE SET last_used = excluded.last_used",
+        (digest, os.path.getsize(target), time.time())
+      )
+    return digest
+
+  def checkout(self, digest: str, path: str) -> str:
+    """Link the blob into a session path."""
+    link_file(self.object_path(digest), path)
+    with self._connect() as db:
+      db.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (time.time(), digest))
+    return path
+
+  def ref(self, owner: str, name: str, digest: str) -> None:
+    with self._connect() as db:
+      db.execute("INSERT OR REPLACE INTO refs VALUES (?, ?, ?)", (owner, name, digest))
+
+  def unref(self, owner: str, names: list[str]) -> None:
+    with self._connect() as db:
+      db.executemany("DELETE FROM refs WHERE owner = ? AND name = ?", [(owner, name) for name in names])
+
+  def release(self, owner: str) -> None:
+    """Drop every reference held by the owner."""
+    with self._connect() as db:
+      db.execute("DELETE FROM refs WHERE owner = ?", (owner,))
+
+  def refcount(self, digest: str) -> int:
+    with self._connect() as db:
+      return db.execute("SELECT COUNT(*) FROM refs WHERE digest = ?", (digest,)).fetchone()[0]
+
+  def remember(self, key: str, digest: str) -> None:
+    """Remember the blob produced for a synthesis key."""
+    with self._connect() as db:
+      db.execute("INSERT OR REPLACE INTO keys VALUES (?, ?)", (key, digest))
+
+  def lookup(self, key: str) -> str | None:
+    """Return the blob remembered for a synthesis key if it is still stored."""
+    with self._connect() as db:
+      row = db.execute("SELECT digest FROM keys WHERE key = ?", (key,)).fetchone()
+    if row is None or not os.path.exists(self.object_path(row[0])):
+      return None
+    return row[0]
+
+  def total_bytes(self) -> int:
+    with self._connect() as db:
+      return db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+  def collect_garbage(self) -> int:
+    """Evict unreferenced blobs, least recently used first, until the store fits its quota."""
+    with self._lock, self._connect() as db:
+      total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+      candidates = db.execute("""
+        SELECT digest, size FROM blobs
+        WHERE digest NOT IN (SELECT digest FROM refs)
+        ORDER BY last_used
+      """).fetchall()
+      reclaimed = 0
+      for digest, size in candidates:
+        if total - reclaimed <= self.quota:
+          break
+        try:
+          os.remove(self.object_path(digest))
+        except FileNotFoundError:
+          pass
+        db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        db.execute("DELETE FROM keys WHERE digest = ?", (digest,))
+        reclaimed += size
+    if reclaimed:
+      log(f"blob store evicted {reclaimed:,} bytes")
+    return reclaimed
+
+
+@cache_resource
+def get_blob_store() -> BlobStore:
+  """Return the process wide blob store."""
+  return BlobStore()
@@ -0,0 +1,107 @@
+import time, threading, contextvars
+from concurrent.futures import Future, TimeoutError
+from contextlib import contextmanager
+from typing import Any, Callable
+from diatribe.utils import log
+from diatribe.workspace import current_workspace, use_workspace
+from diatribe.lazy_streamlit import st
+
+CANCEL_POLL_SECONDS = 0.25
+
+
+class Cancelled(BaseException):
+  """Raised where cancelled work stops.
+
+  Like asyncio's CancelledError it is not an Exception, so the handlers that record a
+  failed line and carry on let it through.
+  """
+
+
+class CancellationToken:
+  def __init__(self) -> None:
+    self._event = threading.Event()
+
+  def cancel(self) -> None:
+    self._event.set()
+
+  @property
+  def cancelled(self) -> bool:
+    return self._event.is_set()
+
+  def wait(self, timeout: float) -> bool:
+    """Sleep for up to `timeout` seconds, returning early with True once cancelled."""
+    return self._event.wait(timeout)
+
+
+_token: contextvars.ContextVar[CancellationToken | None] = contextvars.ContextVar("cancellation", default=None)
+
+
+@contextmanager
+def use_cancellation(token: CancellationToken | None):
+  """Make the work in this context stop at its next check once the token is cancelled."""
+  reset = _token.set(token)
+  try:
+    yield
+  finally:
+    _token.reset(reset)
+
+
+def is_cancelled() -> bool:
+  token = _token.get()
+  return token is not None and token.cancelled
+
+
+def check_cancelled() -> None:
+  """Stop here if the current work has been cancelled."""
+  if is_cancelled():
+    raise Cancelled()
+
+
+def sleep_cancellable(seconds: float) -> None:
+  """Sleep, but stop as soon as the current work is cancelled."""
+  token = _token.get()
+  if token is None:
+    time.sleep(seconds)
+  elif token.wait(seconds):
+    raise Cancelled()
+
+
+def wait_for(future: Future) -> Any:
+  """Wait for the future's result, giving up as soon as the current work is cancelled."""
+  while True:
+    try:
+      return future.result(timeout=CANCEL_POLL_SECONDS)
+    except TimeoutError:
+      check_cancelled()
+
+
+def run_cancellable(fn: Callable[[], Any], text: str) -> Any:
+  """Run slow work on a thread while the script shows a Cancel button and waits for it.
+
+  Clicking Cancel, or anything else that reruns the script, interrupts the wait, which
+  cancels the work so it does not keep running after the script has moved on.
+  """
+  token = CancellationToken()
+  future = Future()
+  workspace = current_workspace()
+  def run() -> None:
+    try:
+      with use_workspace(workspace), use_cancellation(token):
+        future.set_result(fn())
+    except BaseException as e:
+      future.set_exception(e)
+  threading.Thread(target=run, daemon=True, name="cancellable").start()
+
+  st.button("Cancel", key="cancel_running_work", width='stretch')
+  status = st.empty()
+  started = time.perf_counter()
+  try:
+    while not future.done():
+      status.caption(f"{text} ({time.perf_counter() - started:.0f}s)")
+      time.sleep(CANCEL_POLL_SECONDS)
+  finally:
+    if not future.done():
+      log(f"cancelling: {text}")
+      token.cancel()
+  status.empty()
+  return future.result()
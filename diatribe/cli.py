@@ -0,0 +1,190 @@
+"""Render a dialogue to audio from the command line.
+
+  python -m diatribe.cli test/simple_dialogue.txt --engine Kokoro --output dialogue.mp3
+
+The input is either a `dialogue.txt` script or a project zip exported from the app.
+Lines that already have audio in a project are kept, and passing the same `--session`
+or `--workspace` again resumes a render that failed or was interrupted.
+"""
+import os, sys, json, time, uuid, shutil, hashlib, argparse
+import diatribe.audio_tools as audio_tools
+import diatribe.edits as edits
+from dotenv import load_dotenv
+from pydub import AudioSegment as seg
+from diatribe.utils import log
+from diatribe.dialogues import Character, Dialogue, convert_dialogue_import_into_data
+from diatribe.audio_providers.audio_provider import AudioProvider
+from diatribe.audio_providers.registry import get_audio_providers, find_audio_provider
+from diatribe.engine import DiatribeEngine, RenderContext
+from diatribe.worker_pool import WORKER_COUNT, get_worker_pool
+from diatribe.jobs import create_job, reset_job, process_job, latest_job
+from diatribe.workspace import session_path, use_workspace, workspace_path
+
+
+def read_script(input_path: str) -> tuple[str, str | None]:
+  """Return the dialogue script and, for a project zip, the extracted project path."""
+  if input_path.endswith(".zip"):
+    project_path = session_path("import/contents")
+    shutil.rmtree(project_path, ignore_errors=True)
+    shutil.unpack_archive(input_path, project_path, format="zip")
+    with open(f"{project_path}/dialogue.txt", "r") as f:
+      return f.read(), project_path
+  with open(input_path, "r") as f:
+    return f.read(), None
+
+
+def build_dialogue(script: str, provider: AudioProvider) -> list[Dialogue]:
+  """Convert the script into dialogue lines numbered the same way as the app."""
+  data = convert_dialogue_import_into_data(script)
+  if data is None:
+    raise ValueError("the script needs character, plot and dialogue sections separated by blank lines")
+  characters = {}
+  for _, c in data["characters"].iterrows():
+    voice_id = provider.get_voice_id(c["Voice"])
+    characters[c["Name"]] = Character(c["Name"], c["Voice"], voice_id, description=c["Description"], group=c["Group"])
+  dialogue = []
+  for i, d in data["dialogue"].iterrows():
+    if d["Speaker"] not in characters:
+      raise ValueError(f"{d['Speaker']} is not a valid character")
+    dialogue.append(Dialogue(characters[d["Speaker"]], i+1, d["Text"], d["Description"]))
+  return dialogue
+
+
+def render_source(script: str, provider: AudioProvider, options: dict, gap: int) -> str:
+  """Return a digest of everything that shapes the rendered lines, leaving out the API key."""
+  source = {
+    "script": script,
+    "engine": provider.name,
+    "options": {k: v for k, v in options.items() if k != "api_key"},
+    "gap": gap
+  }
+  return hashlib.sha256(json.dumps(source, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_soundboard(path: str) -> audio_tools.Soundboard:
+  """Load mastering edits from JSON that maps edit class names to their fields, e.g. {"NormalizationEdit": {"enabled": true}}."""
+  with open(path, "r") as f:
+    data = json.load(f)
+  soundboard_edits = []
+  for name, values in data.items():
+    edit_type = getattr(edits, name, None)
+    if not isinstance(edit_type, type) or not issubclass(edit_type, edits.AudioEdit):
+      raise ValueError(f"unknown audio edit: {name}")
+    soundboard_edits.append(edit_type(**values))
+  return audio_tools.Soundboard(soundboard_edits)
+
+
+def render(args: argparse.Namespace) -> dict:
+  provider = find_audio_provider(args.engine)
+  if provider is None:
+    raise ValueError(f"unknown engine {args.engine}, choose from: {', '.join(p.name for p in get_audio_providers())}")
+  options = {}
+  if args.options:
+    with open(args.options, "r") as f:
+      options = json.load(f)
+  api_key = options.get("api_key") or (os.getenv(provider.api_key_env) if provider.api_key_env else None)
+  if api_key:
+    options["api_key"] = api_key
+    provider.api_key = api_key
+
+  pool = get_worker_pool(provider, args.workers)
+  engine = DiatribeEngine(provider, pool)
+  context = RenderContext(args.workspace, options, join_gap=args.gap)
+  metrics = {"workspace": args.workspace, "engine": provider.name, "workers": pool.workers if pool else 1}
+  started = time.perf_counter()
+  script, project_path = read_script(args.input)
+  dialogue = build_dialogue(script, provider)
+  lines = [d.line for d in dialogue]
+
+  source = render_source(script, provider, options, args.gap)
+  job = latest_job(context.workspace)
+  if job is not None and job.resumable and not args.regenerate and job.source == source:
+    log(f"resuming job {job.id} with {len(job.remaining_lines())} lines left")
+    reset_job(job)
+  else:
+    # the audio of a render with another script or other options does not belong to this one
+    stale = job is not None and job.source != source
+    if stale:
+      log(f"the script or engine options changed since job {job.id}, rendering every line again")
+    if args.regenerate or stale:
+      audio_tools.clear_audio_files()
+    if project_path and not args.regenerate:
+      audio_tools.import_audio(project_path)
+    missing = [d for d in dialogue if not os.path.exists(session_path(f"audio/line{d.line}.wav"))]
+    job = create_job(engine, context, missing, source=source)
+
+  synthesis_started = time.perf_counter()
+  job.join_lines = lines
+  process_job(job, engine, context)
+  metrics["lines"] = len(lines)
+  metrics["synthesized_lines"] = len(job.lines)
+  metrics["synthesis_seconds"] = round(time.perf_counter() - synthesis_started, 3)
+  if job.failed_lines():
+    raise RuntimeError(f"{len(job.failed_lines())} lines failed, run again with --workspace {args.workspace} to retry them")
+
+  dialogue_path = job.dialogue
+
+  master_started = time.perf_counter()
+  soundboard = load_soundboard(args.master) if args.master else audio_tools.Soundboard([])
+  if args.normalize:
+    soundboard.add(edits.NormalizationEdit(enabled=True))
+  if soundboard.is_enabled():
+    engine.master(context, lines, soundboard)
+  metrics["master_seconds"] = round(time.perf_counter() - master_started, 3)
+
+  output_format = os.path.splitext(args.output)[1].replace(".", "") or "mp3"
+  os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+  if output_format == "mp3":
+    shutil.copyfile(dialogue_path, args.output)
+  else:
+    seg.from_mp3(dialogue_path).export(args.output, format=output_format)
+
+  audio_seconds = seg.from_mp3(dialogue_path).duration_seconds
+  metrics["audio_seconds"] = round(audio_seconds, 3)
+  metrics["total_seconds"] = round(time.perf_counter() - started, 3)
+  metrics["lines_per_second"] = round(len(job.lines) / max(metrics["synthesis_seconds"], 1e-9), 3)
+  metrics["real_time_factor"] = round(metrics["synthesis_seconds"] / max(audio_seconds, 1e-9), 3)
+  metrics["output"] = args.output
+  return metrics
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+  parser = argparse.ArgumentParser(prog="python -m diatribe.cli", description="Render a dialogue script or project zip to audio.")
+  parser.add_argument("input", help="a dialogue.txt script or an exported project zip")
+  parser.add_argument("--engine", default="Kokoro", help="the audio provider, e.g. Kokoro, Piper or 'Open AI'")
+  parser.add_argument("--options", help="JSON file with the provider options, API keys are read from the environment when missing")
+  parser.add_argument("--output", default="dialogue.mp3", help="where to write the final audio")
+  parser.add_argument("--gap", type=int, default=200, help="silence between lines in milliseconds")
+  parser.add_argument("--master", help="JSON file with the mastering edits applied to the whole dialogue")
+  parser.add_argument("--normalize", action="store_true", help="apply audiobook normalization")
+  parser.add_argument("--session", default=None, help="session id to render in, reuse it to resume a failed render")
+  parser.add_argument("--workspace", default=None, help="directory to render in instead of a session directory")
+  parser.add_argument("--workers", type=int, default=WORKER_COUNT, help="worker processes for local engines, each with a resident model")
+  parser.add_argument("--regenerate", action="store_true", help="synthesize every line even if audio exists")
+  parser.add_argument("--metrics", help="write the render timings as JSON to this file")
+  args = parser.parse_args(argv)
+  if args.workspace is None:
+    args.workspace = workspace_path(args.session or str(uuid.uuid4()))
+  return args
+
+
+def main(argv: list[str] | None = None) -> int:
+  load_dotenv()
+  args = parse_args(argv)
+  with use_workspace(args.workspace):
+    try:
+      metrics = render(args)
+    except Exception as e:
+      log(f"render failed: {e}")
+      return 1
+  log(f"rendered {metrics['lines']} lines to {metrics['output']} in {metrics['total_seconds']}s ({metrics['real_time_factor']}x real time)")
+  if args.metrics:
+    with open(args.metrics, "w") as f:
+      json.dump(metrics, f, indent=2)
+  else:
+    print(json.dumps(metrics, indent=2))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
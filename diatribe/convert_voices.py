@@ -0,0 +1,42 @@
+"""Convert the voice files of the local providers to safetensors so they can be memory mapped.
+
+  python -m diatribe.convert_voices
+
+Each `models/xtts/*.pt` and `models/parler/*.pt` gets a `.safetensors` file next to it,
+which the providers load instead of the .pt. Strings, like the Parler voice description,
+are kept in the file metadata.
+"""
+import sys, argparse, torch
+from pathlib import Path
+from safetensors.torch import save_file
+from diatribe.utils import log
+
+VOICE_FOLDERS = ["models/xtts", "models/parler"]
+
+
+def convert_voice(path: Path, overwrite: bool = False) -> Path | None:
+  output = path.with_suffix(".safetensors")
+  if output.exists() and not overwrite:
+    return None
+  voice = torch.load(path, map_location="cpu", weights_only=True)
+  tensors = {key: value.contiguous() for key, value in voice.items() if isinstance(value, torch.Tensor)}
+  metadata = {key: value for key, value in voice.items() if isinstance(value, str)}
+  save_file(tensors, str(output), metadata=metadata)
+  return output
+
+
+def main(argv: list[str] | None = None) -> int:
+  parser = argparse.ArgumentParser(prog="python -m diatribe.convert_voices", description="Convert voice files to safetensors.")
+  parser.add_argument("folders", nargs="*", default=VOICE_FOLDERS, help="folders of .pt voice files")
+  parser.add_argument("--overwrite", action="store_true", help="convert voices that were already converted")
+  args = parser.parse_args(argv)
+  for folder in args.folders:
+    for path in sorted(Path(folder).glob("*.pt")):
+      output = convert_voice(path, args.overwrite)
+      if output is not None:
+        log(f"converted {path} to {output}")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,8 +1,9 @@
-import os, re
+import os, re, uuid, hashlib
 import pandas as pd
-import streamlit as st
 from diatribe.utils import log
 from diatribe.audio_providers.audio_provider import AudioProvider
+from diatribe.workspace import session_path
+from diatribe.lazy_streamlit import st
 
 class Character:
   def __init__(self, name: str, voice: str, voice_id: str, description: str = "", group: int = 1) -> None:
@@ -29,11 +30,12 @@ class Character:
 
 
 class Dialogue:
-  def __init__(self, character: Character, line: int, text: str, description: str = ""):
+  def __init__(self, character: Character, line: int, text: str, description: str = "", row_id: str | None = None):
     self.character = character
     self.line = line
     self.text = text
     self.description = description
+    self.row_id = row_id
 
   def get_guidance(self) -> str:
     character_guidance = self.character.description
@@ -148,7 +150,7 @@ def export_dialogue(
   dialogue: pd.DataFrame, 
   audio_provider: AudioProvider
 ) -> str:
-  save_filename = f"./session/{st.session_state.session_id}/export/dialogue.txt"
+  save_filename = session_path("export/dialogue.txt")
   plot = st.session_state["plot"] if "plot" in st.session_state else None
   dialogue_details = generate_dialogue_details(characters, dialogue, audio_provider, plot=plot)
   dialogue_export = convert_dialogue_details_into_export(dialogue_details)
@@ -172,5 +174,30 @@ def characters_match(characters: pd.DataFrame, dialogue: pd.DataFrame) -> bool:
       break # only need to find one
   return not missing
 
+def with_row_ids(dialogue_df: pd.DataFrame) -> pd.DataFrame:
+  """Give every dialogue row a hidden ID, so its audio can follow it when rows are added or removed."""
+  if "ID" in dialogue_df.columns and dialogue_df["ID"].notna().all():
+    return dialogue_df
+  dialogue_df = dialogue_df.copy()
+  if "ID" not in dialogue_df.columns:
+    dialogue_df.insert(0, "ID", None)
+  missing = dialogue_df["ID"].isna()
+  dialogue_df.loc[missing, "ID"] = [uuid.uuid4().hex for _ in range(missing.sum())]
+  return dialogue_df
+
+def row_id(row: pd.Series, taken: set[str]) -> str:
+  """Return the ID of a dialogue row, derived from its content for rows added in the table."""
+  if "ID" in row and isinstance(row["ID"], str) and row["ID"] not in taken:
+    taken.add(row["ID"])
+    return row["ID"]
+  content = f"{row['Speaker']}|{row['Text']}|{row.get('Description')}"
+  base_id = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+  new_id, n = base_id, 1
+  while new_id in taken:
+    n += 1
+    new_id = f"{base_id}-{n}"
+  taken.add(new_id)
+  return new_id
+
 def get_lines(dialogues: list[Dialogue]) -> list[int]:
   return [d.line for d in dialogues]
\ No newline at end of file
@@ -0,0 +1,276 @@
+import os, shutil
+import diatribe.audio_tools as audio_tools
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+from diatribe.utils import log
+from diatribe.cancellation import check_cancelled, wait_for
+from diatribe import session_files
+from diatribe.dialogues import Dialogue
+from diatribe.audio_providers.audio_provider import AudioProvider
+from diatribe.worker_pool import WorkerPool
+from diatribe.blob_store import get_blob_store
+from diatribe.workspace import session_path, use_workspace, workspace_path
+
+
+@dataclass
+class RenderContext:
+  """Everything a render needs besides the engine: where to write and how to synthesize."""
+  workspace: str
+  options: dict = field(default_factory=dict)
+  join_gap: int = 200
+  reuse: bool = True
+  preview: bool = False
+
+  @classmethod
+  def for_session(cls, session_id: str, options: dict, **kwargs) -> "RenderContext":
+    return cls(workspace_path(session_id), options, **kwargs)
+
+
+@dataclass
+class SynthesisRequest:
+  text: str
+  voice_id: str
+  line: int
+  guidance: str | None = None
+
+  @classmethod
+  def from_dialogue(cls, line: Dialogue) -> "SynthesisRequest":
+    return cls(line.text, line.character.voice_id, line.line, line.get_guidance())
+
+
+class DiatribeEngine:
+  """Renders dialogues with a provider without depending on Streamlit.
+
+  The engine holds no per-render state, so a single engine and its loaded model can be
+  shared by threads rendering different workspaces. Every call runs inside the
+  workspace of its `RenderContext`, and Streamlit, the job queue and the command line
+  are clients of it. With a worker pool the lines are synthesized in parallel by
+  worker processes.
+  """
+  def __init__(self, provider: AudioProvider, pool: WorkerPool | None = None) -> None:
+    self.provider = provider
+    self.pool = pool
+
+  def options(self, context: RenderContext) -> dict:
+    """Return the context options on top of the provider defaults."""
+    return {**self.provider.default_options(), **context.options}
+
+  def synthesize_line(self, context: RenderContext, line: Dialogue, reuse: bool | None = None) -> str:
+    """Synthesize the audio of one line and return its path."""
+    return self.synthesize_text(
+      context,
+      line.text,
+      line.character.voice_id,
+      line.line,
+      guidance=line.get_guidance(),
+      reuse=reuse
+    )
+
+  def synthesize_text(
+    self,
+    context: RenderContext,
+    text: str,
+    voice_id: str,
+    line: int,
+    guidance: str | None = None,
+    reuse: bool | None = None
+  ) -> str:
+    with use_workspace(context.workspace):
+      return audio_tools.generate_line_audio(
+        self.provider,
+        text,
+        voice_id,
+        line,
+        self.options(context),
+        guidance=guidance,
+        reuse=context.reuse if reuse is None else reuse
+      )
+
+  def synthesize_each(
+    self,
+    context: RenderContext,
+    requests: list[SynthesisRequest],
+    reuse: bool | None = None
+  ) -> Iterator[tuple[SynthesisRequest, str | Exception]]:
+    """Synthesize the requests and yield each with its audio path, or its error, in request order.
+
+    Cancelling stops before the next line. A worker pool is only handed about one line per worker
+    ahead of the caller, and the lines not yet started are dropped on cancelling.
+    """
+    reuse = context.reuse if reuse is None else reuse
+    if self.pool is None:
+      for request in requests:
+        check_cancelled()
+        try:
+          yield request, self.synthesize_text(context, request.text, request.voice_id, request.line, request.guidance, reuse)
+        except Exception as e:
+          yield request, e
+      return
+
+    options = self.options(context)
+    def submit(request: SynthesisRequest) -> tuple[SynthesisRequest, str | None, list[Future], list]:
+      with use_workspace(context.workspace):
+        audio_file = None
+        if reuse:
+          audio_file = audio_tools.reuse_line_audio(self.provider, request.text, request.voice_id, request.line, options, request.guidance)
+        futures = []
+        chunks = []
+        if audio_file is None:
+          # the chunks of a long line are spread over the workers like separate lines
+          chunks = audio_tools.line_chunks(self.provider, request.text, request.line)
+          if chunks:
+            futures = [self.pool.submit(workspace, chunk, request.voice_id, 0, options, request.guidance) for chunk, workspace in chunks]
+          else:
+            futures = [self.pool.submit(context.workspace, request.text, request.voice_id, request.line, options, request.guidance)]
+        return request, audio_file, futures, chunks
+
+    # only keep the workers busy, so work queued between lines isn't stuck behind the whole dialogue
+    remaining = iter(requests)
+    pending: deque = deque()
+    def fill() -> None:
+      while sum(len(futures) for _, _, futures, _ in pending) < self.pool.workers:
+        request = next(remaining, None)
+        if request is None:
+          return
+        try:
+          pending.append(submit(request))
+        except Exception as e:
+          # the error is this line's result when it is waited for, the other lines still render
+          failed = Future()
+          failed.set_exception(e)
+          pending.append((request, None, [failed], []))
+
+    try:
+      fill()
+      while pending:
+        request, audio_file, futures, chunks = pending.popleft()
+        try:
+          with use_workspace(context.workspace):
+            if chunks:
+              audio_file = audio_tools.stitch_line_chunks([session_files.track(wait_for(future)) for future in futures], request.line, options)
+            elif futures:
+              audio_file = session_files.track(wait_for(futures[0]))
+            result = audio_tools.store_line_audio(self.provider, request.text, request.voice_id, options, audio_file, request.guidance)
+        except Exception as e:
+          result = e
+        fill()
+        yield request, result
+    finally:
+      for _, _, futures, _ in pending:
+        for future in futures:
+          future.cancel()
+
+  def changed_lines(self, context: RenderContext, dialogue: list[Dialogue]) -> list[Dialogue]:
+    """Keep the audio of the lines unchanged since they were generated and return the lines that changed."""
+    options = self.options(context)
+    with use_workspace(context.workspace):
+      rows = [
+        (line.row_id, line.line, audio_tools.synthesis_key(self.provider, line.text, line.character.voice_id, options, line.get_guidance()))
+        for line in dialogue
+      ]
+      changed = set(audio_tools.keep_unchanged_lines(rows))
+    return [line for line in dialogue if line.line in changed]
+
+  def speculate(self, context: RenderContext, line: Dialogue) -> bool:
+    """Synthesize a line into the synthesis cache before anyone asks for it.
+
+    The session is left alone, generating the line later simply reuses the audio.
+    Returns whether the line had to be synthesized.
+    """
+    options = self.options(context)
+    request = SynthesisRequest.from_dialogue(line)
+    with use_workspace(context.workspace):
+      key = audio_tools.synthesis_key(self.provider, request.text, request.voice_id, options, request.guidance)
+      if get_blob_store().lookup(key) is not None:
+        return False
+      scratch = session_path(f"speculative/{key[:16]}")
+    try:
+      with use_workspace(scratch):
+        chunks = audio_tools.line_chunks(self.provider, request.text, 0)
+        if self.pool is None:
+          audio_file = audio_tools.synthesize_line_file(self.provider, request.text, request.voice_id, 0, options, request.guidance)
+        elif chunks:
+          futures = [self.pool.submit(workspace, chunk, request.voice_id, 0, options, request.guidance) for chunk, workspace in chunks]
+          audio_file = audio_tools.stitch_line_chunks([session_files.track(wait_for(future)) for future in futures], 0, options)
+        else:
+          audio_file = session_files.track(wait_for(self.pool.submit(scratch, request.text, request.voice_id, 0, options, request.guidance)))
+        audio_tools.cache_line_audio(key, audio_file)
+    finally:
+      shutil.rmtree(scratch, ignore_errors=True)
+    log(f"pre-generated line {line.line}")
+    return True
+
+  def synthesize(
+    self,
+    context: RenderContext,
+    dialogue: list[Dialogue],
+    progress: Callable[[float, str], None] | None = None
+  ) -> list[str]:
+    """Synthesize every line and return the audio paths in order."""
+    audio_files = []
+    requests = [SynthesisRequest.from_dialogue(line) for line in dialogue]
+    for i, (_, result) in enumerate(self.synthesize_each(context, requests)):
+      if isinstance(result, Exception):
+        raise result
+      audio_files.append(result)
+      if progress is not None:
+        progress(round((i+1) / len(dialogue), 2), "Generating audio...")
+    return audio_files
+
+  def join(
+    self,
+    context: RenderContext,
+    lines: list[int],
+    progress: Callable[[float, str], None] | None = None
+  ) -> str:
+    """Join the line audio into the final dialogue and return its path."""
+    with use_workspace(context.workspace):
+      return audio_tools.join_dialogue_audio(lines, context.join_gap, progress=progress)
+
+  def running_join(self, context: RenderContext, lines: list[int], pending: list[int] = []) -> audio_tools.RunningJoin:
+    """Start joining the dialogue, so the pending lines are joined as they are synthesized."""
+    with use_workspace(context.workspace):
+      return audio_tools.RunningJoin(lines, context.join_gap, pending, preview=context.preview)
+
+  def master(
+    self,
+    context: RenderContext,
+    lines: list[int],
+    soundboard: audio_tools.Soundboard,
+    affected_lines: list[int] | None = None
+  ) -> str:
+    """Apply the soundboard to the final dialogue, to the whole of it unless lines are given."""
+    with use_workspace(context.workspace):
+      audio_tools.apply_mastered_audio(
+        affected_lines or lines,
+        lines,
+        soundboard,
+        context.join_gap,
+        whole=affected_lines is None
+      )
+    return self.dialogue_path(context)
+
+  def export(self, context: RenderContext, lines: list[int], include_dialogue: bool = True) -> str:
+    """Collect the line and final audio into the export folder and return it."""
+    with use_workspace(context.workspace):
+      return audio_tools.export_audio(lines, include_dialogue)
+
+  def dialogue_path(self, context: RenderContext) -> str:
+    return f"{context.workspace}/final/audio/dialogue.mp3"
+
+  def render(
+    self,
+    context: RenderContext,
+    dialogue: list[Dialogue],
+    soundboard: audio_tools.Soundboard | None = None
+  ) -> str:
+    """Synthesize, join and optionally master the dialogue, returning the final audio path."""
+    lines = [d.line for d in dialogue]
+    self.synthesize(context, dialogue)
+    dialogue_path = self.join(context, lines)
+    if soundboard is not None and soundboard.is_enabled():
+      dialogue_path = self.master(context, lines, soundboard)
+    log(f"rendered {len(lines)} lines in {os.path.abspath(context.workspace)}")
+    return dialogue_path
@@ -1,12 +1,23 @@
-import json
+import os, copy, json, time, hashlib, functools, dataclasses
 import streamlit as st
 import pandas as pd
+from typing import Iterator
 from diatribe.dialogues import Character, Dialogue
-from openai import OpenAI
+from openai import OpenAI, BadRequestError
 from jsonschema import validate
 from diatribe.utils import log
+from diatribe import session_files
 from diatribe.sidebar import SidebarData
 from diatribe.saved_dialogues import SavedDialogueData
+from diatribe.json_stream import ArrayItemParser
+from diatribe.workspace import session_path
+from diatribe.llm_cache import get_llm_cache
+
+# continuing a long dialogue only sends this many of its last lines, the earlier lines are summarized
+CONTEXT_LINES = int(os.getenv("DIATRIBE_CONTEXT_LINES", "20"))
+# the summary is bookkeeping, so it is written steadily and kept short whatever the dialogue settings
+SUMMARY_TEMPERATURE = 0.2
+SUMMARY_MAX_TOKENS = 500
 
 openai_dialogue_schema = {
   "type": "object",
@@ -37,43 +48,174 @@ openai_dialogue_schema = {
   }
 }
 
-def generate_dialogue(system_prompt: str, input_prompt: str, sidebar: SidebarData) -> str:
-  """Generate the dialogue using OpenAI."""
-  client = OpenAI(api_key=sidebar.openai_api_key, timeout=180)  
+# models that turned down structured output, they are asked for plain JSON instead
+_unstructured_models: set[str] = set()
+
+def _strict(schema: dict) -> None:
+  """Require every property and nothing else, as strict structured output needs."""
+  if schema.get("type") == "object":
+    schema["required"] = list(schema["properties"])
+    schema["additionalProperties"] = False
+    for child in schema["properties"].values():
+      _strict(child)
+  elif schema.get("type") == "array":
+    _strict(schema["items"])
+
+def _rejects_response_format(e: BadRequestError) -> bool:
+  """Whether OpenAI turned the request down for its structured output, not e.g. for its length."""
+  param = getattr(e, "param", None)
+  if param is not None:
+    return str(param).startswith("response_format")
+  return "response_format" in str(getattr(e, "message", None) or e)
+
+def dialogue_response_format(characters: list[Character]) -> dict:
+  """Return openai_dialogue_schema as strict structured output that only allows the characters as speakers."""
+  schema = copy.deepcopy(openai_dialogue_schema)
+  names = [c.name for c in characters]
+  if names:
+    schema["properties"]["characters"]["items"]["enum"] = names
+    schema["properties"]["dialogue"]["items"]["properties"]["Speaker"]["enum"] = names
+  _strict(schema)
+  return {
+    "type": "json_schema",
+    "json_schema": {"name": "dialogue", "strict": True, "schema": schema}
+  }
+
+def chat_request(system_prompt: str, input_prompt: str, sidebar: SidebarData, response_format: dict | None = None) -> dict:
   messages = [
     {"role": "system", "content": system_prompt},
     {"role": "user", "content": input_prompt}
   ]
-  chat_options = {
+  request = {
     "model": sidebar.openai_model,
     "temperature": sidebar.openai_temp,
     "max_tokens": sidebar.openai_max_tokens,
+    "messages": messages
   }
-  
-  response = client.chat.completions.create(
-    **chat_options,
-    messages=messages
-  )
+  if response_format is not None and sidebar.openai_model not in _unstructured_models:
+    request["response_format"] = response_format
+  return request
+
+def generate_dialogue(system_prompt: str, input_prompt: str, sidebar: SidebarData) -> str:
+  """Generate the dialogue using OpenAI, reusing the response of an identical request if allowed."""
+  request = chat_request(system_prompt, input_prompt, sidebar)
+  cache = get_llm_cache()
+  if sidebar.openai_reuse:
+    cached = cache.get(request)
+    if cached is not None:
+      return cached
+  started = time.perf_counter()
+  client = OpenAI(api_key=sidebar.openai_api_key, timeout=180)  
+  response = client.chat.completions.create(**request)
+  cache.record_usage(response.usage)
   new_dialogue = response.choices[0].message.content
+  # a response cut short, e.g. by the token limit, is not worth reusing
+  if response.choices[0].finish_reason == "stop":
+    cache.put(request, new_dialogue, time.perf_counter() - started)
   return new_dialogue
 
+def stream_dialogue(
+  system_prompt: str, 
+  input_prompt: str, 
+  sidebar: SidebarData, 
+  response_format: dict | None = None
+) -> Iterator[str]:
+  """Generate the dialogue using OpenAI, yielding the text as it is written."""
+  request = chat_request(system_prompt, input_prompt, sidebar, response_format)
+  cache = get_llm_cache()
+  if sidebar.openai_reuse:
+    cached = cache.get(request)
+    if cached is not None:
+      yield cached
+      return
+  started = time.perf_counter()
+  client = OpenAI(api_key=sidebar.openai_api_key, timeout=180)
+  try:
+    response = client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+  except BadRequestError as e:
+    if "response_format" not in request or not _rejects_response_format(e):
+      raise
+    log(f"{request['model']} does not take structured output, asking for plain JSON: {e}")
+    _unstructured_models.add(request["model"])
+    yield from stream_dialogue(system_prompt, input_prompt, sidebar)
+    return
+  new_dialogue = ""
+  finish_reason = None
+  for chunk in response:
+    if chunk.usage is not None:
+      cache.record_usage(chunk.usage)
+    if chunk.choices and getattr(chunk.choices[0].delta, "refusal", None):
+      raise ValueError(f"OpenAI refused to write the dialogue: {chunk.choices[0].delta.refusal}")
+    if chunk.choices and chunk.choices[0].finish_reason:
+      finish_reason = chunk.choices[0].finish_reason
+    if chunk.choices and chunk.choices[0].delta.content:
+      new_dialogue += chunk.choices[0].delta.content
+      yield chunk.choices[0].delta.content
+  # a response cut short, e.g. by the token limit, is not worth reusing
+  if finish_reason == "stop":
+    cache.put(request, new_dialogue, time.perf_counter() - started)
+
+def generate_dialogue_lines(
+  system_prompt: str, 
+  input_prompt: str, 
+  sidebar: SidebarData, 
+  characters: list[Character]
+) -> Iterator[dict]:
+  """Yield every line of a known character as soon as OpenAI has finished writing it.
+
+  The response is constrained to the dialogue schema with the characters as the only speakers.
+  A response cut short, e.g. by the token limit, keeps the lines it finished.
+  """
+  parser = ArrayItemParser("dialogue")
+  names = [c.name for c in characters]
+  produced = 0
+  for text in stream_dialogue(system_prompt, input_prompt, sidebar, dialogue_response_format(characters)):
+    for line in parser.feed(text):
+      if line.get("Speaker") in names and isinstance(line.get("Text"), str):
+        produced += 1
+        yield { "Speaker": line["Speaker"], "Text": line["Text"] }
+  try:
+    validate(instance=json.loads(parser.text), schema=openai_dialogue_schema)
+  except Exception as e:
+    if produced == 0:
+      raise
+    try:
+      validate(instance=json.loads(parser.repaired()), schema=openai_dialogue_schema)
+      log(f"repaired a response cut short after {produced} lines: {e}")
+    except Exception:
+      log(f"kept {produced} lines of an invalid response: {e}")
+
+def show_streamed_lines(lines: Iterator[dict]) -> list[dict]:
+  """Show the lines in a table that grows while they are generated."""
+  table = st.empty()
+  streamed = []
+  for line in lines:
+    streamed.append(line)
+    table.dataframe(pd.DataFrame(streamed, columns=["Speaker", "Text"]), hide_index=True, width='stretch')
+  table.empty()
+  return streamed
+
+@functools.cache
+def load_prompt(name: str) -> str:
+  """Load a prompt once, it is the same text for every request so OpenAI can cache it."""
+  with open(f"prompts/{name}", "r") as f:
+    return f.read()
+
 def load_dialogue_system_prompt() -> str:
   """Load the dialogue system prompt from the file."""
-  with open("prompts/openai_dialogue_system_prompt.txt", "r") as f:
-    system_prompt = f.read()
-    return system_prompt
+  return load_prompt("openai_dialogue_system_prompt.txt")
   
 def load_continue_dialogue_system_prompt() -> str:
   """Load the continue dialogue system prompt from the file."""
-  with open("prompts/openai_continue_system_prompt.txt", "r") as f:
-    system_prompt = f.read()
-    return system_prompt
+  return load_prompt("openai_continue_system_prompt.txt")
     
+def load_summary_system_prompt() -> str:
+  """Load the summary system prompt from the file."""
+  return load_prompt("openai_summary_system_prompt.txt")
+
 def load_plot_system_prompt() -> str:
   """Load the plot system prompt from the file."""
-  with open("prompts/openai_plot_system_prompt.txt", "r") as f:
-    system_prompt = f.read()
-    return system_prompt
+  return load_prompt("openai_plot_system_prompt.txt")
 
 def generate_plot_input_prompt(characters: list[Character]) -> dict:
   input_prompt = "CHARACTERS:\n"
@@ -82,44 +224,99 @@ def generate_plot_input_prompt(characters: list[Character]) -> dict:
   
   return input_prompt
 
-def generate_dialogue_input_prompt(characters: list[Character], number_of_lines: int, plot: str) -> dict:
-  input_prompt = f"NUMBER OF LINES:\n<Lines>{number_of_lines}</Lines>\n\n\n"
-  input_prompt += generate_plot_input_prompt(characters)
+def generate_story_input_prompt(characters: list[Character], plot: str) -> str:
+  input_prompt = generate_plot_input_prompt(characters)
   input_prompt += f"PLOT:\n<Plot>{plot}</Plot>\n\n\n"
   return input_prompt
+
+def generate_number_of_lines_prompt(number_of_lines: int) -> str:
+  return f"NUMBER OF LINES:\n<Lines>{number_of_lines}</Lines>\n\n\n"
+
+# the parts that change least come first, so requests share the longest prefix OpenAI can cache
+def generate_dialogue_input_prompt(characters: list[Character], number_of_lines: int, plot: str) -> dict:
+  input_prompt = generate_story_input_prompt(characters, plot)
+  input_prompt += generate_number_of_lines_prompt(number_of_lines)
+  return input_prompt
   
-def generate_continue_dialogue_input_prompt(characters: list[Character], number_of_lines: int, plot: str, dialogue: list[Dialogue]) -> dict:
-  input_prompt = generate_dialogue_input_prompt(characters, number_of_lines, plot)
-  input_prompt += f"EXISTING LINES:\n"
+def generate_lines_input_prompt(dialogue: list[Dialogue]) -> str:
+  input_prompt = ""
   for line in dialogue:
     input_prompt += f"<Dialogue><Speaker>{line.character.name}</Speaker>\n<Number>{line.line}</Number><Text>{line.text}</Text></Dialogue>\n\n\n"
   return input_prompt
 
+def generate_continue_dialogue_input_prompt(
+  characters: list[Character], 
+  number_of_lines: int, 
+  plot: str, 
+  dialogue: list[Dialogue],
+  summary: str | None = None
+) -> dict:
+  input_prompt = generate_story_input_prompt(characters, plot)
+  if summary:
+    input_prompt += f"STORY SO FAR:\n<Summary>{summary}</Summary>\n\n\n"
+  input_prompt += f"EXISTING LINES:\n"
+  input_prompt += generate_lines_input_prompt(dialogue)
+  input_prompt += generate_number_of_lines_prompt(number_of_lines)
+  return input_prompt
+
+def line_digest(line: Dialogue) -> str:
+  return hashlib.sha1(f"{line.character.name}|{line.text}".encode("utf-8")).hexdigest()[:16]
+
+def summarize_earlier_lines(sidebar: SidebarData, plot: str, earlier: list[Dialogue]) -> str | None:
+  """Return a summary of the lines, updating the summary of the session with the lines it is missing.
+
+  The lines already summarized are remembered, so every continuation only summarizes the
+  lines that dropped out of the context since the last one.
+  """
+  if len(earlier) == 0:
+    return None
+  path = session_path("summary.json")
+  cached = {"lines": [], "summary": ""}
+  if os.path.exists(path):
+    with open(path, "r") as f:
+      cached = json.load(f)
+  digests = [line_digest(line) for line in earlier]
+  if digests[:len(cached["lines"])] != cached["lines"]:
+    # an earlier line was edited, so the summary starts over
+    cached = {"lines": [], "summary": ""}
+  summary = cached["summary"]
+  system_prompt = load_summary_system_prompt()
+  summary_sidebar = dataclasses.replace(sidebar, openai_temp=SUMMARY_TEMPERATURE, openai_max_tokens=SUMMARY_MAX_TOKENS)
+  for start in range(len(cached["lines"]), len(earlier), CONTEXT_LINES):
+    batch = earlier[start:start + CONTEXT_LINES]
+    input_prompt = f"PLOT:\n<Plot>{plot}</Plot>\n\n\n"
+    input_prompt += f"STORY SO FAR:\n<Summary>{summary}</Summary>\n\n\n"
+    input_prompt += f"NEW LINES:\n{generate_lines_input_prompt(batch)}"
+    summary = generate_dialogue(system_prompt, input_prompt, summary_sidebar).strip()
+    log(f"summarized lines {batch[0].line} to {batch[-1].line}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      json.dump({"lines": digests[:start + len(batch)], "summary": summary}, f)
+    session_files.track(path)
+  return summary
+
 def create_continue_dialogue(sidebar: SidebarData, characters: list[Character], dialogue: list[Dialogue]) -> pd.DataFrame:
   with st.spinner("Generating dialogue..."):
-    input_prompt = generate_continue_dialogue_input_prompt(
-      characters, 
-      st.session_state["number_of_lines"] if "number_of_lines" in st.session_state else 10, 
-      st.session_state["plot"] if "plot" in st.session_state else "", 
-      dialogue
-    )
+    plot = st.session_state["plot"] if "plot" in st.session_state else ""
     system_prompt = load_continue_dialogue_system_prompt()
     try:
+      earlier, recent = dialogue[:-CONTEXT_LINES], dialogue[-CONTEXT_LINES:]
+      input_prompt = generate_continue_dialogue_input_prompt(
+        characters, 
+        st.session_state["number_of_lines"] if "number_of_lines" in st.session_state else 10, 
+        plot, 
+        recent,
+        summary=summarize_earlier_lines(sidebar, plot, earlier)
+      )
       if "audio_files" in st.session_state:
         del st.session_state["audio_files"]
       if "final_audio" in st.session_state:
         del st.session_state["final_audio"]
         
-      lines = [d.to_dict(without_line=True) for d in dialogue]
-      dialogue = generate_dialogue(system_prompt, input_prompt, sidebar)
-      dialogue = json.loads(dialogue)
-      validate(instance=dialogue, schema=openai_dialogue_schema)
-      for line in dialogue["dialogue"]:
-        character_found = next((c for c in characters if c.name == line["Speaker"]), None)
-        if character_found:
-          lines.append({ "Speaker": line["Speaker"], "Text": line["Text"] })
+      lines = [{"ID": d.row_id, **d.to_dict(without_line=True)} for d in dialogue]
+      lines += show_streamed_lines(generate_dialogue_lines(system_prompt, input_prompt, sidebar, characters))
       log(f"continued lines produced: {len(lines)}")
-      result = pd.DataFrame(lines, columns=["Speaker", "Text"])
+      result = pd.DataFrame(lines, columns=["ID", "Speaker", "Text"])
       return result
     except Exception as e:
       log(e)
@@ -176,14 +373,7 @@ def create_dialogue_generation(sidebar: SidebarData, saves: SavedDialogueData, c
             if "final_audio" in st.session_state:
               del st.session_state["final_audio"]
               
-            dialogue = generate_dialogue(system_prompt, input_prompt, sidebar)
-            dialogue = json.loads(dialogue)
-            validate(instance=dialogue, schema=openai_dialogue_schema)
-            lines = []
-            for line in dialogue["dialogue"]:
-              character_found = next((c for c in characters if c.name == line["Speaker"]), None)
-              if character_found:
-                lines.append({ "Speaker": line["Speaker"], "Text": line["Text"] })
+            lines = show_streamed_lines(generate_dialogue_lines(system_prompt, input_prompt, sidebar, characters))
             log(f"lines produced: {len(lines)}")
             result = pd.DataFrame(lines, columns=["Speaker", "Text"])
           except Exception as e:
@@ -0,0 +1,397 @@
+import os, glob, json, queue, threading, time, uuid, itertools
+from concurrent.futures import Future
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable
+from diatribe.utils import log
+from diatribe import session_files
+from diatribe.dialogues import Dialogue
+from diatribe.engine import DiatribeEngine, RenderContext, SynthesisRequest
+from diatribe.workspace import SESSION_ROOT, use_workspace
+from diatribe.audio_tools import RunningJoin
+from diatribe.cancellation import CancellationToken, Cancelled, check_cancelled, sleep_cancellable, use_cancellation
+from diatribe.lazy_streamlit import cache_resource
+
+JOB_POLL_SECONDS = 1.0
+RETRY_ATTEMPTS = int(os.getenv("DIATRIBE_RETRY_ATTEMPTS", "3"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("DIATRIBE_RETRY_BACKOFF_SECONDS", "2"))
+
+# lower runs first: single lines someone is waiting on go ahead of redos and whole dialogues,
+# and lines nobody has asked for yet only run when there is nothing else to do
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REDO = 1
+PRIORITY_BULK = 2
+PRIORITY_SPECULATIVE = 3
+
+
+@dataclass
+class LineStatus:
+  line: int
+  speaker: str
+  text: str
+  voice_id: str
+  guidance: str | None = None
+  status: str = "pending"
+  audio_file: str | None = None
+  error: str | None = None
+  attempts: int = 0
+
+
+@dataclass
+class GenerationJob:
+  id: str
+  workspace: str
+  provider: str
+  options: dict
+  lines: list[LineStatus]
+  status: str = "queued"
+  created: float = field(default_factory=time.time)
+  join_lines: list[int] = field(default_factory=list)
+  dialogue: str | None = None
+  # digest of what the job renders, so resuming it can tell whether that has changed
+  source: str | None = None
+
+  @property
+  def active(self) -> bool:
+    return self.status in ("queued", "running")
+
+  @property
+  def resumable(self) -> bool:
+    return self.status in ("interrupted", "failed", "cancelled") and len(self.remaining_lines()) > 0
+
+  def finished_lines(self) -> list[LineStatus]:
+    return [line for line in self.lines if line.status == "done"]
+
+  def failed_lines(self) -> list[LineStatus]:
+    return [line for line in self.lines if line.status == "failed"]
+
+  def remaining_lines(self) -> list[LineStatus]:
+    """Return the lines still to generate, including finished lines whose audio has gone missing."""
+    return [
+      line for line in self.lines
+      if line.status != "done" or line.audio_file is None or not os.path.exists(line.audio_file)
+    ]
+
+  def progress(self) -> float:
+    if len(self.lines) == 0:
+      return 1.0
+    return round(len(self.finished_lines()) / len(self.lines), 2)
+
+  @classmethod
+  def from_dict(cls, data: dict) -> "GenerationJob":
+    data = dict(data)
+    data["lines"] = [LineStatus(**line) for line in data["lines"]]
+    return cls(**data)
+
+
+def job_path(workspace: str, job_id: str) -> str:
+  return f"{workspace}/jobs/{job_id}.json"
+
+
+def save_job(job: GenerationJob) -> None:
+  """Persist the job and its per-line status to its workspace."""
+  path = job_path(job.workspace, job.id)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  temp_path = f"{path}.tmp"
+  with open(temp_path, "w") as f:
+    json.dump(asdict(job), f)
+  os.replace(temp_path, path)
+  session_files.track(path)
+
+
+def load_job(workspace: str, job_id: str) -> GenerationJob | None:
+  path = job_path(workspace, job_id)
+  if not os.path.exists(path):
+    return None
+  with open(path, "r") as f:
+    return GenerationJob.from_dict(json.load(f))
+
+
+def create_job(
+  engine: DiatribeEngine,
+  context: RenderContext,
+  dialogue: list[Dialogue],
+  join_lines: list[int] | None = None,
+  source: str | None = None
+) -> GenerationJob:
+  """Create and persist a job for the dialogue lines, joining `join_lines` as they finish."""
+  job = GenerationJob(
+    id=str(uuid.uuid4()),
+    workspace=context.workspace,
+    provider=engine.provider.name,
+    options={k: v for k, v in context.options.items() if k != "api_key"},
+    lines=[
+      LineStatus(line.line, line.character.name, line.text, line.character.voice_id, line.get_guidance())
+      for line in dialogue
+    ],
+    join_lines=join_lines or [],
+    source=source
+  )
+  save_job(job)
+  return job
+
+
+def reset_job(job: GenerationJob) -> GenerationJob:
+  """Mark the failed and unfinished lines of a job as pending again."""
+  for line in job.remaining_lines():
+    line.status = "pending"
+    line.error = None
+    line.attempts = 0
+  job.status = "queued"
+  save_job(job)
+  return job
+
+
+def process_job(
+  job: GenerationJob,
+  engine: DiatribeEngine,
+  context: RenderContext,
+  between_lines: Callable[[], None] | None = None,
+  cancellation: CancellationToken | None = None
+) -> GenerationJob:
+  """Generate the pending lines of the job, retrying failed lines with backoff.
+
+  With `join_lines` the dialogue is joined while the lines are generated, so it is ready
+  when the last line is. `between_lines` is called after every line, which is where more
+  urgent work can cut in. Cancelling the token stops the job with its finished lines kept,
+  so it can be resumed.
+  """
+  job.status = "running"
+  job.dialogue = None
+  save_job(job)
+  running_join = None
+  if job.join_lines:
+    pending = [line.line for line in job.lines if line.status != "done"]
+    running_join = engine.running_join(context, job.join_lines, pending)
+  try:
+    with use_cancellation(cancellation):
+      for attempt in range(max(1, RETRY_ATTEMPTS)):
+        check_cancelled()
+        pending = [line for line in job.lines if line.status != "done"]
+        if len(pending) == 0:
+          break
+        if attempt > 0:
+          delay = RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+          log(f"retrying {len(pending)} failed lines of job {job.id} in {delay:.1f}s")
+          sleep_cancellable(delay)
+        _generate_lines(job, pending, engine, context, running_join, between_lines)
+  except Cancelled:
+    if running_join is not None:
+      running_join.close()
+    for line in job.lines:
+      if line.status == "running":
+        line.status = "pending"
+    job.status = "cancelled"
+    save_job(job)
+    log(f"generation job {job.id} was cancelled with {len(job.remaining_lines())} lines left")
+    return job
+  except Exception:
+    if running_join is not None:
+      running_join.close()
+    raise
+
+  failed = job.failed_lines()
+  if running_join is not None:
+    if failed:
+      running_join.close()
+    else:
+      job.dialogue = running_join.finish()
+  job.status = "failed" if failed else "done"
+  save_job(job)
+  log(f"generation job {job.id} finished with {len(failed)} failed lines")
+  return job
+
+
+def _generate_lines(
+  job: GenerationJob,
+  lines: list[LineStatus],
+  engine: DiatribeEngine,
+  context: RenderContext,
+  running_join: RunningJoin | None = None,
+  between_lines: Callable[[], None] | None = None
+) -> None:
+  for line in lines:
+    line.status = "running"
+    line.attempts += 1
+  save_job(job)
+  by_line = {line.line: line for line in lines}
+  requests = [SynthesisRequest(line.text, line.voice_id, line.line, line.guidance) for line in lines]
+  for request, result in engine.synthesize_each(context, requests):
+    line = by_line[request.line]
+    if isinstance(result, Exception):
+      log(f"line {line.line} failed on attempt {line.attempts}: {result}")
+      line.status = "failed"
+      line.error = str(result)
+    else:
+      line.audio_file = result
+      line.status = "done"
+      line.error = None
+      if running_join is not None:
+        running_join.add(line.line, result)
+    save_job(job)
+    if between_lines is not None:
+      between_lines()
+
+
+def workspace_jobs(workspace: str) -> list[GenerationJob]:
+  jobs = [load_job(workspace, os.path.basename(p).replace(".json", "")) for p in glob.glob(job_path(workspace, "*"))]
+  return [job for job in jobs if job is not None]
+
+
+def latest_job(workspace: str) -> GenerationJob | None:
+  """Return the most recently submitted job of the workspace."""
+  jobs = workspace_jobs(workspace)
+  if len(jobs) == 0:
+    return None
+  return max(jobs, key=lambda job: job.created)
+
+
+def active_job(workspace: str) -> GenerationJob | None:
+  """Return the queued or running job of the workspace, which owns its audio folder until it is done."""
+  return next((job for job in workspace_jobs(workspace) if job.active), None)
+
+
+@dataclass(order=True)
+class _Task:
+  priority: int
+  sequence: int
+  run: Callable[[], None] = field(compare=False)
+
+
+class JobQueue:
+  """Runs audio generation jobs on a worker thread so they outlive Streamlit reruns.
+
+  The job file doubles as a checkpoint: every finished line is recorded in it, so a
+  job that fails part way or is cut short by a restart resumes with the lines left.
+  Work is taken in priority order, and more urgent work also runs between the lines
+  of a job, so a single line never waits for a whole dialogue.
+  """
+  def __init__(self) -> None:
+    self._queue: queue.PriorityQueue = queue.PriorityQueue()
+    self._sequence = itertools.count()
+    self._engines: dict[str, tuple[DiatribeEngine, RenderContext]] = {}
+    self._tokens: dict[str, CancellationToken] = {}
+    self._recover()
+    self._worker = threading.Thread(target=self._run, daemon=True, name="generation-worker")
+    self._worker.start()
+
+  def _recover(self) -> None:
+    """Mark the jobs left running by a previous process as interrupted."""
+    for path in glob.glob(job_path(f"{SESSION_ROOT}/*", "*")):
+      workspace = os.path.dirname(os.path.dirname(path))
+      job = load_job(workspace, os.path.basename(path).replace(".json", ""))
+      if job is None or not job.active:
+        continue
+      job.status = "interrupted"
+      for line in job.lines:
+        if line.status == "running":
+          line.status = "pending"
+      save_job(job)
+      log(f"generation job {job.id} was interrupted with {len(job.remaining_lines())} lines left")
+
+  def submit(
+    self,
+    engine: DiatribeEngine,
+    context: RenderContext,
+    dialogue: list[Dialogue],
+    join_lines: list[int] | None = None
+  ) -> GenerationJob:
+    """Queue the dialogue lines for generation and return the persisted job."""
+    job = create_job(engine, context, dialogue, join_lines)
+    self._engines[job.id] = (engine, context)
+    self._tokens[job.id] = CancellationToken()
+    self._put(PRIORITY_BULK, lambda: self._process(job))
+    log(f"queued generation job {job.id} with {len(job.lines)} lines")
+    return job
+
+  def resume(
+    self,
+    engine: DiatribeEngine,
+    context: RenderContext,
+    job_id: str
+  ) -> GenerationJob | None:
+    """Queue the failed and unfinished lines of a job again, keeping the lines already generated."""
+    job = load_job(context.workspace, job_id)
+    if job is None or job.active:
+      return job
+    reset_job(job)
+    self._engines[job.id] = (engine, context)
+    self._tokens[job.id] = CancellationToken()
+    self._put(PRIORITY_BULK, lambda: self._process(job))
+    log(f"resumed generation job {job.id} with {len(job.remaining_lines())} lines left")
+    return job
+
+  def call(
+    self,
+    fn: Callable[[], Any],
+    workspace: str,
+    priority: int = PRIORITY_INTERACTIVE
+  ) -> Future:
+    """Run a single synthesis on the generation worker ahead of the queued jobs."""
+    future = Future()
+    def run() -> None:
+      if not future.set_running_or_notify_cancel():
+        return
+      try:
+        with use_workspace(workspace), use_cancellation(None):
+          future.set_result(fn())
+      except BaseException as e:
+        future.set_exception(e)
+    self._put(priority, run)
+    return future
+
+  def cancel(self, job_id: str) -> None:
+    """Stop a queued or running job at its next check, keeping the lines it has finished."""
+    token = self._tokens.get(job_id)
+    if token is not None:
+      log(f"cancelling generation job {job_id}")
+      token.cancel()
+
+  def cancel_workspace(self, workspace: str, wait_seconds: float = 10.0) -> None:
+    """Cancel every job of the workspace and wait a while for the running one to stop writing to it."""
+    for job in workspace_jobs(workspace):
+      if job.active:
+        self.cancel(job.id)
+    deadline = time.time() + wait_seconds
+    while active_job(workspace) is not None and time.time() < deadline:
+      time.sleep(0.1)
+
+  def _put(self, priority: int, run: Callable[[], None]) -> None:
+    self._queue.put(_Task(priority, next(self._sequence), run))
+
+  def _run_urgent(self, priority: int) -> None:
+    """Run the queued work that is more urgent than the given priority."""
+    while True:
+      try:
+        task = self._queue.get_nowait()
+      except queue.Empty:
+        return
+      if task.priority >= priority:
+        self._queue.put(task)
+        return
+      task.run()
+
+  def _process(self, job: GenerationJob) -> None:
+    engine, context = self._engines.pop(job.id)
+    token = self._tokens[job.id]
+    try:
+      process_job(
+        job, engine, context,
+        between_lines=lambda: self._run_urgent(PRIORITY_BULK),
+        cancellation=token
+      )
+    except Exception as e:
+      log(f"generation job {job.id} failed: {e}")
+      job.status = "failed"
+      save_job(job)
+    finally:
+      self._tokens.pop(job.id, None)
+
+  def _run(self) -> None:
+    while True:
+      self._queue.get().run()
+
+
+@cache_resource
+def get_job_queue() -> JobQueue:
+  """Return the process wide generation job queue."""
+  return JobQueue()
@@ -0,0 +1,72 @@
+import json
+
+
+class ArrayItemParser:
+  """Picks the objects of a top level array out of JSON text while it is still arriving.
+
+  Only strings and nesting are tracked, so anything around the JSON, like a code fence,
+  is skipped and an object is parsed once, when its closing brace arrives.
+  """
+  def __init__(self, key: str) -> None:
+    self.key = key
+    self._text = ""
+    self._pos = 0
+    self._stack: list[str] = []
+    self._in_string = False
+    self._escaped = False
+    self._string_start = 0
+    self._last_string: str | None = None
+    self._array_key: str | None = None
+    self._item_start: int | None = None
+    self._root_start: int | None = None
+    self._last_item_end: int | None = None
+
+  def feed(self, text: str) -> list[dict]:
+    """Add the next piece of text and return the objects it completed."""
+    self._text += text
+    items = []
+    while self._pos < len(self._text):
+      char = self._text[self._pos]
+      if self._in_string:
+        if self._escaped:
+          self._escaped = False
+        elif char == "\\":
+          self._escaped = True
+        elif char == '"':
+          self._in_string = False
+          self._last_string = self._text[self._string_start + 1:self._pos]
+      elif char == '"':
+        self._in_string = True
+        self._string_start = self._pos
+      elif char in "{[":
+        if char == "{" and self._root_start is None:
+          self._root_start = self._pos
+        if char == "[" and self._stack == ["{"]:
+          self._array_key = self._last_string
+        elif char == "{" and self._in_array():
+          self._item_start = self._pos
+        self._stack.append(char)
+      elif char in "}]" and self._stack:
+        self._stack.pop()
+        if char == "}" and self._item_start is not None and self._in_array():
+          try:
+            items.append(json.loads(self._text[self._item_start:self._pos + 1]))
+            self._last_item_end = self._pos
+          except json.JSONDecodeError:
+            pass
+          self._item_start = None
+      self._pos += 1
+    return items
+
+  @property
+  def text(self) -> str:
+    return self._text
+
+  def repaired(self) -> str:
+    """Return the JSON cut off after the last complete object and closed, for a response that stopped part way."""
+    if self._last_item_end is None:
+      return self._text
+    return self._text[self._root_start:self._last_item_end + 1] + "]}"
+
+  def _in_array(self) -> bool:
+    return self._stack == ["{", "["] and self._array_key == self.key
@@ -0,0 +1,61 @@
+"""Streamlit for the modules the command line and the model servers share with the app.
+
+`st` imports Streamlit the first time one of its functions is used, which only the UI
+parts of those modules do. The caching decorators decide on their first call: in the app,
+where Streamlit is already loaded, they are Streamlit's own, anywhere else plain in process
+caches, so rendering from the command line never needs Streamlit installed.
+"""
+import sys, functools, threading
+
+
+class _Streamlit:
+  def __getattr__(self, name: str):
+    import streamlit
+    return getattr(streamlit, name)
+
+
+st = _Streamlit()
+
+
+def _locked(fn):
+  lock = threading.Lock()
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    with lock:
+      return fn(*args, **kwargs)
+  return wrapper
+
+
+def _deferred(kind: str, fn, options: dict):
+  lock = threading.Lock()
+  cached = None
+
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    nonlocal cached
+    with lock:
+      if cached is None:
+        streamlit = sys.modules.get("streamlit")
+        if streamlit is not None:
+          cached = getattr(streamlit, kind)(**options)(fn)
+        elif kind == "cache_resource":
+          # only one caller creates the shared resource, like Streamlit does
+          cached = _locked(functools.cache(fn))
+        else:
+          cached = functools.cache(fn)
+    return cached(*args, **kwargs)
+  return wrapper
+
+
+def cache_data(fn=None, **options):
+  """st.cache_data, or functools.cache outside the app."""
+  if fn is None:
+    return lambda fn: _deferred("cache_data", fn, options)
+  return _deferred("cache_data", fn, options)
+
+
+def cache_resource(fn=None, **options):
+  """st.cache_resource, or a process wide functools.cache outside the app."""
+  if fn is None:
+    return lambda fn: _deferred("cache_resource", fn, options)
+  return _deferred("cache_resource", fn, options)
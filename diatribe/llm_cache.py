@@ -0,0 +1,105 @@
+import os, json, hashlib, threading, uuid
+import streamlit as st
+
+LLM_CACHE_PATH = "./cache/llm"
+LLM_CACHE_QUOTA = int(os.getenv("DIATRIBE_LLM_CACHE_MB", "64")) * 1024 * 1024
+
+
+class LLMCache:
+  """OpenAI responses stored on disk by their request, so an identical request can reuse them.
+
+  The request holds the model, temperature, token limit and prompts, which makes the key
+  the hash of everything that shapes the response. It also keeps count of how often a
+  response was reused, the time that saved, and how much of the prompts OpenAI had cached.
+  Once the responses take more than the quota the least recently used ones are removed.
+  """
+  def __init__(self, root: str = LLM_CACHE_PATH, quota: int = LLM_CACHE_QUOTA) -> None:
+    self.root = root
+    self.quota = quota
+    self.stats_path = f"{root}/stats.json"
+    self._lock = threading.Lock()
+    os.makedirs(root, exist_ok=True)
+
+  def _path(self, request: dict) -> str:
+    key = hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{self.root}/{key[:2]}/{key}.json"
+
+  def get(self, request: dict) -> str | None:
+    """Return the stored response of an identical request, counting the lookup."""
+    path = self._path(request)
+    if not os.path.exists(path):
+      self._count(misses=1)
+      return None
+    with open(path, "r") as f:
+      entry = json.load(f)
+    # the modification time doubles as the last use for evicting
+    os.utime(path)
+    self._count(hits=1, seconds_saved=entry["seconds"])
+    return entry["response"]
+
+  def put(self, request: dict, response: str, seconds: float) -> None:
+    """Store the response along with how long it took to generate."""
+    path = self._path(request)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4()}.tmp"
+    with open(temp_path, "w") as f:
+      json.dump({"response": response, "seconds": seconds}, f)
+    os.replace(temp_path, path)
+    self.collect_garbage()
+
+  def collect_garbage(self) -> int:
+    """Remove responses, least recently used first, until the cache fits its quota."""
+    with self._lock:
+      entries = []
+      for directory, _, names in os.walk(self.root):
+        for name in names:
+          path = os.path.join(directory, name)
+          if path == self.stats_path or not name.endswith(".json"):
+            continue
+          try:
+            info = os.stat(path)
+          except FileNotFoundError:
+            continue
+          entries.append((info.st_mtime, info.st_size, path))
+      total = sum(size for _, size, _ in entries)
+      reclaimed = 0
+      for _, size, path in sorted(entries):
+        if total - reclaimed <= self.quota:
+          break
+        try:
+          os.remove(path)
+          reclaimed += size
+        except FileNotFoundError:
+          pass
+      return reclaimed
+
+  def record_usage(self, usage) -> None:
+    """Count the prompt tokens of a response and how many of them OpenAI served from its prompt cache."""
+    if usage is None:
+      return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    self._count(prompt_tokens=usage.prompt_tokens, cached_prompt_tokens=cached)
+
+  def stats(self) -> dict:
+    stats = {"hits": 0, "misses": 0, "seconds_saved": 0.0, "prompt_tokens": 0, "cached_prompt_tokens": 0}
+    if os.path.exists(self.stats_path):
+      with open(self.stats_path, "r") as f:
+        stats.update(json.load(f))
+    return stats
+
+  def _count(self, **counts) -> None:
+    with self._lock:
+      stats = self.stats()
+      for name, value in counts.items():
+        stats[name] += value
+      temp_path = f"{self.stats_path}.tmp"
+      with open(temp_path, "w") as f:
+        json.dump(stats, f)
+      os.replace(temp_path, self.stats_path)
+
+
+@st.cache_resource
+def get_llm_cache() -> LLMCache:
+  """Return the process wide LLM response cache."""
+  return LLMCache()
@@ -0,0 +1,90 @@
+"""Resolve the local models to files on disk so loading never waits on the Hugging Face hub.
+
+  python -m diatribe.model_manifest
+
+downloads every local model once and writes `models/manifest.json`. While the manifest
+exists the hub libraries run offline and the providers load the snapshots it lists, so
+the app also starts without a network.
+"""
+import os, sys, json, argparse, functools
+from pathlib import Path
+from diatribe.utils import log
+
+MANIFEST_PATH = os.getenv("DIATRIBE_MODEL_MANIFEST", "models/manifest.json")
+
+# hub repositories of the local models, downloaded when the manifest is built
+MODEL_REPOS = {
+  "kokoro": "hexgrad/Kokoro-82M",
+  "parler": "parler-tts/parler-tts-mini-expresso",
+  "chatterbox": "ResembleAI/chatterbox-turbo"
+}
+XTTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+
+
+@functools.cache
+def load_manifest() -> dict:
+  if not os.path.exists(MANIFEST_PATH):
+    return {}
+  with open(MANIFEST_PATH, "r") as f:
+    return json.load(f)
+
+
+def model_path(name: str) -> str | None:
+  """Return the folder holding the named model, if the manifest has it."""
+  path = load_manifest().get("models", {}).get(name)
+  return path if path and os.path.isdir(path) else None
+
+
+def voice_ids(name: str) -> list[str] | None:
+  """Return the voices of the named model, if the manifest has them."""
+  return load_manifest().get("voices", {}).get(name)
+
+
+def enable_offline() -> bool:
+  """Keep the hub libraries off the network once the models are on disk.
+
+  The libraries read these when they are first imported, so this runs before any provider.
+  """
+  if not load_manifest():
+    return False
+  for name in ("HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE"):
+    os.environ.setdefault(name, "1")
+  return True
+
+
+def build_manifest() -> dict:
+  """Download the local models and return where they were stored."""
+  from huggingface_hub import snapshot_download
+  models = {}
+  for name, repo_id in MODEL_REPOS.items():
+    try:
+      models[name] = snapshot_download(repo_id)
+    except Exception as e:
+      log(f"could not download {repo_id}: {e}")
+
+  try:
+    from TTS.utils.manage import ModelManager
+    models["xtts"] = str(ModelManager().download_model(XTTS_MODEL)[0])
+  except Exception as e:
+    log(f"could not download {XTTS_MODEL}: {e}")
+
+  voices = {}
+  if "kokoro" in models:
+    voices["kokoro"] = sorted(path.stem for path in Path(models["kokoro"], "voices").glob("*.pt"))
+  return {"models": models, "voices": voices}
+
+
+def main(argv: list[str] | None = None) -> int:
+  parser = argparse.ArgumentParser(prog="python -m diatribe.model_manifest", description="Download the local models for offline use.")
+  parser.add_argument("--output", default=MANIFEST_PATH, help="where to write the manifest")
+  args = parser.parse_args(argv)
+  manifest = build_manifest()
+  os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+  with open(args.output, "w") as f:
+    json.dump(manifest, f, indent=2)
+  log(f"wrote {len(manifest['models'])} models to {args.output}")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
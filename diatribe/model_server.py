@@ -0,0 +1,256 @@
+"""Serve a local audio provider from its own process, e.g. from a separate virtualenv.
+
+  python -m diatribe.model_server --engine Parler --address ./models/parler.sock --workers 4
+
+The app reaches a server through DIATRIBE_MODEL_SERVERS, a comma separated list of
+engine=address pairs such as `Parler=./models/parler.sock,Chatterbox=127.0.0.1:7811`.
+An address containing a slash is a Unix socket, anything else is a localhost port.
+Audio is handed back in a shared memory block that the client unlinks once it is read.
+
+Requests are pickled, so whoever can talk to a server can run code on its host. Servers and
+clients refuse to start without a DIATRIBE_MODEL_SERVER_KEY secret, and only listen on
+loopback addresses unless DIATRIBE_MODEL_SERVER_ALLOW_REMOTE=1 is set.
+
+With more than one worker the server loads the model once and then forks the workers,
+which share the weights copy-on-write and accept connections on the same socket. CUDA and
+MPS can not be used from a forked process, so more than one worker needs a model on the CPU.
+"""
+import os, gc, sys, signal, shutil, argparse, tempfile, threading, functools, ipaddress
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from diatribe.utils import log
+from diatribe.workspace import use_workspace
+
+def model_server_key() -> bytes:
+  """Return the shared secret that authenticates the app and the model servers to each other."""
+  key = os.getenv("DIATRIBE_MODEL_SERVER_KEY")
+  if not key:
+    raise ValueError("set DIATRIBE_MODEL_SERVER_KEY to a secret shared by the app and its model servers")
+  return key.encode("utf-8")
+
+
+def _is_loopback(host: str) -> bool:
+  if host == "localhost":
+    return True
+  try:
+    return ipaddress.ip_address(host).is_loopback
+  except ValueError:
+    return False
+
+
+def parse_address(address: str) -> str | tuple[str, int]:
+  """Return a Unix socket path or a (host, port), refusing hosts other machines can reach unless allowed."""
+  if "/" in address:
+    return address
+  host, port = address.rsplit(":", 1)
+  if not _is_loopback(host) and os.getenv("DIATRIBE_MODEL_SERVER_ALLOW_REMOTE") != "1":
+    raise ValueError(f"{host} is not a loopback address, set DIATRIBE_MODEL_SERVER_ALLOW_REMOTE=1 to serve it anyway")
+  return host, int(port)
+
+
+def model_server_address(name: str) -> str | tuple[str, int] | None:
+  """Return the address of the model server configured for the engine, if any.
+
+  Raises ValueError when a server is configured but the key or address is not safe to use.
+  """
+  for entry in os.getenv("DIATRIBE_MODEL_SERVERS", "").split(","):
+    if "=" not in entry:
+      continue
+    engine, address = entry.split("=", 1)
+    if engine.strip().replace(" ", "").lower() == name.replace(" ", "").lower():
+      model_server_key()
+      return parse_address(address.strip())
+  return None
+
+
+def _shared_memory(size: int) -> SharedMemory:
+  try:
+    # the client unlinks the block, so the server must not clean it up on exit
+    return SharedMemory(create=True, size=size, track=False)
+  except TypeError:
+    shm = SharedMemory(create=True, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def request(address: str | tuple[str, int], message: tuple) -> dict:
+  """Send one request to a model server and return its reply."""
+  with Client(address, authkey=model_server_key()) as connection:
+    connection.send(message)
+    reply = connection.recv()
+  if "error" in reply:
+    raise RuntimeError(f"model server {address}: {reply['error']}")
+  return reply
+
+
+@functools.lru_cache(maxsize=None)
+def describe(address: str | tuple[str, int]) -> dict:
+  """Return the name, voices and default options of the served provider."""
+  return request(address, ("describe",))
+
+
+def synthesize(
+  address: str | tuple[str, int],
+  text: str,
+  voice_id: str,
+  line: int,
+  options: dict,
+  guidance: str | None = None
+) -> bytes:
+  """Synthesize a line on a model server and return the audio file contents."""
+  reply = request(address, ("synthesize", text, voice_id, line, options, guidance))
+  shm = SharedMemory(name=reply["audio"])
+  try:
+    return bytes(shm.buf[:reply["size"]])
+  finally:
+    shm.close()
+    shm.unlink()
+
+
+class ModelServer:
+  """Keeps one provider and its model warm and answers requests from many clients.
+
+  Every connection is handled on its own thread, while synthesis itself is serialized
+  because the models are not safe to call concurrently.
+  """
+  def __init__(self, engine: str, address: str | tuple[str, int], workers: int = 1) -> None:
+    from diatribe.audio_providers.registry import load_audio_provider
+    from diatribe.worker_pool import threads_per_worker, limit_threads
+    self.provider = load_audio_provider(engine, remote=False)
+    if self.provider is None:
+      raise ValueError(f"{engine} can not be loaded in this environment")
+    self.address = address
+    self.workers = workers
+    self.threads = threads_per_worker(workers)
+    self.workspace = tempfile.mkdtemp(prefix="diatribe-model-server-")
+    self._lock = threading.Lock()
+    if workers > 1:
+      # an OpenMP pool started before forking can hang the workers, so the thread count
+      # is set before the model first runs and the workers inherit it
+      limit_threads(self.threads)
+    self.provider.load_model()
+
+  @property
+  def forkable(self) -> bool:
+    """Whether the loaded model can be shared with forked workers, which only holds on the CPU."""
+    import torch
+    from diatribe.audio_providers.audio_provider import LocalProvider
+    device = getattr(self.provider, "device", None) or LocalProvider.device()
+    return str(device) == "cpu" and not torch.cuda.is_initialized()
+
+  def _describe(self) -> dict:
+    return {
+      "name": self.provider.name,
+      "description": self.provider.description,
+      "supports_instructions": self.provider.supports_instructions,
+      "chunk_chars": self.provider.chunk_chars,
+      "voices": self.provider.voices,
+      "default_options": self.provider.default_options()
+    }
+
+  def _synthesize(self, text: str, voice_id: str, line: int, options: dict, guidance: str | None) -> dict:
+    with self._lock, use_workspace(self.workspace):
+      audio_file = self.provider.generate_and_save(text, voice_id, line, options, guidance=guidance)
+      with open(audio_file, "rb") as f:
+        audio = f.read()
+      os.remove(audio_file)
+    shm = _shared_memory(max(1, len(audio)))
+    shm.buf[:len(audio)] = audio
+    shm.close()
+    return {"audio": shm.name, "size": len(audio)}
+
+  def _handle(self, connection) -> None:
+    with connection:
+      try:
+        command, *args = connection.recv()
+        if command == "describe":
+          connection.send(self._describe())
+        elif command == "synthesize":
+          connection.send(self._synthesize(*args))
+        else:
+          connection.send({"error": f"unknown command {command}"})
+      except Exception as e:
+        log(f"model server request failed: {e}")
+        connection.send({"error": str(e)})
+
+  def _accept(self, listener: Listener) -> None:
+    while True:
+      try:
+        connection = listener.accept()
+      except (AuthenticationError, EOFError, OSError) as e:
+        log(f"model server rejected a connection: {e}")
+        continue
+      threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+  def _fork(self, listener: Listener) -> int:
+    pid = os.fork()
+    if pid != 0:
+      return pid
+    try:
+      # lines are written per worker so workers synthesizing the same line do not collide
+      self.workspace = f"{self.workspace}/{os.getpid()}"
+      self._accept(listener)
+    finally:
+      os._exit(1)
+
+  def _prefork(self, listener: Listener) -> None:
+    # moving the loaded objects out of the collector's reach keeps it from writing to,
+    # and so copying, the pages the forked workers share with this process
+    gc.freeze()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    children = {self._fork(listener) for _ in range(self.workers)}
+    log(f"forked {self.workers} {self.provider.name} workers with {self.threads} threads each")
+    try:
+      while True:
+        pid, _ = os.wait()
+        if pid in children:
+          log(f"{self.provider.name} worker {pid} exited, forking a new one")
+          children.remove(pid)
+          children.add(self._fork(listener))
+    finally:
+      for pid in children:
+        try:
+          os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+          pass
+
+  def serve_forever(self) -> None:
+    authkey = model_server_key()
+    if self.workers > 1 and not self.forkable:
+      raise ValueError(f"{self.provider.name} runs on the GPU, which forked workers can not use, serve it with one worker")
+    if isinstance(self.address, str) and os.path.exists(self.address):
+      os.remove(self.address)
+    with Listener(self.address, authkey=authkey) as listener:
+      if isinstance(self.address, str):
+        os.chmod(self.address, 0o600)
+      log(f"serving {self.provider.name} on {self.address}")
+      try:
+        if self.workers > 1:
+          self._prefork(listener)
+        else:
+          self._accept(listener)
+      finally:
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+  parser = argparse.ArgumentParser(prog="python -m diatribe.model_server", description="Serve a local audio provider to the app.")
+  parser.add_argument("--engine", required=True, help="the provider to serve, e.g. Parler or Chatterbox")
+  parser.add_argument("--address", required=True, help="a Unix socket path or host:port")
+  parser.add_argument("--workers", type=int, default=1, help="forked workers sharing the loaded model")
+  args = parser.parse_args(argv)
+  try:
+    model_server_key()
+    address = parse_address(args.address)
+  except ValueError as e:
+    parser.error(str(e))
+  server = ModelServer(args.engine, address, args.workers)
+  if args.workers > 1 and not server.forkable:
+    parser.error(f"{server.provider.name} runs on the GPU, which forked workers can not use, use --workers 1")
+  server.serve_forever()
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,75 @@
+import os, re, time, threading
+import streamlit as st
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from diatribe.utils import log
+from diatribe.workspace import workspace_path
+
+PREVIEW_HOST = os.getenv("DIATRIBE_PREVIEW_HOST", "127.0.0.1")
+PREVIEW_PORT = int(os.getenv("DIATRIBE_PREVIEW_PORT", "8600"))
+# where the browser reaches the server, e.g. an https path proxied to it when the app is served over https
+PREVIEW_PUBLIC_URL = os.getenv("DIATRIBE_PREVIEW_PUBLIC_URL")
+PREVIEW_WAIT_SECONDS = 600
+PREVIEW_POLL_SECONDS = 0.2
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+  """Streams the preview parts of a session as one mp3 that grows while lines are generated."""
+  def do_GET(self) -> None:
+    match = re.fullmatch(r"/preview/([\w-]+)\.mp3", self.path.split("?")[0])
+    preview_path = f"{workspace_path(match.group(1))}/preview" if match else None
+    if preview_path is None or not os.path.isdir(preview_path):
+      self.send_error(404)
+      return
+
+    self.send_response(200)
+    self.send_header("Content-Type", "audio/mpeg")
+    self.send_header("Cache-Control", "no-store")
+    self.send_header("Access-Control-Allow-Origin", "*")
+    self.end_headers()
+    part, waited = 0, 0.0
+    try:
+      while waited < PREVIEW_WAIT_SECONDS:
+        part_path = f"{preview_path}/part{part:05d}.mp3"
+        if os.path.exists(part_path):
+          with open(part_path, "rb") as f:
+            self.wfile.write(f.read())
+          self.wfile.flush()
+          part, waited = part + 1, 0.0
+        elif not os.path.isdir(preview_path):
+          # the job finished and its preview was removed
+          return
+        else:
+          time.sleep(PREVIEW_POLL_SECONDS)
+          waited += PREVIEW_POLL_SECONDS
+    except (BrokenPipeError, ConnectionResetError):
+      pass
+
+  def log_message(self, format: str, *args) -> None:
+    pass
+
+
+@st.cache_resource
+def get_preview_server() -> ThreadingHTTPServer | None:
+  """Start the process wide preview server, or return None when its port is taken."""
+  try:
+    server = ThreadingHTTPServer((PREVIEW_HOST, PREVIEW_PORT), PreviewHandler)
+  except OSError as e:
+    log(f"preview server could not start on port {PREVIEW_PORT}: {e}")
+    return None
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True, name="preview-server").start()
+  log(f"serving previews on http://{PREVIEW_HOST}:{PREVIEW_PORT}")
+  return server
+
+
+def preview_url(session_id: str, version: str = "") -> str | None:
+  """Return the address the browser plays the growing dialogue of a session from."""
+  server = get_preview_server()
+  if server is None:
+    return None
+  if PREVIEW_PUBLIC_URL:
+    base_url = PREVIEW_PUBLIC_URL.rstrip("/")
+  else:
+    host = "localhost" if PREVIEW_HOST in ("", "0.0.0.0", "::") else PREVIEW_HOST
+    base_url = f"http://{host}:{server.server_address[1]}"
+  return f"{base_url}/preview/{session_id}.mp3?v={version}"
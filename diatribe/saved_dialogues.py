@@ -1,10 +1,17 @@
-import os, shutil, glob
+import os, shutil, glob, json, uuid, stat
 import streamlit as st
 from diatribe.dialogues import convert_dialogue_import_into_data
 from dataclasses import dataclass
 from diatribe.audio_tools import import_audio
+from diatribe import session_files
+from diatribe.blob_store import content_hash
 from diatribe.utils import remove_state
 from diatribe.utils import log
+from diatribe.workspace import session_path
+
+SAMPLE_CACHE_PATH = "./cache/saves"
+
+_verified_samples: set[str] = set()
 
 @dataclass
 class SavedDialogueData:
@@ -20,18 +27,81 @@ def convert_imported_dialogue(data: bytes) -> dict:
   
 def unzip_package(data: bytes) -> str:
   # save zip
-  import_path = f"./session/{st.session_state.session_id}/import/package.zip"
+  import_path = session_path("import/package.zip")
   os.makedirs(os.path.dirname(import_path), exist_ok=True)
   with open(import_path, "wb") as f:
     f.write(data)
+  session_files.track(import_path)
   # unzip file
-  unzip_path = f"./session/{st.session_state.session_id}/import/contents"
+  unzip_path = session_path("import/contents")
   if os.path.exists(unzip_path):
     shutil.rmtree(unzip_path)
   os.makedirs(os.path.dirname(unzip_path), exist_ok=True)
   shutil.unpack_archive(import_path, unzip_path) 
+  for root, _, files in os.walk(unzip_path):
+    for file in files:
+      session_files.track(os.path.join(root, file))
   return unzip_path 
 
+@st.cache_data
+def sample_project_hash(project_path: str, modified: float, size: int) -> str:
+  """Hash a sample project zip, memoized on its modification time and size."""
+  return content_hash(project_path)
+
+def build_sample_manifest(contents_path: str) -> dict:
+  manifest = {}
+  for root, _, files in os.walk(contents_path):
+    for file in files:
+      path = os.path.join(root, file)
+      manifest[os.path.relpath(path, contents_path)] = content_hash(path)
+  return manifest
+
+def verify_sample_cache(cache_path: str) -> bool:
+  """Check the extracted sample files against the hashes recorded at extraction."""
+  manifest_path = f"{cache_path}/manifest.json"
+  if not os.path.exists(manifest_path):
+    return False
+  with open(manifest_path, "r") as f:
+    manifest = json.load(f)
+  contents_path = f"{cache_path}/contents"
+  try:
+    return build_sample_manifest(contents_path) == manifest
+  except OSError:
+    return False
+
+def extract_sample_project(project_path: str) -> str:
+  """Extract a bundled sample project once into the shared read-only cache and return its contents path."""
+  info = os.stat(project_path)
+  project_hash = sample_project_hash(project_path, info.st_mtime, info.st_size)
+  cache_path = f"{SAMPLE_CACHE_PATH}/{project_hash}"
+  contents_path = f"{cache_path}/contents"
+  
+  if cache_path in _verified_samples and os.path.exists(contents_path):
+    return contents_path
+  if os.path.exists(cache_path):
+    if verify_sample_cache(cache_path):
+      _verified_samples.add(cache_path)
+      return contents_path
+    log(f"sample cache is corrupt, re-extracting {project_path}")
+    shutil.rmtree(cache_path, ignore_errors=True)
+  
+  temp_path = f"{SAMPLE_CACHE_PATH}/.tmp-{uuid.uuid4()}"
+  os.makedirs(temp_path, exist_ok=True)
+  shutil.unpack_archive(project_path, f"{temp_path}/contents", format="zip")
+  manifest = build_sample_manifest(f"{temp_path}/contents")
+  with open(f"{temp_path}/manifest.json", "w") as f:
+    json.dump(manifest, f)
+  for relative in manifest:
+    os.chmod(f"{temp_path}/contents/{relative}", stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+  try:
+    os.rename(temp_path, cache_path)
+  except OSError:
+    # another session extracted the same sample first
+    shutil.rmtree(temp_path, ignore_errors=True)
+  log(f"cached sample project {project_path} at {cache_path}")
+  _verified_samples.add(cache_path)
+  return contents_path
+
 def import_project(project_path: str) -> None:
   dialogue_path = f"{project_path}/dialogue.txt"  
   with open(dialogue_path, "rb") as f:
@@ -71,8 +141,7 @@ def create_saved_dialogues():
       submit_sample_project = st.form_submit_button("Load", width='stretch')
       if submit_sample_project and selected_save_name:
         project_path = f"./saves/{selected_save_name.replace(' ', '_')}.zip"
-        unzip_path = unzip_package(open(project_path, "rb").read())
-        import_project(unzip_path)
+        import_project(extract_sample_project(project_path))
     
     import_tab, export_tab = st.tabs(["Import", "Export"])
     with import_tab:
@@ -88,7 +157,7 @@ def create_saved_dialogues():
     with export_tab:
       prepare_project=st.button("Prepare Download", width='stretch', help="Prepare the dialogue and audio for export")
       
-      download_dialogue_path = f"./session/{st.session_state.session_id}/project/project.zip"
+      download_dialogue_path = session_path("project/project.zip")
       if os.path.exists(download_dialogue_path):         
         with open(download_dialogue_path, "rb") as f:
           dialogue_downloaded = st.download_button(
@@ -0,0 +1,93 @@
+import os, shutil, errno
+from typing import Callable
+from diatribe.utils import log
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# ioctl request number for FICLONE (linux/fs.h), shares extents copy-on-write
+FICLONE = 0x40049409
+
+_reflink_devices: dict[int, bool] = {}
+_listeners: list[Callable[[str], None]] = []
+
+
+def add_listener(listener: Callable[[str], None]) -> None:
+  """Register a callback told about every session file that is linked or rewritten."""
+  _listeners.append(listener)
+
+
+def _notify(path: str) -> None:
+  for listener in _listeners:
+    listener(path)
+
+
+def track(path: str) -> str:
+  """Tell the listeners about a file written by another process."""
+  _notify(path)
+  return path
+
+
+def reflink(src: str, dst: str) -> bool:
+  """Clone the source file into the destination using a copy-on-write reflink."""
+  if fcntl is None:
+    return False
+  device = os.stat(src).st_dev
+  if _reflink_devices.get(device) is False:
+    return False
+  try:
+    with open(src, "rb") as s, open(dst, "wb") as d:
+      fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    _reflink_devices[device] = True
+    return True
+  except OSError as e:
+    if os.path.exists(dst):
+      os.remove(dst)
+    if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL):
+      _reflink_devices[device] = False
+    return False
+
+
+def link_file(src: str, dst: str) -> str:
+  """Share the source file with the destination by reflink, hardlink or, as a last resort, a copy."""
+  os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+  if os.path.lexists(dst):
+    os.remove(dst)
+  if reflink(src, dst):
+    _notify(dst)
+    return dst
+  try:
+    os.link(src, dst)
+  except OSError:
+    # a private copy, so without the read only mode of a cached source
+    shutil.copyfile(src, dst)
+  _notify(dst)
+  return dst
+
+
+def link_tree(src_dir: str, dst_dir: str) -> None:
+  """Share every file in the source directory with the destination directory."""
+  for root, _, files in os.walk(src_dir):
+    relative = os.path.relpath(root, src_dir)
+    target = os.path.normpath(os.path.join(dst_dir, relative))
+    os.makedirs(target, exist_ok=True)
+    for file in files:
+      link_file(os.path.join(root, file), os.path.join(target, file))
+
+
+def break_link(path: str) -> str:
+  """Detach a hardlinked file before it is rewritten so the shared copy is left untouched.
+
+  Every writer calls this on its destination first, which also makes it the point where
+  listeners learn that the file has changed.
+  """
+  try:
+    if os.stat(path).st_nlink > 1:
+      log(f"breaking shared link for {path}")
+      os.remove(path)
+  except FileNotFoundError:
+    pass
+  _notify(path)
+  return path
@@ -0,0 +1,213 @@
+import os, shutil, threading, time
+import streamlit as st
+from dataclasses import dataclass
+from diatribe.utils import log
+from diatribe import session_files
+from diatribe.blob_store import BlobStore, get_blob_store
+from diatribe.workspace import SESSION_ROOT
+
+MEGABYTE = 1024 * 1024
+SESSION_QUOTA = int(os.getenv("DIATRIBE_SESSION_QUOTA_MB", "512")) * MEGABYTE
+GLOBAL_QUOTA = int(os.getenv("DIATRIBE_GLOBAL_QUOTA_MB", "10240")) * MEGABYTE
+SESSION_IDLE_SECONDS = int(os.getenv("DIATRIBE_SESSION_IDLE_HOURS", "24")) * 3600
+SESSION_ACTIVE_SECONDS = 15 * 60
+SWEEP_INTERVAL = int(os.getenv("DIATRIBE_SWEEP_SECONDS", "300"))
+
+# evicted in this order, everything here is scratch or can be rebuilt from the session audio
+# and the script; the mastered parts (final/parts) and the line history (versions) cannot,
+# so they only go when the whole session expires
+EVICTION_ORDER = ["temp", "chunks", "speculative", "preview", "export", "project", "import"]
+
+
+@dataclass
+class SweepMetrics:
+  sweeps: int = 0
+  bytes_reclaimed: int = 0
+  directories_evicted: int = 0
+  sessions_expired: int = 0
+
+
+class SessionStore:
+  """Keeps the session directories within byte quotas and removes idle sessions.
+
+  File sizes are tracked from the paths reported by `session_files` when they are
+  linked or rewritten, so a sweep only stats known files instead of walking the tree.
+  """
+  def __init__(
+    self,
+    root: str = SESSION_ROOT,
+    session_quota: int = SESSION_QUOTA,
+    global_quota: int = GLOBAL_QUOTA,
+    idle_seconds: int = SESSION_IDLE_SECONDS,
+    blob_store: BlobStore | None = None
+  ) -> None:
+    self.root = os.path.abspath(root)
+    self.blob_store = blob_store
+    self.session_quota = session_quota
+    self.global_quota = global_quota
+    self.idle_seconds = idle_seconds
+    self.metrics = SweepMetrics()
+    self._lock = threading.Lock()
+    self._files: dict[str, dict[str, int]] = {}
+    self._last_access: dict[str, float] = {}
+    self._sweeper: threading.Thread | None = None
+    self._scan()
+    session_files.add_listener(self.track)
+
+  def _scan(self) -> None:
+    """Seed the ledger from the sessions already on disk."""
+    if not os.path.exists(self.root):
+      return
+    for session_id in os.listdir(self.root):
+      session_path = os.path.join(self.root, session_id)
+      if not os.path.isdir(session_path):
+        continue
+      files = self._files.setdefault(session_id, {})
+      last_access = os.stat(session_path).st_mtime
+      for directory, _, names in os.walk(session_path):
+        for name in names:
+          path = os.path.join(directory, name)
+          files[os.path.relpath(path, session_path)] = self._size(path)
+          last_access = max(last_access, os.stat(path).st_mtime)
+      self._last_access[session_id] = last_access
+
+  def _size(self, path: str) -> int:
+    """Return the bytes a file holds on its own, splitting shared links evenly."""
+    try:
+      info = os.stat(path)
+    except FileNotFoundError:
+      return -1
+    return info.st_size // max(1, info.st_nlink)
+
+  def _split(self, path: str) -> tuple[str, str] | None:
+    relative = os.path.relpath(os.path.abspath(path), self.root)
+    if relative.startswith(".."):
+      return None
+    parts = relative.split(os.sep, 1)
+    if len(parts) < 2:
+      return None
+    return parts[0], parts[1]
+
+  def touch(self, session_id: str) -> None:
+    """Mark the session as recently used."""
+    with self._lock:
+      self._last_access[session_id] = time.time()
+      self._files.setdefault(session_id, {})
+
+  def track(self, path: str) -> None:
+    """Record a file that has been linked or is about to be rewritten."""
+    location = self._split(path)
+    if location is None:
+      return
+    session_id, relative = location
+    with self._lock:
+      self._files.setdefault(session_id, {})[relative] = 0
+
+  def _refresh(self) -> None:
+    for session_id, files in self._files.items():
+      for relative in list(files):
+        size = self._size(os.path.join(self.root, session_id, relative))
+        if size < 0:
+          del files[relative]
+        else:
+          files[relative] = size
+
+  def session_bytes(self, session_id: str) -> int:
+    return sum(self._files.get(session_id, {}).values())
+
+  def total_bytes(self) -> int:
+    return sum(self.session_bytes(session_id) for session_id in self._files)
+
+  def _in_use(self, session_id: str, relative_dir: str, now: float) -> bool:
+    # an active session may be writing scratch files, streaming a job's preview
+    # or about to download its project
+    active = now - self._last_access.get(session_id, 0) <= SESSION_ACTIVE_SECONDS
+    return active and relative_dir in ("temp", "chunks", "speculative", "preview", "project")
+
+  def _evict(self, session_id: str, relative_dir: str) -> int:
+    files = self._files.get(session_id, {})
+    prefix = relative_dir + os.sep
+    evicted = [relative for relative in files if relative.startswith(prefix)]
+    reclaimed = sum(files.pop(relative) for relative in evicted)
+    shutil.rmtree(os.path.join(self.root, session_id, relative_dir), ignore_errors=True)
+    if evicted:
+      self.metrics.directories_evicted += 1
+      log(f"evicted {relative_dir} from session {session_id} ({reclaimed:,} bytes)")
+    return reclaimed
+
+  def _expire(self, session_id: str) -> int:
+    reclaimed = self.session_bytes(session_id)
+    shutil.rmtree(os.path.join(self.root, session_id), ignore_errors=True)
+    if self.blob_store is not None:
+      self.blob_store.release(session_id)
+    self._files.pop(session_id, None)
+    self._last_access.pop(session_id, None)
+    self.metrics.sessions_expired += 1
+    log(f"expired session {session_id} ({reclaimed:,} bytes)")
+    return reclaimed
+
+  def remove(self, session_id: str) -> int:
+    """Delete the session and everything in it, e.g. when it is cleared to start over."""
+    with self._lock:
+      return self._expire(session_id)
+
+  def sweep(self) -> int:
+    """Expire idle sessions and evict derived artifacts until the quotas are met."""
+    with self._lock:
+      self._refresh()
+      now = time.time()
+      reclaimed = 0
+      by_last_access = sorted(self._files, key=lambda s: self._last_access.get(s, 0))
+
+      for session_id in by_last_access:
+        if now - self._last_access.get(session_id, 0) > self.idle_seconds:
+          reclaimed += self._expire(session_id)
+
+      for session_id in list(self._files):
+        for relative_dir in EVICTION_ORDER:
+          if self.session_bytes(session_id) <= self.session_quota:
+            break
+          if not self._in_use(session_id, relative_dir, now):
+            reclaimed += self._evict(session_id, relative_dir)
+
+      for relative_dir in EVICTION_ORDER:
+        for session_id in [s for s in by_last_access if s in self._files]:
+          if self.total_bytes() <= self.global_quota:
+            break
+          if not self._in_use(session_id, relative_dir, now):
+            reclaimed += self._evict(session_id, relative_dir)
+
+      for session_id in [s for s in by_last_access if s in self._files]:
+        if self.total_bytes() <= self.global_quota:
+          break
+        if now - self._last_access.get(session_id, 0) > SESSION_ACTIVE_SECONDS:
+          reclaimed += self._expire(session_id)
+
+      if self.blob_store is not None:
+        reclaimed += self.blob_store.collect_garbage()
+
+      self.metrics.sweeps += 1
+      self.metrics.bytes_reclaimed += reclaimed
+      log(f"session sweep reclaimed {reclaimed:,} bytes, {self.total_bytes():,} bytes in use, {self.metrics.bytes_reclaimed:,} bytes reclaimed in total")
+      return reclaimed
+
+  def _run(self, interval: int) -> None:
+    while True:
+      time.sleep(interval)
+      try:
+        self.sweep()
+      except Exception as e:
+        log(f"session sweep failed: {e}")
+
+  def start(self, interval: int = SWEEP_INTERVAL) -> "SessionStore":
+    """Start the background sweeper thread."""
+    if self._sweeper is None:
+      self._sweeper = threading.Thread(target=self._run, args=(interval,), daemon=True, name="session-sweeper")
+      self._sweeper.start()
+    return self
+
+
+@st.cache_resource
+def get_session_store() -> SessionStore:
+  """Return the process wide session store with its sweeper running."""
+  return SessionStore(blob_store=get_blob_store()).start()
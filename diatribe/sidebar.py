@@ -3,18 +3,14 @@ from dataclasses import dataclass
 from openai import OpenAI
 from streamlit_js_eval import streamlit_js_eval
 from diatribe.audio_providers.audio_provider import AudioProvider
-from diatribe.audio_providers.hume_provider import HumeProvider
-from diatribe.audio_providers.el_provider import ElevenLabsProvider
-from diatribe.audio_providers.openai_provider import OpenAIProvider
-from diatribe.audio_providers.playai_provider import PlayAIProvider
-from diatribe.audio_providers.kokoro_provider import KokoroProvider
-from diatribe.audio_providers.xtts_provider import XttsProvider
-from diatribe.audio_providers.piper_provider import PiperProvider
-from diatribe.audio_providers.parler_provider import ParlerProvider
-from diatribe.audio_providers.chatterbox_provider import ChatterboxProvider
+from diatribe.audio_providers.registry import get_audio_providers
 from typing import Dict
 from diatribe.utils import get_env_key
 from diatribe.audio_providers.audio_provider import Location
+from diatribe.llm_cache import get_llm_cache
+from diatribe.jobs import get_job_queue
+from diatribe.session_store import get_session_store
+from diatribe.workspace import workspace_path
 
 @dataclass
 class SidebarData:
@@ -24,10 +20,12 @@ class SidebarData:
   voice_names: list[str]
   enable_instructions: bool
   enable_audio_editing: bool
+  enable_speculation: bool
   openai_api_key: str
   openai_model: str
   openai_temp: float
   openai_max_tokens: int
+  openai_reuse: bool
 
 @st.cache_data
 def get_openai_models(openai_api_key: str) -> list[str]:
@@ -38,16 +36,7 @@ def get_openai_models(openai_api_key: str) -> list[str]:
   return sorted(model_ids)
 
 def select_audio_provider(location: Location | None = None) -> AudioProvider | None:
-    providers = [
-      KokoroProvider(),
-      XttsProvider(),
-      PiperProvider(),
-      ParlerProvider(),
-      OpenAIProvider(),
-      ElevenLabsProvider(),
-      HumeProvider(),
-      ChatterboxProvider(),
-    ]
+    providers = get_audio_providers()
     if location:
       providers = [provider for provider in providers if provider.location == location]
 
@@ -89,10 +78,22 @@ def create_sidebar() -> SidebarData:
           openai_model = st.selectbox("Model", openai_models, index=gpt4_index)
           openai_temp = st.slider("Temperature", 0.0, 1.5, 1.3, 0.1,  help="The higher the temperature, the more creative the text.")
           openai_max_tokens = st.slider("Max Tokens", 1024, 10000, 3072, 1024, help="Check the official documentation on maximum token size for the selected model.")
+          openai_reuse = st.toggle(
+            "Reuse Responses",
+            value=False,
+            help="Reuse the earlier response to an identical request instead of asking OpenAI again. Turn it off to get a new variation."
+          )
+          stats = get_llm_cache().stats()
+          if stats["hits"] or stats["cached_prompt_tokens"]:
+            st.caption(
+              f"Reused {stats['hits']} of {stats['hits'] + stats['misses']} responses, saving {stats['seconds_saved']:.0f}s. "
+              f"OpenAI cached {stats['cached_prompt_tokens']:,} of {stats['prompt_tokens']:,} prompt tokens."
+            )
         else:
           openai_model = None
           openai_temp = None
           openai_max_tokens = None          
+          openai_reuse = False
       
       with st.expander("View Options"):          
         show_instructions = st.toggle(
@@ -105,10 +106,19 @@ def create_sidebar() -> SidebarData:
           value=True,
           help="Enable audio editing for each dialogue line. This is disabled by default to increase performance."
         )
+        speculate = st.toggle(
+          "Pre-generate While Editing",
+          value=False,
+          help="Generate the audio of dialogue lines that stopped changing in the background, so `Generate Audio Dialogue` is quicker. Hosted engines stop after a character budget."
+        )
 
       clear_dialogue = st.button("Clear Dialogue", help=":warning: Clear everything and start over. :warning:", width='stretch')
       if clear_dialogue:
-        streamlit_js_eval(js_expressions="parent.window.location.reload()")
+        # the session in the URL would bring the old audio and jobs back, so they go and the URL drops it
+        session_id = st.session_state.session_id
+        get_job_queue().cancel_workspace(workspace_path(session_id))
+        get_session_store().remove(session_id)
+        streamlit_js_eval(js_expressions="parent.window.location.replace(parent.window.location.pathname)")
         
       return SidebarData( 
         ready=bool(audio_provider),
@@ -117,10 +127,12 @@ def create_sidebar() -> SidebarData:
         voice_names=audio_provider.get_voice_names(),
         enable_instructions=show_instructions,
         enable_audio_editing=edit_audio,        
+        enable_speculation=speculate,
         openai_api_key=openai_api_key,
         openai_model=openai_model,
         openai_temp=openai_temp,
-        openai_max_tokens=openai_max_tokens
+        openai_max_tokens=openai_max_tokens,
+        openai_reuse=openai_reuse
       )
     else:
       return SidebarData(
@@ -130,10 +142,12 @@ def create_sidebar() -> SidebarData:
         voice_names=[],
         enable_instructions=True,
         enable_audio_editing=False,
+        enable_speculation=False,
         openai_api_key="",
         openai_model="",
         openai_temp=1.5,
-        openai_max_tokens=4096
+        openai_max_tokens=4096,
+        openai_reuse=False
       )   
 
   
\ No newline at end of file
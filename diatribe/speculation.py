@@ -0,0 +1,97 @@
+import os, time, threading, functools
+import streamlit as st
+import diatribe.audio_tools as audio_tools
+from concurrent.futures import Future
+from diatribe.utils import log
+from diatribe.dialogues import Dialogue
+from diatribe.engine import DiatribeEngine, RenderContext
+from diatribe.jobs import PRIORITY_SPECULATIVE, get_job_queue
+from diatribe.audio_providers.audio_provider import Location
+
+SPECULATE_AFTER_SECONDS = float(os.getenv("DIATRIBE_SPECULATE_AFTER_SECONDS", "3"))
+# characters a session may pre-generate with a hosted provider, which is paid by the character
+SPECULATION_BUDGET_CHARS = int(os.getenv("DIATRIBE_SPECULATION_BUDGET_CHARS", "2000"))
+
+
+class Speculator:
+  """Pre-generates the dialogue rows that stopped changing while the dialogue is edited.
+
+  A row is known by the audio it would produce, so it counts as stable once its synthesis
+  key has been in the table for a few seconds. Its audio only goes into the synthesis cache,
+  which turns generating the dialogue afterwards into mostly cache hits.
+  """
+  def __init__(self, budget_chars: int = SPECULATION_BUDGET_CHARS) -> None:
+    self.budget_chars = budget_chars
+    self.spent_chars = 0
+    self.generated = 0
+    self._lock = threading.Lock()
+    self._seen: dict[str, float] = {}
+    self._lines: dict[str, Dialogue] = {}
+    self._futures: dict[str, Future] = {}
+    self._engine: DiatribeEngine | None = None
+    self._context: RenderContext | None = None
+
+  def observe(self, engine: DiatribeEngine, context: RenderContext, dialogue: list[Dialogue]) -> None:
+    """Record the rows currently in the table."""
+    options = engine.options(context)
+    now = time.monotonic()
+    self._lines = {
+      audio_tools.synthesis_key(engine.provider, line.text, line.character.voice_id, options, line.get_guidance()): line
+      for line in dialogue
+      if line.character.voice_id is not None and line.text
+    }
+    self._seen = {key: self._seen.get(key, now) for key in self._lines}
+    self._futures = {key: future for key, future in self._futures.items() if key in self._lines or not future.done()}
+    self._engine, self._context = engine, context
+
+  @property
+  def budgeted(self) -> bool:
+    return self._engine is not None and self._engine.provider.location == Location.HOSTED
+
+  def speculate(self) -> int:
+    """Queue the stable rows that have not been pre-generated and return how many were queued."""
+    if self._engine is None:
+      return 0
+    now = time.monotonic()
+    queued = 0
+    for key, line in self._lines.items():
+      if key in self._futures or now - self._seen[key] < SPECULATE_AFTER_SECONDS:
+        continue
+      cost = len(line.text) if self.budgeted else 0
+      with self._lock:
+        if self.spent_chars + cost > self.budget_chars:
+          continue
+        self.spent_chars += cost
+      engine, context = self._engine, self._context
+      future = get_job_queue().call(functools.partial(engine.speculate, context, line), context.workspace, PRIORITY_SPECULATIVE)
+      future.add_done_callback(lambda future, cost=cost: self._settle(future, cost))
+      self._futures[key] = future
+      queued += 1
+    return queued
+
+  def _settle(self, future: Future, cost: int) -> None:
+    """Count a finished line, giving its characters back when nothing was synthesized."""
+    synthesized = False
+    if not future.cancelled():
+      if future.exception() is not None:
+        log(f"pre-generating a line failed: {future.exception()}")
+      else:
+        synthesized = future.result()
+    with self._lock:
+      if synthesized:
+        self.generated += 1
+      else:
+        self.spent_chars -= cost
+
+  def cancel(self) -> None:
+    """Drop the queued rows, e.g. when the dialogue is generated for real."""
+    for future in self._futures.values():
+      future.cancel()
+    self._futures = {key: future for key, future in self._futures.items() if not future.cancelled()}
+
+
+def get_speculator() -> Speculator:
+  """Return the speculator of this session."""
+  if "speculator" not in st.session_state:
+    st.session_state["speculator"] = Speculator()
+  return st.session_state["speculator"]
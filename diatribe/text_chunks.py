@@ -0,0 +1,54 @@
+import os, re
+
+# lines longer than this are synthesized in chunks by the providers that need it
+CHUNK_CHARS = int(os.getenv("DIATRIBE_CHUNK_CHARS", "200"))
+CHUNK_CROSSFADE_MS = int(os.getenv("DIATRIBE_CHUNK_CROSSFADE_MS", "40"))
+
+# sentence ends, keeping the punctuation with its sentence
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|(?<=[.!?…][\"')\]])\s+")
+# softer breaks for sentences that are too long on their own
+CLAUSE_END = re.compile(r"(?<=[,;:—])\s+")
+
+
+def _split_long(sentence: str, max_chars: int) -> list[str]:
+  if len(sentence) <= max_chars:
+    return [sentence]
+  parts = []
+  current = ""
+  for piece in CLAUSE_END.split(sentence):
+    for word in piece.split(" ") if len(piece) > max_chars else [piece]:
+      if current and len(current) + 1 + len(word) > max_chars:
+        parts.append(current)
+        current = word
+      else:
+        current = f"{current} {word}" if current else word
+  if current:
+    parts.append(current)
+  return parts
+
+
+def chunk_text(text: str, max_chars: int) -> list[str]:
+  """Split a line at sentence boundaries into chunks of at most `max_chars`.
+
+  Sentences are packed together up to the limit, so short sentences are not synthesized alone.
+  """
+  text = text.strip()
+  if len(text) <= max_chars:
+    return [text]
+  sentences = []
+  for sentence in SENTENCE_END.split(text):
+    sentence = sentence.strip()
+    if sentence:
+      sentences.extend(_split_long(sentence, max_chars))
+
+  chunks = []
+  current = ""
+  for sentence in sentences:
+    if current and len(current) + 1 + len(sentence) > max_chars:
+      chunks.append(current)
+      current = sentence
+    else:
+      current = f"{current} {sentence}" if current else sentence
+  if current:
+    chunks.append(current)
+  return chunks
@@ -1,7 +1,7 @@
-import re, logging, os
+import re, logging, os, functools
 import pandas as pd
 import numpy as np
-import streamlit as st
+from diatribe.lazy_streamlit import st
     
 def extract_name(s: str) -> str:
   """Extract the voice name from the voice name with (cloned) suffix."""
@@ -14,7 +14,7 @@ def start_index_at_one(df: pd.DataFrame) -> None:
   """Start the index of a dataframe at 1."""
   df.index = np.arange(1, len(df) + 1)
   
-@st.cache_data
+@functools.cache
 def get_logger():
   log_level = logging.INFO
   logger = logging.getLogger(__name__)
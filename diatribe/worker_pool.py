@@ -0,0 +1,99 @@
+import os, threading, multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from diatribe.utils import log
+from diatribe.audio_providers.audio_provider import AudioProvider
+from diatribe.workspace import use_workspace
+
+WORKER_COUNT = int(os.getenv("DIATRIBE_WORKERS", "1"))
+
+_provider: AudioProvider | None = None
+_pools: dict[str, "WorkerPool"] = {}
+_pools_lock = threading.Lock()
+
+
+def threads_per_worker(workers: int) -> int:
+  """Split the cores evenly so the workers do not oversubscribe the CPU."""
+  return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def limit_threads(threads: int) -> None:
+  """Limit the math libraries of this process to the given number of threads."""
+  # the math libraries read these when they are first imported
+  for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "DIATRIBE_ONNX_THREADS"):
+    os.environ[name] = str(threads)
+  import torch
+  torch.set_num_threads(threads)
+  try:
+    torch.set_num_interop_threads(1)
+  except RuntimeError:
+    pass
+
+
+def _init_worker(provider_name: str, threads: int) -> None:
+  limit_threads(threads)
+  from diatribe.audio_providers.registry import find_audio_provider
+  global _provider
+  _provider = find_audio_provider(provider_name)
+  _provider.load_model()
+  log(f"worker {os.getpid()} loaded {provider_name} with {threads} threads")
+
+
+def _synthesize(
+  workspace: str,
+  text: str,
+  voice_id: str,
+  line: int,
+  options: dict,
+  guidance: str | None
+) -> str:
+  with use_workspace(workspace):
+    return _provider.generate_and_save(text, voice_id, line, options, guidance=guidance)
+
+
+class WorkerPool:
+  """Worker processes that each keep a resident model of one local provider.
+
+  Lines are spread across the workers and every worker writes its audio straight into
+  the workspace. Looking up and committing the audio stays with the caller, so the
+  version history and blob store only have one writer.
+  """
+  def __init__(self, provider_name: str, workers: int = WORKER_COUNT) -> None:
+    self.provider_name = provider_name
+    self.workers = workers
+    self.threads = threads_per_worker(workers)
+    self._executor = ProcessPoolExecutor(
+      max_workers=workers,
+      mp_context=multiprocessing.get_context("spawn"),
+      initializer=_init_worker,
+      initargs=(provider_name, self.threads)
+    )
+    log(f"started {workers} {provider_name} workers with {self.threads} threads each")
+
+  def submit(
+    self,
+    workspace: str,
+    text: str,
+    voice_id: str,
+    line: int,
+    options: dict,
+    guidance: str | None = None
+  ) -> Future:
+    """Synthesize a line on the next free worker, the future resolves to the audio path."""
+    return self._executor.submit(_synthesize, workspace, text, voice_id, line, options, guidance)
+
+  def shutdown(self) -> None:
+    self._executor.shutdown(cancel_futures=True)
+
+
+def get_worker_pool(provider: AudioProvider, workers: int = WORKER_COUNT) -> WorkerPool | None:
+  """Return the shared pool of a provider that benefits from one, or None to synthesize in process."""
+  if workers <= 1 or not provider.parallel_safe:
+    return None
+  with _pools_lock:
+    pool = _pools.get(provider.name)
+    if pool is None or pool.workers != workers:
+      if pool is not None:
+        pool.shutdown()
+      pool = WorkerPool(provider.name, workers)
+      _pools[provider.name] = pool
+    return pool
@@ -0,0 +1,41 @@
+import contextvars
+from contextlib import contextmanager
+from diatribe.lazy_streamlit import st
+
+SESSION_ROOT = "./session"
+
+_workspace: contextvars.ContextVar[str | None] = contextvars.ContextVar("workspace", default=None)
+
+
+def workspace_path(session_id: str) -> str:
+  """Return the workspace directory of a session."""
+  return f"{SESSION_ROOT}/{session_id}"
+
+
+def current_workspace() -> str:
+  """Return the directory being worked on, falling back to the Streamlit session."""
+  workspace = _workspace.get()
+  if workspace is None:
+    return workspace_path(st.session_state.session_id)
+  return workspace
+
+
+def session_path(relative: str = "") -> str:
+  """Return a path inside the current workspace."""
+  path = current_workspace()
+  return f"{path}/{relative}" if relative else path
+
+
+@contextmanager
+def use_workspace(workspace: str):
+  """Work in the given directory from code running outside the Streamlit script thread."""
+  token = _workspace.set(workspace)
+  try:
+    yield
+  finally:
+    _workspace.reset(token)
+
+
+def use_session(session_id: str):
+  """Work on the given session from code running outside the Streamlit script thread."""
+  return use_workspace(workspace_path(session_id))
@@ -1,6 +1,8 @@
 import streamlit as st
 from diatribe.sidebar import select_audio_provider
 from diatribe.audio_providers.audio_provider import Location
+from diatribe.jobs import get_job_queue
+from diatribe.workspace import workspace_path
 
 st.title("🎧 Diatribe Playground")
 st.text("Session: " + st.session_state.session_id)
@@ -48,13 +50,17 @@ if audio_provider:
                     else:
                         audio_provider_options = {"test": True}
                     try:
-                        audio_file = audio_provider.generate_and_save(
-                            text_to_speak, 
-                            voice_id, 
-                            line=0, 
-                            options=audio_provider_options,
-                            guidance=instructions
-                        )
+                        # runs on the generation worker, ahead of any dialogue it is generating
+                        audio_file = get_job_queue().call(
+                            lambda: audio_provider.generate_and_save(
+                                text_to_speak, 
+                                voice_id, 
+                                line=0, 
+                                options=audio_provider_options,
+                                guidance=instructions
+                            ),
+                            workspace_path(st.session_state.session_id)
+                        ).result()
                     except Exception as e:
                         st.toast(f"Error generating audio: {e}", icon="👎")
 
@@ -0,0 +1,30 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+import diatribe.engine as engine_module
+from diatribe.engine import DiatribeEngine, RenderContext, SynthesisRequest
+
+
+class FailingPool:
+  """Synthesizes every line at once, except that handing over the line "bad" fails."""
+  workers = 2
+
+  def submit(self, workspace, text, voice_id, line, options, guidance):
+    if text == "bad":
+      raise RuntimeError("worker pool is broken")
+    future = Future()
+    future.set_result(f"{workspace}/audio/line{line}.wav")
+    return future
+
+
+def test_a_failed_submit_fails_only_its_line(monkeypatch, tmp_path):
+  monkeypatch.setattr(engine_module.audio_tools, "store_line_audio", lambda provider, text, voice_id, options, audio_file, guidance: audio_file)
+  provider = SimpleNamespace(chunk_chars=None, default_options=lambda: {})
+  engine = DiatribeEngine(provider, FailingPool())
+  context = RenderContext(str(tmp_path), reuse=False)
+  requests = [SynthesisRequest("good", "voice", 1), SynthesisRequest("bad", "voice", 2), SynthesisRequest("fine", "voice", 3)]
+
+  results = {request.line: result for request, result in engine.synthesize_each(context, requests)}
+
+  assert results[1] == f"{tmp_path}/audio/line1.wav"
+  assert isinstance(results[2], RuntimeError)
+  assert results[3] == f"{tmp_path}/audio/line3.wav"
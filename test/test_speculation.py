@@ -0,0 +1,52 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+import diatribe.speculation as speculation
+from diatribe.audio_providers.audio_provider import Location
+
+
+class DeferredQueue:
+  """Runs the queued calls only when asked, like the generation worker picking them up later."""
+  def __init__(self) -> None:
+    self.calls = []
+
+  def call(self, fn, workspace, priority):
+    future = Future()
+    self.calls.append((fn, future))
+    return future
+
+  def run(self) -> None:
+    for fn, future in self.calls:
+      future.set_result(fn())
+
+
+class FakeEngine:
+  def __init__(self) -> None:
+    self.provider = SimpleNamespace(location=Location.LOCAL)
+    self.synthesized = []
+
+  def options(self, context):
+    return {}
+
+  def speculate(self, context, line) -> bool:
+    self.synthesized.append(line.text)
+    return True
+
+
+def dialogue_line(line: int, text: str):
+  return SimpleNamespace(line=line, text=text, character=SimpleNamespace(voice_id="voice"), get_guidance=lambda: None)
+
+
+def test_every_stable_row_is_speculated(monkeypatch):
+  queue = DeferredQueue()
+  monkeypatch.setattr(speculation, "get_job_queue", lambda: queue)
+  monkeypatch.setattr(speculation, "SPECULATE_AFTER_SECONDS", 0)
+  monkeypatch.setattr(speculation.audio_tools, "synthesis_key", lambda provider, text, voice_id, options, guidance: text)
+  engine = FakeEngine()
+  speculator = speculation.Speculator()
+  speculator.observe(engine, SimpleNamespace(workspace="session"), [dialogue_line(1, "a"), dialogue_line(2, "b"), dialogue_line(3, "c")])
+
+  assert speculator.speculate() == 3
+  queue.run()
+
+  assert sorted(engine.synthesized) == ["a", "b", "c"]
+  assert speculator.generated == 3